@@ -0,0 +1,37 @@
+"""Job stage timing
+
+Revision ID: 2368b9820382
+Revises: b326a3663939
+Create Date: 2026-10-19 09:02:11.518904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2368b9820382'
+down_revision = 'b326a3663939'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_stage',
+                    sa.Column('stage_id', sa.Integer(), nullable=False),
+                    sa.Column('job_id', sa.Integer(), nullable=True),
+                    sa.Column('stage', sa.String(length=32), nullable=True),
+                    sa.Column('detail', sa.String(length=256), nullable=True),
+                    sa.Column('status', sa.String(length=32), nullable=True),
+                    sa.Column('start_time', sa.DateTime(), nullable=True),
+                    sa.Column('stop_time', sa.DateTime(), nullable=True),
+                    sa.Column('duration', sa.Float(), nullable=True),
+                    sa.ForeignKeyConstraint(['job_id'], ['job.job_id'], ),
+                    sa.PrimaryKeyConstraint('stage_id')
+                    )
+    op.create_index('ix_job_stage_job_id', 'job_stage', ['job_id'])
+
+
+def downgrade():
+    op.drop_index('ix_job_stage_job_id', table_name='job_stage')
+    op.drop_table('job_stage')
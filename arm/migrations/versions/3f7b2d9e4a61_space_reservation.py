@@ -0,0 +1,44 @@
+"""Disk space reserved by job stages
+
+Revision ID: 3f7b2d9e4a61
+Revises: 8c4a1e6f2b90
+Create Date: 2026-10-19 19:12:48.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f7b2d9e4a61'
+down_revision = '8c4a1e6f2b90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('space_reservation',
+                    sa.Column('reservation_id', sa.Integer(), nullable=False),
+                    sa.Column('job_id', sa.Integer(), nullable=True),
+                    sa.Column('stage', sa.String(length=16), nullable=True),
+                    sa.Column('basis', sa.String(length=256), nullable=True),
+                    sa.Column('device', sa.String(length=32), nullable=True),
+                    sa.Column('path', sa.Text(), nullable=True),
+                    sa.Column('content', sa.Float(), nullable=True),
+                    sa.Column('estimate', sa.BigInteger(), nullable=True),
+                    sa.Column('used', sa.BigInteger(), nullable=True),
+                    sa.Column('status', sa.String(length=16), nullable=True),
+                    sa.Column('requested', sa.DateTime(), nullable=True),
+                    sa.Column('started', sa.DateTime(), nullable=True),
+                    sa.Column('released', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['job_id'], ['job.job_id'], ),
+                    sa.PrimaryKeyConstraint('reservation_id')
+                    )
+    op.create_index('ix_space_reservation_job_id', 'space_reservation', ['job_id'], unique=False)
+    op.create_index('ix_space_reservation_stage_basis', 'space_reservation', ['stage', 'basis'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_space_reservation_stage_basis', table_name='space_reservation')
+    op.drop_index('ix_space_reservation_job_id', table_name='space_reservation')
+    op.drop_table('space_reservation')
@@ -0,0 +1,44 @@
+"""Queue of notifications waiting to be delivered
+
+Revision ID: 5b8e0d2f7c13
+Revises: e27f5c1a9d04
+Create Date: 2026-10-19 15:02:11.406521
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e0d2f7c13'
+down_revision = 'e27f5c1a9d04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_queue',
+                    sa.Column('queue_id', sa.Integer(), nullable=False),
+                    sa.Column('job_id', sa.Integer(), nullable=True),
+                    sa.Column('target', sa.String(length=64), nullable=True),
+                    sa.Column('title', sa.String(length=256), nullable=True),
+                    sa.Column('body', sa.Text(), nullable=True),
+                    sa.Column('status', sa.String(length=16), nullable=True),
+                    sa.Column('attempts', sa.Integer(), nullable=True),
+                    sa.Column('created', sa.DateTime(), nullable=True),
+                    sa.Column('next_attempt', sa.DateTime(), nullable=True),
+                    sa.Column('claimed', sa.DateTime(), nullable=True),
+                    sa.Column('sent', sa.DateTime(), nullable=True),
+                    sa.Column('last_error', sa.Text(), nullable=True),
+                    sa.ForeignKeyConstraint(['job_id'], ['job.job_id'], ),
+                    sa.PrimaryKeyConstraint('queue_id')
+                    )
+    op.create_index('ix_notification_queue_job_id', 'notification_queue', ['job_id'], unique=False)
+    op.create_index('ix_notification_queue_status_next_attempt', 'notification_queue',
+                    ['status', 'next_attempt'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_notification_queue_status_next_attempt', table_name='notification_queue')
+    op.drop_index('ix_notification_queue_job_id', table_name='notification_queue')
+    op.drop_table('notification_queue')
@@ -0,0 +1,33 @@
+"""Track jobs sent to the remote crc64 database
+
+Revision ID: 5e9b2d7f40a6
+Revises: c4f1e8a0d317
+Create Date: 2026-10-19 11:48:05.310472
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e9b2d7f40a6'
+down_revision = 'c4f1e8a0d317'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_remote_sync',
+                    sa.Column('job_id', sa.Integer(), nullable=False),
+                    sa.Column('sent_key', sa.String(length=600), nullable=True),
+                    sa.Column('status', sa.String(length=16), nullable=True),
+                    sa.Column('error', sa.String(length=256), nullable=True),
+                    sa.Column('attempts', sa.Integer(), nullable=True),
+                    sa.Column('sent_time', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['job_id'], ['job.job_id'], ),
+                    sa.PrimaryKeyConstraint('job_id')
+                    )
+
+
+def downgrade():
+    op.drop_table('job_remote_sync')
@@ -0,0 +1,35 @@
+"""Metadata response cache
+
+Revision ID: 7a1c4e9d2b55
+Revises: 2368b9820382
+Create Date: 2026-10-19 10:12:40.207136
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a1c4e9d2b55'
+down_revision = '2368b9820382'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('metadata_cache',
+                    sa.Column('cache_id', sa.Integer(), nullable=False),
+                    sa.Column('provider', sa.String(length=16), nullable=True),
+                    sa.Column('endpoint', sa.String(length=32), nullable=True),
+                    sa.Column('query_key', sa.String(length=512), nullable=True),
+                    sa.Column('response', sa.Text(), nullable=True),
+                    sa.Column('found', sa.Boolean(), nullable=True),
+                    sa.Column('created', sa.DateTime(), nullable=True),
+                    sa.Column('expires', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('cache_id'),
+                    sa.UniqueConstraint('provider', 'endpoint', 'query_key', name='uq_metadata_cache_query')
+                    )
+
+
+def downgrade():
+    op.drop_table('metadata_cache')
@@ -0,0 +1,40 @@
+"""Disk I/O held or waited for by job stages
+
+Revision ID: 8c4a1e6f2b90
+Revises: 5b8e0d2f7c13
+Create Date: 2026-10-19 17:40:26.118034
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4a1e6f2b90'
+down_revision = '5b8e0d2f7c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('io_allocation',
+                    sa.Column('allocation_id', sa.Integer(), nullable=False),
+                    sa.Column('job_id', sa.Integer(), nullable=True),
+                    sa.Column('stage', sa.String(length=16), nullable=True),
+                    sa.Column('devices', sa.String(length=256), nullable=True),
+                    sa.Column('reads', sa.Text(), nullable=True),
+                    sa.Column('writes', sa.Text(), nullable=True),
+                    sa.Column('mbps', sa.Integer(), nullable=True),
+                    sa.Column('status', sa.String(length=16), nullable=True),
+                    sa.Column('pid', sa.Integer(), nullable=True),
+                    sa.Column('requested', sa.DateTime(), nullable=True),
+                    sa.Column('started', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['job_id'], ['job.job_id'], ),
+                    sa.PrimaryKeyConstraint('allocation_id')
+                    )
+    op.create_index('ix_io_allocation_job_id', 'io_allocation', ['job_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_io_allocation_job_id', table_name='io_allocation')
+    op.drop_table('io_allocation')
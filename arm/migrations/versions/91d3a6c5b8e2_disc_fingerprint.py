@@ -0,0 +1,36 @@
+"""Disc fingerprint index
+
+Revision ID: 91d3a6c5b8e2
+Revises: 5e9b2d7f40a6
+Create Date: 2026-10-19 12:31:44.092618
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '91d3a6c5b8e2'
+down_revision = '5e9b2d7f40a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('disc_fingerprint',
+                    sa.Column('fingerprint_id', sa.Integer(), nullable=False),
+                    sa.Column('kind', sa.String(length=16), nullable=True),
+                    sa.Column('value', sa.String(length=128), nullable=True),
+                    sa.Column('job_id', sa.Integer(), nullable=True),
+                    sa.Column('created', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['job_id'], ['job.job_id'], ),
+                    sa.PrimaryKeyConstraint('fingerprint_id')
+                    )
+    op.create_index('ix_disc_fingerprint_job_id', 'disc_fingerprint', ['job_id'])
+    op.create_index('ix_disc_fingerprint_kind_value', 'disc_fingerprint', ['kind', 'value'])
+
+
+def downgrade():
+    op.drop_index('ix_disc_fingerprint_kind_value', table_name='disc_fingerprint')
+    op.drop_index('ix_disc_fingerprint_job_id', table_name='disc_fingerprint')
+    op.drop_table('disc_fingerprint')
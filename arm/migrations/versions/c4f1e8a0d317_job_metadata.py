@@ -0,0 +1,35 @@
+"""Job metadata details
+
+Revision ID: c4f1e8a0d317
+Revises: 7a1c4e9d2b55
+Create Date: 2026-10-19 11:03:27.581940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f1e8a0d317'
+down_revision = '7a1c4e9d2b55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_metadata',
+                    sa.Column('job_id', sa.Integer(), nullable=False),
+                    sa.Column('lookup_key', sa.String(length=300), nullable=True),
+                    sa.Column('status', sa.String(length=16), nullable=True),
+                    sa.Column('plot', sa.Text(), nullable=True),
+                    sa.Column('background_url', sa.String(length=256), nullable=True),
+                    sa.Column('ratings', sa.Text(), nullable=True),
+                    sa.Column('details', sa.Text(), nullable=True),
+                    sa.Column('updated', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['job_id'], ['job.job_id'], ),
+                    sa.PrimaryKeyConstraint('job_id')
+                    )
+
+
+def downgrade():
+    op.drop_table('job_metadata')
@@ -0,0 +1,33 @@
+"""Local poster cache
+
+Revision ID: e27f5c1a9d04
+Revises: 91d3a6c5b8e2
+Create Date: 2026-10-19 13:15:52.774310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e27f5c1a9d04'
+down_revision = '91d3a6c5b8e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('poster_cache',
+                    sa.Column('cache_id', sa.Integer(), nullable=False),
+                    sa.Column('url_hash', sa.String(length=64), nullable=True),
+                    sa.Column('url', sa.Text(), nullable=True),
+                    sa.Column('content_hash', sa.String(length=64), nullable=True),
+                    sa.Column('status', sa.String(length=16), nullable=True),
+                    sa.Column('created', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('cache_id'),
+                    sa.UniqueConstraint('url_hash')
+                    )
+
+
+def downgrade():
+    op.drop_table('poster_cache')
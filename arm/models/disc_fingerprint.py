@@ -0,0 +1,37 @@
+import datetime
+
+from arm.ui import db
+
+
+class DiscFingerprint(db.Model):
+    """
+    Fingerprints of the discs each job ripped, used to recognise a disc that has been seen before
+    kind is one of crc64 (dvd), bluray (content hash), musicbrainz (disc id) or layout (label + file layout)
+    """
+    fingerprint_id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16))
+    value = db.Column(db.String(128))
+    job_id = db.Column(db.Integer, db.ForeignKey('job.job_id'), index=True)
+    created = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ix_disc_fingerprint_kind_value', 'kind', 'value'),)
+
+    def __init__(self, job_id, kind, value):
+        self.job_id = job_id
+        self.kind = kind
+        self.value = value
+        self.created = datetime.datetime.now()
+
+    def __repr__(self):
+        return f'<DiscFingerprint {self.kind} {self.value}>'
+
+    def __str__(self):
+        """Returns a string of the object"""
+        return self.__class__.__name__ + ": " + str(self.kind) + " " + str(self.value)
+
+    def get_d(self):
+        """ Returns a dict of the object"""
+        return_dict = {}
+        for key, value in self.__dict__.items():
+            if '_sa_instance_state' not in key:
+                return_dict[str(key)] = str(value)
+        return return_dict
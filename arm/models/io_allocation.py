@@ -0,0 +1,53 @@
+import datetime
+
+from arm.ui import db
+
+
+class IoAllocation(db.Model):
+    """
+    A job stage (rip, transcode, finalize) holding or waiting for its share of the disks it uses
+    devices is a comma separated list of the major:minor of every filesystem it reads or writes
+    """
+    __tablename__ = 'io_allocation'
+
+    allocation_id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job.job_id'), index=True)
+    stage = db.Column(db.String(16))
+    devices = db.Column(db.String(256))
+    reads = db.Column(db.Text)
+    writes = db.Column(db.Text)
+    mbps = db.Column(db.Integer, default=0)
+    status = db.Column(db.String(16))
+    pid = db.Column(db.Integer)
+    requested = db.Column(db.DateTime)
+    started = db.Column(db.DateTime)
+
+    def __init__(self, job_id, stage, devices, reads, writes, mbps, pid):
+        self.job_id = job_id
+        self.stage = stage
+        self.devices = ",".join(devices)
+        self.reads = ",".join(reads)
+        self.writes = ",".join(writes)
+        self.mbps = mbps
+        self.status = "waiting"
+        self.pid = pid
+        self.requested = datetime.datetime.now()
+
+    def device_list(self):
+        """The devices as a list"""
+        return self.devices.split(",") if self.devices else []
+
+    def __repr__(self):
+        return f'<IoAllocation {self.allocation_id} {self.stage} {self.status}>'
+
+    def __str__(self):
+        """Returns a string of the object"""
+        return self.__class__.__name__ + ": " + str(self.stage) + " " + str(self.status)
+
+    def get_d(self):
+        """ Returns a dict of the object"""
+        return_dict = {}
+        for key, value in self.__dict__.items():
+            if '_sa_instance_state' not in key:
+                return_dict[str(key)] = str(value)
+        return return_dict
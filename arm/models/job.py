@@ -6,13 +6,16 @@ import subprocess
 import time
 
 from prettytable import PrettyTable
-from arm.ripper import music_brainz
+from arm.ripper import drive_state, music_brainz
 from arm.ui import db
 import arm.config.config as cfg
 
 # THESE IMPORTS ARE REQUIRED FOR THE db.Relationships to work
 from arm.models.track import Track  # noqa: F401
 from arm.models.config import Config  # noqa: F401
+from arm.models.job_stage import JobStage  # noqa: F401
+from arm.models.job_metadata import JobMetadata  # noqa: F401
+from arm.models.disc_fingerprint import DiscFingerprint  # noqa: F401
 
 
 class Job(db.Model):
@@ -59,6 +62,9 @@ class Job(db.Model):
     is_iso = db.Column(db.Boolean)
     tracks = db.relationship('Track', backref='job', lazy='dynamic')
     config = db.relationship('Config', uselist=False, backref="job")
+    stages = db.relationship('JobStage', backref='job', lazy='dynamic')
+    details = db.relationship('JobMetadata', uselist=False, backref="job")
+    fingerprints = db.relationship('DiscFingerprint', backref='job', lazy='dynamic')
 
     def __init__(self, devpath):
         """Return a disc object"""
@@ -94,8 +100,7 @@ class Job(db.Model):
 
     def parse_udev(self):
         """Parse udev for properties of current disc"""
-        context = pyudev.Context()
-        device = pyudev.Devices.from_device_file(context, self.devpath)
+        device = pyudev.Devices.from_device_file(drive_state.get_context(), self.devpath)
         self.disctype = "unknown"
 
         for key, value in device.items():
@@ -0,0 +1,75 @@
+import datetime
+import json
+
+from arm.ui import db
+
+
+class JobMetadata(db.Model):
+    """
+    Holds the details (plot, background, ratings) fetched from the metadata provider for a job
+    so the job page doesn't have to ask OMDb/TMDb every time it's viewed
+    """
+    job_id = db.Column(db.Integer, db.ForeignKey('job.job_id'), primary_key=True)
+    lookup_key = db.Column(db.String(300))
+    status = db.Column(db.String(16))
+    plot = db.Column(db.Text)
+    background_url = db.Column(db.String(256))
+    ratings = db.Column(db.Text)
+    details = db.Column(db.Text)
+    updated = db.Column(db.DateTime)
+
+    def __init__(self, job_id, lookup_key):
+        self.job_id = job_id
+        self.lookup_key = lookup_key
+        self.status = "pending"
+        self.updated = datetime.datetime.now()
+
+    def store(self, lookup_key, search_results):
+        """
+        Save the details returned by metadata_selector("get_details")\n
+        :param str lookup_key: title/year/imdb the details were fetched for
+        :param dict search_results: omdb formatted details or None if nothing was found
+        """
+        self.lookup_key = lookup_key
+        self.updated = datetime.datetime.now()
+        if not search_results or 'Error' in search_results:
+            self.status = "notfound"
+            self.plot = None
+            self.background_url = None
+            self.ratings = None
+            self.details = None
+            return
+        self.status = "found"
+        self.plot = search_results.get('Plot', "There was a problem getting the plot")
+        self.background_url = search_results.get('background_url')
+        self.ratings = json.dumps(search_results.get('Ratings', []))
+        self.details = json.dumps(search_results, default=str)
+
+    def failed(self, lookup_key):
+        """
+        Record a fetch that failed, the details are kept when they're still for the same title\n
+        :param str lookup_key: title/year/imdb the details were fetched for
+        """
+        if lookup_key != self.lookup_key:
+            self.store(lookup_key, None)
+        self.status = "failed"
+        self.updated = datetime.datetime.now()
+
+    def get_ratings(self):
+        """Returns the list of ratings (omdb only)"""
+        return json.loads(self.ratings) if self.ratings else []
+
+    def __repr__(self):
+        return f'<JobMetadata {self.job_id} {self.status}>'
+
+    def __str__(self):
+        """Returns a string of the object"""
+        return self.__class__.__name__ + ": " + str(self.job_id) + " " + str(self.status)
+
+    def get_d(self):
+        """ Returns a dict of the object"""
+        return_dict = {}
+        for key, value in self.__dict__.items():
+            if '_sa_instance_state' not in key:
+                return_dict[str(key)] = str(value)
+        return return_dict
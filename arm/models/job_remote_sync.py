@@ -0,0 +1,48 @@
+import datetime
+
+from arm.ui import db
+
+
+class JobRemoteSync(db.Model):
+    """
+    Records which jobs have been sent to the ARM remote crc64 database
+    and what was sent, so a job is only sent again when it changes
+    """
+    job_id = db.Column(db.Integer, db.ForeignKey('job.job_id'), primary_key=True)
+    sent_key = db.Column(db.String(600))
+    status = db.Column(db.String(16))
+    error = db.Column(db.String(256))
+    attempts = db.Column(db.Integer)
+    sent_time = db.Column(db.DateTime)
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.attempts = 0
+
+    def record(self, sent_key, success, error=None):
+        """
+        Save the result of sending the job\n
+        :param str sent_key: the values that were sent
+        :param bool success: True if the api accepted the job
+        :param str error: reason the api or the connection failed
+        """
+        self.sent_key = sent_key
+        self.status = "success" if success else "fail"
+        self.error = str(error)[:256] if error else None
+        self.attempts = (self.attempts or 0) + 1
+        self.sent_time = datetime.datetime.now()
+
+    def __repr__(self):
+        return f'<JobRemoteSync {self.job_id} {self.status}>'
+
+    def __str__(self):
+        """Returns a string of the object"""
+        return self.__class__.__name__ + ": " + str(self.job_id) + " " + str(self.status)
+
+    def get_d(self):
+        """ Returns a dict of the object"""
+        return_dict = {}
+        for key, value in self.__dict__.items():
+            if '_sa_instance_state' not in key:
+                return_dict[str(key)] = str(value)
+        return return_dict
@@ -0,0 +1,51 @@
+import datetime
+
+from arm.ui import db
+
+
+class JobStage(db.Model):
+    """
+    Holds the start and end time of each stage of a job
+    (identify, MakeMKV scan, rip, transcode wait, transcode, move, notify...)
+    """
+    stage_id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job.job_id'), index=True)
+    stage = db.Column(db.String(32))
+    detail = db.Column(db.String(256))
+    status = db.Column(db.String(32))
+    start_time = db.Column(db.DateTime)
+    stop_time = db.Column(db.DateTime)
+    duration = db.Column(db.Float)
+
+    def __init__(self, job_id, stage, detail=None):
+        self.job_id = job_id
+        self.stage = stage
+        self.detail = detail
+        self.status = "running"
+        self.start_time = datetime.datetime.now()
+
+    def __repr__(self):
+        return f'<JobStage {self.job_id} {self.stage}>'
+
+    def __str__(self):
+        """Returns a string of the object"""
+        return self.__class__.__name__ + ": " + str(self.stage)
+
+    def elapsed(self):
+        """
+        Seconds spent in this stage, stages still running are measured up to now
+        :return: float seconds
+        """
+        if self.duration is not None:
+            return self.duration
+        if self.start_time is None:
+            return 0.0
+        return (datetime.datetime.now() - self.start_time).total_seconds()
+
+    def get_d(self):
+        """ Returns a dict of the object"""
+        return_dict = {}
+        for key, value in self.__dict__.items():
+            if '_sa_instance_state' not in key:
+                return_dict[str(key)] = str(value)
+        return return_dict
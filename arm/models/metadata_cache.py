@@ -0,0 +1,52 @@
+import datetime
+
+from arm.ui import db
+
+
+class MetadataCache(db.Model):
+    """
+    Holds responses from the metadata providers (OMDb, TMDb, ARM crc64 api)
+    so the same query isn't sent again until it expires
+    """
+    cache_id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(16))
+    endpoint = db.Column(db.String(32))
+    query_key = db.Column(db.String(512))
+    response = db.Column(db.Text)
+    found = db.Column(db.Boolean)
+    created = db.Column(db.DateTime)
+    expires = db.Column(db.DateTime)
+    __table_args__ = (db.UniqueConstraint('provider', 'endpoint', 'query_key', name='uq_metadata_cache_query'),)
+
+    def __init__(self, provider, endpoint, query_key, response, found, ttl):
+        self.provider = provider
+        self.endpoint = endpoint
+        self.query_key = query_key
+        self.refresh(response, found, ttl)
+
+    def refresh(self, response, found, ttl):
+        """
+        Store a new response for this query\n
+        :param str response: raw response body
+        :param bool found: False if the provider had no results (negative cache entry)
+        :param int ttl: hours until the entry expires
+        """
+        self.response = response
+        self.found = found
+        self.created = datetime.datetime.now()
+        self.expires = self.created + datetime.timedelta(hours=ttl)
+
+    def __repr__(self):
+        return f'<MetadataCache {self.provider} {self.endpoint} {self.query_key}>'
+
+    def __str__(self):
+        """Returns a string of the object"""
+        return self.__class__.__name__ + ": " + str(self.provider) + " " + str(self.query_key)
+
+    def get_d(self):
+        """ Returns a dict of the object"""
+        return_dict = {}
+        for key, value in self.__dict__.items():
+            if '_sa_instance_state' not in key:
+                return_dict[str(key)] = str(value)
+        return return_dict
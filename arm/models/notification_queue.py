@@ -0,0 +1,50 @@
+import datetime
+
+from arm.ui import db
+
+
+class NotificationQueue(db.Model):
+    """
+    A notification waiting to be delivered to one target (bash script, apprise service)
+    The target is the name of its setting, never the url, so no keys are kept here
+    """
+    __tablename__ = 'notification_queue'
+    __table_args__ = (db.Index('ix_notification_queue_status_next_attempt', 'status', 'next_attempt'),)
+
+    queue_id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job.job_id'), index=True)
+    target = db.Column(db.String(64))
+    title = db.Column(db.String(256))
+    body = db.Column(db.Text)
+    status = db.Column(db.String(16))
+    attempts = db.Column(db.Integer, default=0)
+    created = db.Column(db.DateTime)
+    next_attempt = db.Column(db.DateTime)
+    claimed = db.Column(db.DateTime)
+    sent = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    def __init__(self, job_id, target, title, body, next_attempt=None):
+        self.job_id = job_id
+        self.target = target
+        self.title = title
+        self.body = body
+        self.status = "pending"
+        self.attempts = 0
+        self.created = datetime.datetime.now()
+        self.next_attempt = next_attempt or self.created
+
+    def __repr__(self):
+        return f'<NotificationQueue {self.queue_id} {self.target} {self.status}>'
+
+    def __str__(self):
+        """Returns a string of the object"""
+        return self.__class__.__name__ + ": " + str(self.target) + " " + str(self.status)
+
+    def get_d(self):
+        """ Returns a dict of the object"""
+        return_dict = {}
+        for key, value in self.__dict__.items():
+            if '_sa_instance_state' not in key:
+                return_dict[str(key)] = str(value)
+        return return_dict
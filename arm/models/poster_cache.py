@@ -0,0 +1,38 @@
+import datetime
+
+from arm.ui import db
+
+
+class PosterCache(db.Model):
+    """
+    Maps a remote poster/cover art url to the local copy of the image
+    The images are stored by the hash of their content, so the same image from two urls is kept once
+    """
+    cache_id = db.Column(db.Integer, primary_key=True)
+    url_hash = db.Column(db.String(64), unique=True)
+    url = db.Column(db.Text)
+    content_hash = db.Column(db.String(64))
+    status = db.Column(db.String(16))
+    created = db.Column(db.DateTime)
+
+    def __init__(self, url_hash, url, content_hash, status):
+        self.url_hash = url_hash
+        self.url = url
+        self.content_hash = content_hash
+        self.status = status
+        self.created = datetime.datetime.now()
+
+    def __repr__(self):
+        return f'<PosterCache {self.url} {self.status}>'
+
+    def __str__(self):
+        """Returns a string of the object"""
+        return self.__class__.__name__ + ": " + str(self.url) + " " + str(self.status)
+
+    def get_d(self):
+        """ Returns a dict of the object"""
+        return_dict = {}
+        for key, value in self.__dict__.items():
+            if '_sa_instance_state' not in key:
+                return_dict[str(key)] = str(value)
+        return return_dict
@@ -0,0 +1,52 @@
+import datetime
+
+from arm.ui import db
+
+
+class SpaceReservation(db.Model):
+    """
+    Disk space a job stage (rip, transcode, finalize) holds or waits for on the filesystem of path
+    Once the stage is done used is what it really wrote, released rows are the history estimates come from
+    """
+    __tablename__ = 'space_reservation'
+    __table_args__ = (db.Index('ix_space_reservation_stage_basis', 'stage', 'basis'),)
+
+    reservation_id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job.job_id'), index=True)
+    stage = db.Column(db.String(16))
+    basis = db.Column(db.String(256))
+    device = db.Column(db.String(32))
+    path = db.Column(db.Text)
+    content = db.Column(db.Float)
+    estimate = db.Column(db.BigInteger)
+    used = db.Column(db.BigInteger)
+    status = db.Column(db.String(16))
+    requested = db.Column(db.DateTime)
+    started = db.Column(db.DateTime)
+    released = db.Column(db.DateTime)
+
+    def __init__(self, job_id, stage, basis, device, path, content, estimate):
+        self.job_id = job_id
+        self.stage = stage
+        self.basis = basis
+        self.device = device
+        self.path = path
+        self.content = content
+        self.estimate = estimate
+        self.status = "waiting"
+        self.requested = datetime.datetime.now()
+
+    def __repr__(self):
+        return f'<SpaceReservation {self.reservation_id} {self.stage} {self.status}>'
+
+    def __str__(self):
+        """Returns a string of the object"""
+        return self.__class__.__name__ + ": " + str(self.stage) + " " + str(self.status)
+
+    def get_d(self):
+        """ Returns a dict of the object"""
+        return_dict = {}
+        for key, value in self.__dict__.items():
+            if '_sa_instance_state' not in key:
+                return_dict[str(key)] = str(value)
+        return return_dict
@@ -3,6 +3,7 @@ import os
 
 import pyudev
 
+from arm.ripper import drive_state
 from arm.ui import db
 
 
@@ -34,18 +35,8 @@ class SystemDrives(db.Model):
 
     def drive_type(self):
         """find the Drive type (CD, DVD, Blu-ray) from the udev values"""
-        context = pyudev.Context()
-        device = pyudev.Devices.from_device_file(context, self.mount)
-        temp = ""
-
-        for key, value in device.items():
-            if key == "ID_CDROM" and value:
-                temp += "CD"
-            elif key == "ID_CDROM_DVD" and value:
-                temp += "/DVD"
-            elif key == "ID_CDROM_BD" and value:
-                temp += "/BluRay"
-        self.type = temp
+        device = pyudev.Devices.from_device_file(drive_state.get_context(), self.mount)
+        self.type = drive_state.drive_type(device)
 
     def new_job(self, job_id):
         """new job assigned to the drive, update with new job id, and previous job_id"""
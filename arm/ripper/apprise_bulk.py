@@ -1,7 +1,5 @@
 """File to hold all functions pertaining to apprise"""
-import logging
 import yaml
-import apprise
 
 
 # TODO: Refactor this to leverage apprise_config stored in config.py
@@ -73,73 +71,56 @@ def build_apprise_sent(cfg):
     return apprise_dict
 
 
-def apprise_notify(apprise_cfg, title, body):
+def apprise_targets(apprise_cfg):
     """
-    APPRISE NOTIFICATIONS\n
+    The services set up in apprise.yaml\n
     :param apprise_cfg: The full path to the apprise.yaml file
-    :param title: the message title
-    :param body: the main body of the message
-    :return: None
+    :return: dict of setting name -> apprise url
     """
     with open(apprise_cfg, "r") as yaml_file:
         cfg = yaml.safe_load(yaml_file)
 
-    sent_cfg = build_apprise_sent(cfg)
-    for host, string in sent_cfg.items():
-        try:
-            #  logging.debug(f"trying to send apprise to {host}")
-            if cfg[host] != "":
-                # Create an Apprise instance
-                apobj = apprise.Apprise()
-                apobj.add(string)
-                apobj.notify(body, title=title)
-                logging.debug(f"Sent apprise to {host} was successful")
-        except Exception as error:  # noqa: E722
-            logging.error(f"Failed sending {host} apprise notification.  continuing  processing...{error}")
-
-    ntfy_notify(cfg, title, body)
-
-
-def ntfy_notify(cfg, title, body):
-    # ntfy can require additional processing to make https work.
-    # In addition, there are multiple available valid schemes.
-    if cfg['NTFY_TOPIC'] != "":
-        try:
-            apobj = apprise.Apprise()
-            ntfy_serverstring = 'ntfy://'
-
-            host = cfg['NTFY_URL']
-
-            if host.startswith("https://"):
-                ntfy_serverstring = 'ntfys://'
-                host = host.replace("https://", "")
-
-            if host.startswith("http://"):
-                host = host.replace("http://", "")
-
-            if cfg['NTFY_USER'] != "" and cfg['NTFY_PASS'] != "" and host != "":
-                ntfy_serverstring += cfg['NTFY_USER'] + ':' + cfg['NTFY_PASS'] + '@' + host
-
-            elif cfg['NTFY_USER'] != "" and host != "":
-                ntfy_serverstring += cfg['NTFY_USER'] + '@' + host
-
-            elif host != "":
-                ntfy_serverstring += host
-
-            if host != "" and cfg['NTFY_PORT'] != "":
-                ntfy_serverstring += ':' + cfg['NTFY_PORT'] + '/'
-            else:
-                if ntfy_serverstring != 'ntfy://':
-                    ntfy_serverstring += '/'
-
-            ntfy_serverstring += cfg['NTFY_TOPIC']
-
-            print(ntfy_serverstring)
-            apobj.add(ntfy_serverstring)
-            apobj.notify(
-                body,
-                title=title,
-            )
-            logging.debug("Sent apprise to ntfy was successful")
-        except Exception as error:  # noqa: E722
-            logging.error(f"Failed sending ntfy apprise notification. Continuing  processing...{error}")
+    targets = {host: string for host, string in build_apprise_sent(cfg).items() if cfg.get(host, "") != ""}
+    ntfy_serverstring = ntfy_url(cfg)
+    if ntfy_serverstring:
+        targets['NTFY_TOPIC'] = ntfy_serverstring
+    return targets
+
+
+def ntfy_url(cfg):
+    """
+    ntfy can require additional processing to make https work.
+    In addition, there are multiple available valid schemes.
+    :param cfg: apprise.yaml loaded as dict
+    :return: the ntfy apprise url or None if ntfy isn't set up
+    """
+    if cfg.get('NTFY_TOPIC', "") == "":
+        return None
+    ntfy_serverstring = 'ntfy://'
+
+    host = cfg['NTFY_URL']
+
+    if host.startswith("https://"):
+        ntfy_serverstring = 'ntfys://'
+        host = host.replace("https://", "")
+
+    if host.startswith("http://"):
+        host = host.replace("http://", "")
+
+    if cfg['NTFY_USER'] != "" and cfg['NTFY_PASS'] != "" and host != "":
+        ntfy_serverstring += cfg['NTFY_USER'] + ':' + cfg['NTFY_PASS'] + '@' + host
+
+    elif cfg['NTFY_USER'] != "" and host != "":
+        ntfy_serverstring += cfg['NTFY_USER'] + '@' + host
+
+    elif host != "":
+        ntfy_serverstring += host
+
+    if host != "" and cfg['NTFY_PORT'] != "":
+        ntfy_serverstring += ':' + cfg['NTFY_PORT'] + '/'
+    else:
+        if ntfy_serverstring != 'ntfy://':
+            ntfy_serverstring += '/'
+
+    ntfy_serverstring += cfg['NTFY_TOPIC']
+    return ntfy_serverstring
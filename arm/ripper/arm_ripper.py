@@ -7,7 +7,7 @@ import logging
 
 sys.path.append("/opt/arm")
 
-from arm.ripper import utils, makemkv, handbrake  # noqa E402
+from arm.ripper import utils, makemkv, handbrake, io_scheduler, disk_space  # noqa E402
 from arm.ui import app, db, constants  # noqa E402
 
 
@@ -94,8 +94,7 @@ def rip_visual_media(have_dupes, job, logfile, protection):
     utils.move_movie_poster(final_directory, hb_out_path)
     # Scan Emby if arm.yaml requires it
     utils.scan_emby()
-    # Set permissions if arm.yaml requires it
-    utils.set_permissions(final_directory)
+    # Permissions from arm.yaml were set on each file as it was moved, nothing to walk again here
     # If set in the arm.yaml remove the raw files
     utils.delete_raw_files([hb_in_path, hb_out_path, makemkv_out_path])
     # report errors if any
@@ -117,20 +116,25 @@ def start_transcode(job, logfile, hb_in_path, hb_out_path, protection):
     # Update db with transcoding status
     utils.database_updater({'status': "transcoding"}, job)
     logging.info("************* Starting Transcode With HandBrake *************")
-    if rip_with_mkv(job, protection) and job.config.RIPMETHOD == "mkv":
-        # skip if transcode is disable
-        if job.config.SKIP_TRANSCODE:
-            logging.info("Transcoding is disabled, skipping transcode")
-            return None
-        logging.debug(f"handbrake_mkv: {hb_in_path}, {hb_out_path}, {logfile}")
-        handbrake.handbrake_mkv(hb_in_path, hb_out_path, logfile, job)
-    elif job.video_type == "movie" and job.config.MAINFEATURE and job.hasnicetitle:
-        logging.debug(f"handbrake_main_feature: {hb_in_path}, {hb_out_path}, {logfile}")
-        handbrake.handbrake_main_feature(hb_in_path, hb_out_path, logfile, job)
-        job.eject()
-    else:
-        logging.debug(f"handbrake_all: {hb_in_path}, {hb_out_path}, {logfile}")
-        handbrake.handbrake_all(hb_in_path, hb_out_path, logfile, job)
+    use_make_mkv = rip_with_mkv(job, protection) and job.config.RIPMETHOD == "mkv"
+    # skip if transcode is disable
+    if use_make_mkv and job.config.SKIP_TRANSCODE:
+        logging.info("Transcoding is disabled, skipping transcode")
+        return None
+    # Wait for the transcode queue first, so a queued job doesn't hold disk space or an I/O share
+    handbrake.wait_for_transcode_slot(job)
+    with disk_space.reserve(job, "transcode", hb_out_path, hb_in_path), \
+            io_scheduler.allocation_for(job, "transcode", reads=[hb_in_path], writes=[hb_out_path]):
+        if use_make_mkv:
+            logging.debug(f"handbrake_mkv: {hb_in_path}, {hb_out_path}, {logfile}")
+            handbrake.handbrake_mkv(hb_in_path, hb_out_path, logfile, job)
+        elif job.video_type == "movie" and job.config.MAINFEATURE and job.hasnicetitle:
+            logging.debug(f"handbrake_main_feature: {hb_in_path}, {hb_out_path}, {logfile}")
+            handbrake.handbrake_main_feature(hb_in_path, hb_out_path, logfile, job)
+        else:
+            logging.debug(f"handbrake_all: {hb_in_path}, {hb_out_path}, {logfile}")
+            handbrake.handbrake_all(hb_in_path, hb_out_path, logfile, job)
+    if not use_make_mkv:
         job.eject()
     logging.info("************* Finished Transcode With HandBrake *************")
     utils.database_updater({'status': "active"}, job)
@@ -165,20 +169,24 @@ def move_files_post(hb_out_path, job):
     :return: None
     """
     tracks = job.tracks.filter_by(ripped=True)  # .order_by(job.tracks.length.desc())
-    if job.video_type == "series":
-        for track in tracks:
-            utils.move_files(hb_out_path, track.filename, job, False)
-    else:
-        for track in tracks:
-            if tracks.count() == 1:
-                utils.move_files(hb_out_path, track.filename, job, True)
-            else:
-                # If source is MakeMKV we know the mainfeature will be wrong let skip_transcode_movie handle it
-                if track.source == "MakeMKV":
-                    skip_transcode_movie(os.listdir(hb_out_path), job, hb_out_path)
-                    break
-                # If HandBrake was used we can pass track.main_feature
-                utils.move_files(hb_out_path, track.filename, job, track.main_feature)
+    # The files are moved together once they've all been worked out, when the disks have room for it
+    with disk_space.reserve(job, "finalize", job.path, hb_out_path), \
+            io_scheduler.allocation_for(job, "finalize", reads=[hb_out_path], writes=[job.path]) as limit, \
+            utils.move_batch(job, limit) as batch:
+        if job.video_type == "series":
+            for track in tracks:
+                utils.move_files(hb_out_path, track.filename, job, False, batch)
+        else:
+            for track in tracks:
+                if tracks.count() == 1:
+                    utils.move_files(hb_out_path, track.filename, job, True, batch)
+                else:
+                    # If source is MakeMKV we know the mainfeature will be wrong let skip_transcode_movie handle it
+                    if track.source == "MakeMKV":
+                        skip_transcode_movie(os.listdir(hb_out_path), job, hb_out_path, batch)
+                        break
+                    # If HandBrake was used we can pass track.main_feature
+                    utils.move_files(hb_out_path, track.filename, job, track.main_feature, batch)
 
 
 def rip_with_mkv(current_job, protection=0):
@@ -207,7 +215,7 @@ def rip_with_mkv(current_job, protection=0):
     return mkv_ripped
 
 
-def skip_transcode_movie(files, job, raw_path):
+def skip_transcode_movie(files, job, raw_path, batch=None):
     """
     Only ran if job is a movie - find the largest file use it as mainfeature\n
     Movie everything else to extras folder\n
@@ -215,6 +223,7 @@ def skip_transcode_movie(files, job, raw_path):
     :param files: os.listdir(RAW_PATH)
     :param job: Current job
     :param raw_path: RAW_PATH of ripped mkv files (mkvoutpath)
+    :param batch: utils.move_batch the moves are added to, None moves each file straight away
     :return: None
     """
     logging.debug(f"Videotype: {job.video_type}")
@@ -233,7 +242,7 @@ def skip_transcode_movie(files, job, raw_path):
         # move others into extras folder
         if file == largest_file_name:
             # largest movie
-            utils.move_files(raw_path, file, job, True)
+            utils.move_files(raw_path, file, job, True, batch)
         else:
             # If mainfeature is enabled - skip to the next file
             if job.config.MAINFEATURE:
@@ -241,6 +250,6 @@ def skip_transcode_movie(files, job, raw_path):
                 continue
             # Other/extras
             if str(job.config.EXTRAS_SUB).lower() != "none":
-                utils.move_files(raw_path, file, job, False)
+                utils.move_files(raw_path, file, job, False, batch)
             else:
                 logging.info(f"Not moving extra: \"{file}\" - Sub folder is not set or named incorrectly")
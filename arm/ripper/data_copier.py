@@ -0,0 +1,190 @@
+"""
+Streaming copier for data discs
+
+Reads the disc in large sector aligned chunks while a writer thread writes the previous chunk
+and hashes it, so the drive is never waiting on the disk. Sectors that can't be read are tried
+again in smaller blocks and then one at a time, sectors that still fail are written as zeros
+and reported so the image keeps the same layout as the disc.
+"""
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+
+# CD/DVD/BD sector size, every read starts and ends on a sector
+SECTOR_SIZE = 2048
+# Size of the smaller reads a failed chunk is split into before going sector by sector
+RETRY_BLOCK = 64 * 1024
+# Chunks waiting for the writer, one being read and one being written
+QUEUE_DEPTH = 2
+# Seconds between progress reports
+PROGRESS_INTERVAL = 5
+
+
+class CopyResult:
+    """What copy_disc did"""
+
+    def __init__(self):
+        self.copied = 0
+        self.size = 0
+        self.sha256 = None
+        self.bad_sectors = []
+        self.seconds = 0.0
+
+    def rate(self):
+        """Average bytes per second"""
+        return self.copied / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return f'<CopyResult {self.copied} bytes {len(self.bad_sectors)} bad sectors>'
+
+
+def align(size):
+    """Round a buffer size down to whole sectors, never less than one"""
+    return max(SECTOR_SIZE, size - size % SECTOR_SIZE)
+
+
+def advise(fd, offset, length, advice):
+    """posix_fadvise where the platform has it, it's only a hint so errors are ignored"""
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, offset, length, advice)
+        except OSError:
+            pass
+
+
+def read_sector(fd, offset, retries):
+    """
+    Read one sector, trying again up to retries times\n
+    :return: bytes or None if it couldn't be read
+    """
+    for _ in range(retries + 1):
+        try:
+            return os.pread(fd, SECTOR_SIZE, offset)
+        except OSError:
+            continue
+    return None
+
+
+def read_recovering(fd, offset, size, retries, bad_sectors):
+    """
+    Read a chunk that failed in RETRY_BLOCK pieces, then sector by sector, zero-filling what's left\n
+    :param list bad_sectors: offsets of the sectors that were zero-filled are added to it
+    :return: bytes of size
+    """
+    data = bytearray()
+    for block_offset in range(offset, offset + size, RETRY_BLOCK):
+        block_size = min(RETRY_BLOCK, offset + size - block_offset)
+        try:
+            data += os.pread(fd, block_size, block_offset).ljust(block_size, b"\0")
+            continue
+        except OSError:
+            pass
+        for sector_offset in range(block_offset, block_offset + block_size, SECTOR_SIZE):
+            sector = read_sector(fd, sector_offset, retries)
+            if sector is None:
+                logging.warning(f"Unreadable sector at byte {sector_offset}, writing zeros")
+                bad_sectors.append(sector_offset)
+                sector = b""
+            data += sector.ljust(SECTOR_SIZE, b"\0")
+    return bytes(data[:size])
+
+
+def writer(out_fd, chunks, sha, errors):
+    """
+    Writer thread - write and hash each chunk in order until None is queued\n
+    :param errors: list the first write error is put in, the reader stops when it sees it
+    """
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            return
+        if errors:
+            continue
+        offset, data = chunk
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(out_fd, view, offset)
+                view = view[written:]
+                offset += written
+            sha.update(data)
+            # The image isn't read again, keep it out of the page cache
+            advise(out_fd, chunk[0], len(data), getattr(os, "POSIX_FADV_DONTNEED", 0))
+        except OSError as error:
+            errors.append(error)
+
+
+def copy_disc(source, destination, buffer_size, retries=3, progress=None):
+    """
+    Copy a disc to an image file\n
+    :param str source: device path
+    :param str destination: image file, replaced if it exists
+    :param int buffer_size: bytes read at a time, rounded down to whole sectors
+    :param int retries: times a bad sector is read again before it's zero-filled
+    :param progress: called with the CopyResult every PROGRESS_INTERVAL seconds
+    :return: CopyResult
+    :raises OSError: if the disc or the image can't be opened or the image can't be written
+    """
+    buffer_size = align(buffer_size)
+    result = CopyResult()
+    sha = hashlib.sha256()
+    chunks = queue.Queue(maxsize=QUEUE_DEPTH)
+    errors = []
+    started = time.monotonic()
+    in_fd = os.open(source, os.O_RDONLY)
+    try:
+        result.size = os.lseek(in_fd, 0, os.SEEK_END)
+        advise(in_fd, 0, 0, getattr(os, "POSIX_FADV_SEQUENTIAL", 0))
+        out_fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        thread = threading.Thread(target=writer, args=(out_fd, chunks, sha, errors), name="data_writer", daemon=True)
+        thread.start()
+        try:
+            last_report = started
+            offset = 0
+            while offset < result.size and not errors:
+                size = min(buffer_size, result.size - offset)
+                # Ask for the next chunk while this one is being read
+                advise(in_fd, offset + size, buffer_size, getattr(os, "POSIX_FADV_WILLNEED", 0))
+                try:
+                    data = os.pread(in_fd, size, offset)
+                except OSError as error:
+                    logging.warning(f"Read error at byte {offset} ({error}), retrying in smaller blocks")
+                    data = read_recovering(in_fd, offset, size, retries, result.bad_sectors)
+                if not data:
+                    logging.info(f"Disc ended at byte {offset}, expected {result.size}")
+                    break
+                chunks.put((offset, data))
+                offset += len(data)
+                result.copied = offset
+                result.seconds = time.monotonic() - started
+                if progress is not None and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    progress(result)
+        finally:
+            chunks.put(None)
+            thread.join()
+            os.fsync(out_fd)
+            os.close(out_fd)
+    finally:
+        os.close(in_fd)
+    if errors:
+        raise errors[0]
+    result.sha256 = sha.hexdigest()
+    result.seconds = time.monotonic() - started
+    return result
+
+
+def describe(result):
+    """
+    One line progress for the job page\n
+    :param CopyResult result: copy so far
+    :return: str e.g. "42% - 1.9 of 4.4 GB at 18.3 MB/s, ETA 0:02:15"
+    """
+    percent = 100 * result.copied / result.size if result.size else 0
+    rate = result.rate()
+    remaining = int((result.size - result.copied) / rate) if rate else 0
+    return (f"{percent:.0f}% - {result.copied / 1e9:.1f} of {result.size / 1e9:.1f} GB "
+            f"at {rate / 1e6:.1f} MB/s, ETA {remaining // 3600}:{remaining % 3600 // 60:02}:{remaining % 60:02}")
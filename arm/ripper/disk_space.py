@@ -0,0 +1,334 @@
+"""
+Disk space admission - a rip, transcode or move only starts when its files will fit
+
+Each stage estimates what it will write:
+- rip: the content length of the tracks that will be ripped times the bytes per second raw rips
+  of the disc type took before, at most the size of the disc
+- transcode: the content length times the bytes per second of the HandBrake preset, from earlier
+  transcodes with it, the size of the source when the tracks aren't known yet
+- finalize: the size of the files to move, nothing when they're only renamed
+Stages without history use DEFAULT_RATES.
+
+The estimate is reserved in the space_reservation table. A stage is let in when the free space
+on its filesystem, less what the other jobs have reserved and not written yet and less
+DISK_SPACE_MARGIN_GB, still holds its estimate. Otherwise the job waits as "waiting_space" in the
+order the jobs asked. When DELRAWFILES is set, raw folders older than FREE_RAW_LEFTOVERS_DAYS that
+no job is using are deleted first, oldest first, they'd have been deleted if their job had finished.
+
+When the stage is done the size it really wrote is kept, the reservations are released when the
+job ends and become the history the next estimates come from.
+"""
+import datetime
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import psutil
+
+import arm.config.config as cfg
+from arm.models.job import Job
+from arm.models.space_reservation import SpaceReservation
+from arm.ripper import io_scheduler, utils
+from arm.ui import constants, db, eta
+
+# Bytes written per second of content when there's no history, by stage and disc type
+DEFAULT_RATES = {
+    'rip': {'dvd': 1_250_000, 'bluray': 6_000_000},
+    'transcode': {'dvd': 400_000, 'bluray': 1_200_000},
+}
+# Finished stages the history rate is taken from
+HISTORY = 20
+# Seconds between checks while a job waits for space
+POLL_INTERVAL = 30
+# Next to the database, held while a decision is made
+LOCK_FILE = ".disk_space.lock"
+GB = 1024 * 1024 * 1024
+
+
+def enabled():
+    """True when jobs have to wait for space"""
+    return bool(cfg.arm_config.get('DISK_SPACE_CHECK', True))
+
+
+def margin():
+    """Bytes always left free on every filesystem"""
+    return int(float(cfg.arm_config.get('DISK_SPACE_MARGIN_GB', 5) or 0) * GB)
+
+
+def dir_size(path):
+    """
+    Bytes used by the files under a folder, or by the file itself\n
+    :return: int, 0 when it doesn't exist
+    """
+    if not path or not os.path.exists(path):
+        return 0
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def disc_size(devpath):
+    """
+    Size of the disc in a drive from sysfs\n
+    :return: int bytes, 0 when it isn't known
+    """
+    try:
+        with open(os.path.join("/sys/class/block", os.path.basename(str(devpath)), "size")) as size_file:
+            return int(size_file.read().strip()) * 512
+    except (OSError, ValueError):
+        return 0
+
+
+def free_bytes(path):
+    """Bytes free for ARM on the filesystem of a path that may not exist yet"""
+    path = os.path.abspath(str(path))
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+
+def history_rate(stage, basis):
+    """
+    Bytes written per second of content by the last stages like this one\n
+    :return: float or None without history
+    """
+    finished = SpaceReservation.query.filter(SpaceReservation.stage == stage, SpaceReservation.basis == basis,
+                                             SpaceReservation.status == "released",
+                                             SpaceReservation.used > 0, SpaceReservation.content > 0) \
+        .order_by(SpaceReservation.reservation_id.desc()).limit(HISTORY).all()
+    content = sum(reservation.content for reservation in finished)
+    return sum(reservation.used for reservation in finished) / content if content else None
+
+
+def estimate(job, stage, path, source=None):
+    """
+    What a stage of a job is expected to write\n
+    :param job: Current job
+    :param str stage: rip, transcode or finalize
+    :param str path: where it writes
+    :param str source: what it reads, the drive or a folder
+    :return: (int bytes, float seconds of content, str basis the history is kept under)
+    """
+    if stage == "finalize":
+        if not source or not os.path.isdir(source) or \
+                io_scheduler.device_of(source)[0] == io_scheduler.device_of(path)[0]:
+            # Moves on the same filesystem are renames
+            return 0, 0.0, "move"
+        return dir_size(source), 0.0, "move"
+    content = eta.content_seconds(job, job.tracks.all(), job.config)
+    basis = job.disctype if stage == "rip" else (eta.get_preset(job) or job.disctype)
+    rate = history_rate(stage, basis) or DEFAULT_RATES.get(stage, {}).get(job.disctype)
+    needed = int(content * rate) if content and rate else 0
+    if stage == "rip":
+        size = disc_size(job.devpath)
+        needed = min(needed, size) if needed and size else needed or size
+    elif not needed and source:
+        # The tracks aren't known before HandBrake scans them, the output won't be bigger than the source
+        needed = dir_size(source) if os.path.isdir(source) else disc_size(source)
+    return needed, content, basis
+
+
+def outstanding(reservation):
+    """Bytes a held reservation still has to write"""
+    if reservation.used is not None:
+        return 0
+    return max(0, (reservation.estimate or 0) - dir_size(reservation.path))
+
+
+def clear_stale():
+    """Release the reservations of jobs that have ended, or whose ripper has stopped, the caller commits"""
+    held = db.session.query(SpaceReservation, Job).join(Job, Job.job_id == SpaceReservation.job_id) \
+        .filter(SpaceReservation.status != "released").all()
+    for reservation, job in held:
+        if job.status not in ("success", "fail"):
+            if job.pid is None or psutil.pid_exists(job.pid):
+                continue
+            logging.info(f"Releasing the disk space of job {job.job_id}, its ripper has stopped")
+        reservation.status = "released"
+        reservation.released = datetime.datetime.now()
+
+
+def blocked_by(reservation):
+    """
+    Why a reservation doesn't fit yet\n
+    :return: str reason or None when it fits
+    """
+    others = SpaceReservation.query.filter(SpaceReservation.device == reservation.device,
+                                           SpaceReservation.status.in_(["waiting", "held"]),
+                                           SpaceReservation.reservation_id != reservation.reservation_id).all()
+    for other in others:
+        if other.status == "waiting" and other.reservation_id < reservation.reservation_id:
+            return f"queued behind job {other.job_id}"
+    reserved = sum(outstanding(other) for other in others)
+    available = free_bytes(reservation.path) - reserved - margin()
+    if available >= reservation.estimate:
+        return None
+    return (f"needs {reservation.estimate / GB:.1f} GB in {reservation.path}, "
+            f"{max(available, 0) / GB:.1f} GB left after {reserved / GB:.1f} GB reserved by other jobs "
+            f"and a {margin() / GB:g} GB margin")
+
+
+def raw_leftovers():
+    """
+    Raw folders no job is using, that are old enough to be deleted\n
+    :return: list of paths, oldest first
+    """
+    days = int(cfg.arm_config.get('FREE_RAW_LEFTOVERS_DAYS', 0) or 0)
+    raw_path = cfg.arm_config.get('RAW_PATH')
+    if not cfg.arm_config.get('DELRAWFILES') or days <= 0 or not raw_path or not os.path.isdir(raw_path):
+        return []
+    in_use = {os.path.abspath(reservation.path) for reservation in
+              SpaceReservation.query.filter(SpaceReservation.status != "released")}
+    cutoff = time.time() - days * 86400
+    leftovers = []
+    for entry in os.scandir(raw_path):
+        if not entry.is_dir(follow_symlinks=False) or os.path.abspath(entry.path) in in_use:
+            continue
+        try:
+            newest = max([entry.stat().st_mtime] + [os.path.getmtime(os.path.join(dirpath, name))
+                                                    for dirpath, _, names in os.walk(entry.path) for name in names])
+        except OSError:
+            # Something is still writing to it
+            continue
+        if newest < cutoff:
+            leftovers.append((newest, entry.path))
+    return [path for _, path in sorted(leftovers)]
+
+
+def free_leftovers(reservation):
+    """
+    Delete old raw leftovers on the reservation's filesystem until it fits\n
+    :return: bytes freed
+    """
+    freed = 0
+    for path in raw_leftovers():
+        if blocked_by(reservation) is None:
+            break
+        found = io_scheduler.device_of(path)
+        if found is None or found[0] != reservation.device:
+            continue
+        size = dir_size(path)
+        try:
+            shutil.rmtree(path)
+        except OSError as error:
+            logging.warning(f"Couldn't delete raw leftover {path} - {error}")
+            continue
+        logging.info(f"Deleted raw leftover {path} to make room, {size / GB:.1f} GB")
+        freed += size
+    return freed
+
+
+def try_admit(reservation, free_old=False):
+    """
+    Hold the reservation if it fits\n
+    :param bool free_old: delete raw leftovers first if it doesn't
+    :return: str reason it has to wait, None once it's held
+    """
+    with io_scheduler.decision_lock(LOCK_FILE):
+        try:
+            clear_stale()
+            db.session.commit()
+            reason = blocked_by(reservation)
+            if reason is not None and free_old and free_leftovers(reservation):
+                reason = blocked_by(reservation)
+            if reason is None:
+                reservation.status = "held"
+                reservation.started = datetime.datetime.now()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return reason
+
+
+def wait_for_space(job, reservation, reason):
+    """Wait as waiting_space until the reservation fits, then put the job's status back"""
+    previous_status = job.status
+    utils.database_updater({'status': "waiting_space"}, job)
+    logging.info(f"Waiting for disk space to {reservation.stage} - {reason}")
+    utils.notify(job, constants.NOTIFY_TITLE, f"{job.title} is waiting for disk space to {reservation.stage}, "
+                                              f"{reason}")
+    with utils.job_stage(job, "space_wait", f"{reservation.stage} - {reason}") as wait_stage:
+        while reason is not None:
+            time.sleep(POLL_INTERVAL)
+            reported, reason = reason, try_admit(reservation, free_old=True)
+            if reason is not None and reason != reported and wait_stage is not None:
+                utils.database_updater({'detail': f"{reservation.stage} - {reason}"}, wait_stage)
+    utils.database_updater({'status': previous_status}, job)
+
+
+@contextmanager
+def reserve(job, stage, path, source=None):
+    """
+    Wait until a stage's files fit, and record what it really wrote when the block ends\n
+    The space stays reserved until release_job() as the files are still there\n
+    Usage: with reserve(job, "rip", rawpath): ...\n
+    :param job: Current job
+    :param str stage: rip, transcode or finalize
+    :param str path: folder the stage writes to
+    :param str source: what it reads, the drive or a folder
+    """
+    reservation = None
+    if enabled() and job is not None and path:
+        try:
+            needed, content, basis = estimate(job, stage, path, source)
+            found = io_scheduler.device_of(path)
+            if needed > 0 and found is not None:
+                reservation = SpaceReservation(job.job_id, stage, basis, found[0], path, content, needed)
+                utils.database_adder(reservation)
+                logging.info(f"{stage} of job {job.job_id} needs about {needed / GB:.1f} GB in {path}")
+                reason = try_admit(reservation, free_old=True)
+                if reason is not None:
+                    wait_for_space(job, reservation, reason)
+        except Exception as error:
+            # The stage runs without a reservation rather than not at all
+            logging.error(f"Couldn't reserve disk space to {stage}, running it straight away - {error}")
+    try:
+        yield reservation
+    finally:
+        if reservation is not None and reservation.status == "held":
+            utils.database_updater({'used': dir_size(path)}, reservation)
+
+
+def release_job(job):
+    """Release everything the job reserved, its files are either moved, deleted or counted as used space now"""
+    try:
+        SpaceReservation.query.filter(SpaceReservation.job_id == job.job_id,
+                                      SpaceReservation.status != "released") \
+            .update({'status': "released", 'released': datetime.datetime.now()}, synchronize_session=False)
+        db.session.commit()
+    except Exception as error:
+        db.session.rollback()
+        logging.error(f"Couldn't release the disk space of job {job.job_id} - {error}")
+
+
+def snapshot():
+    """
+    The reservations by filesystem for the UI\n
+    :return: list of dicts with device, name, free, reserved bytes and the reservations on it
+    """
+    devices = {}
+    for reservation in SpaceReservation.query.filter(SpaceReservation.status.in_(["waiting", "held"])) \
+            .order_by(SpaceReservation.reservation_id):
+        entry = devices.get(reservation.device)
+        if entry is None:
+            try:
+                free = free_bytes(reservation.path)
+            except OSError:
+                free = 0
+            entry = devices[reservation.device] = {'device': reservation.device,
+                                                   'name': io_scheduler.device_name(reservation.device),
+                                                   'free': free, 'reserved': 0, 'reservations': []}
+        if reservation.status == "held":
+            entry['reserved'] += outstanding(reservation)
+        entry['reservations'].append(reservation)
+    return sorted(devices.values(), key=lambda entry: entry['name'])
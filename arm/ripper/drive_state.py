@@ -0,0 +1,243 @@
+"""
+Drive state - which optical drives are attached and what's in them, kept up to date from udev events
+
+A pyudev monitor is subscribed to block device events, for every cd/dvd/Blu-ray drive the table
+holds whether it's present, the tray state, the media type and whether the disc is ready to read.
+The ripper waits on media ready events instead of sleeping, the UI reads the table instead of
+scanning every block device.
+
+Drives don't always send an event when a disc becomes readable after it's inserted, so a waiter
+that hasn't heard anything for READY_RECHECK seconds checks the drive itself. Without a monitor (no
+netlink socket in some containers) that check is all there is.
+"""
+import datetime
+import fcntl
+import logging
+import os
+import re
+import threading
+import time
+
+import pyudev
+
+# ioctl CDROM_DRIVE_STATUS and its results, see linux/cdrom.h
+CDROM_DRIVE_STATUS = 0x5326
+CDS_NO_INFO = 0
+CDS_NO_DISC = 1
+CDS_TRAY_OPEN = 2
+CDS_DRIVE_NOT_READY = 3
+CDS_DISC_OK = 4
+TRAY_STATES = {
+    CDS_NO_INFO: "unknown",
+    CDS_NO_DISC: "empty",
+    CDS_TRAY_OPEN: "open",
+    CDS_DRIVE_NOT_READY: "not ready",
+    CDS_DISC_OK: "ready",
+}
+# The udev properties for the disc in the drive, in the order they're checked
+MEDIA_TYPES = (
+    ("ID_CDROM_MEDIA_BD", "bluray"),
+    ("ID_CDROM_MEDIA_DVD", "dvd"),
+    ("ID_CDROM_MEDIA_TRACK_COUNT_AUDIO", "music"),
+    ("ID_CDROM_MEDIA_CD", "cd"),
+)
+DRIVE_PATTERN = re.compile(r'^/dev/sr\d{1,2}$')
+# Seconds between checks of a drive that hasn't sent an event
+READY_RECHECK = 1
+
+_context = None
+_context_lock = threading.Lock()
+_lock = threading.Lock()
+_changed = threading.Condition(_lock)
+# devpath -> state dict
+_drives = {}
+_observer = None
+
+
+def get_context():
+    """
+    The udev context shared by the whole process, made the first time it's needed so importing
+    the models doesn't need a working libudev
+    """
+    global _context
+    with _context_lock:
+        if _context is None:
+            _context = pyudev.Context()
+        return _context
+
+
+def tray_status(devpath):
+    """
+    The CDROM_DRIVE_STATUS of a drive, without exiting when it can't be opened like utils.get_cdrom_status\n
+    :param devpath: path to the drive
+    :return: int CDS_* value
+    """
+    try:
+        disc_check = os.open(devpath, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return CDS_NO_INFO
+    try:
+        return fcntl.ioctl(disc_check, CDROM_DRIVE_STATUS, 0)
+    except OSError:
+        return CDS_NO_INFO
+    finally:
+        os.close(disc_check)
+
+
+def media_type(device):
+    """
+    The type of the disc in a drive from its udev properties\n
+    :return: str bluray, dvd, music, cd or None when there's no disc
+    """
+    if device.properties.get("ID_CDROM_MEDIA") != "1":
+        return None
+    for key, name in MEDIA_TYPES:
+        if device.properties.get(key):
+            return name
+    return "unknown"
+
+
+def drive_type(device):
+    """
+    What a drive can read, from its udev properties\n
+    :return: str like CD/DVD/BluRay
+    """
+    found = ""
+    if device.properties.get("ID_CDROM"):
+        found += "CD"
+    if device.properties.get("ID_CDROM_DVD"):
+        found += "/DVD"
+    if device.properties.get("ID_CDROM_BD"):
+        found += "/BluRay"
+    return found
+
+
+def read_state(device, present=True):
+    """
+    The state of a drive from its udev device and the drive status\n
+    :return: dict
+    """
+    status = tray_status(device.device_node) if present else CDS_NO_INFO
+    return {
+        'devpath': device.device_node,
+        'present': present,
+        'drive_type': drive_type(device),
+        'tray': TRAY_STATES.get(status, "unknown"),
+        'media': media_type(device) if present else None,
+        'label': device.properties.get("ID_FS_LABEL"),
+        'ready': status == CDS_DISC_OK,
+        'updated': datetime.datetime.now(),
+    }
+
+
+def update(device, action="change"):
+    """Record the state of a drive and wake everything waiting on it"""
+    if not device.device_node or not DRIVE_PATTERN.match(device.device_node):
+        return
+    state = read_state(device, present=action != "remove")
+    with _changed:
+        previous = _drives.get(device.device_node)
+        _drives[device.device_node] = state
+        _changed.notify_all()
+    if previous is None or (previous['tray'], previous['media']) != (state['tray'], state['media']):
+        logging.debug(f"Drive {state['devpath']} {action}: tray {state['tray']}, media {state['media']}")
+
+
+def scan():
+    """Read the state of every drive attached, the table starts from this before events arrive"""
+    for device in get_context().list_devices(subsystem='block'):
+        update(device, "add")
+
+
+def running():
+    """True when the table is being kept up to date by a monitor"""
+    return _observer is not None and _observer.is_alive()
+
+
+def start():
+    """
+    Subscribe to udev events for this process, the first call also fills the table\n
+    :return: bool whether the monitor is running
+    """
+    global _observer
+    with _lock:
+        if _observer is not None:
+            return True
+        try:
+            monitor = pyudev.Monitor.from_netlink(get_context())
+            monitor.filter_by(subsystem='block')
+            # Listen before the scan so nothing that happens during it is missed
+            monitor.start()
+            _observer = pyudev.MonitorObserver(monitor, callback=lambda device: update(device, device.action),
+                                               name="drive_state", daemon=True)
+        except Exception as error:
+            logging.warning(f"Couldn't subscribe to udev events, drives will be checked every "
+                            f"{READY_RECHECK}s - {error}")
+        observer = _observer
+    # Outside the lock, update takes it
+    scan()
+    if observer is None:
+        return False
+    observer.start()
+    return True
+
+
+def state(devpath):
+    """
+    The state of one drive, read from the drive if the table doesn't have it yet\n
+    :return: dict or None when the drive doesn't exist
+    """
+    with _lock:
+        current = _drives.get(devpath)
+    if current is None or not running():
+        try:
+            update(pyudev.Devices.from_device_file(get_context(), devpath))
+        except Exception as error:
+            logging.debug(f"No udev device for {devpath} - {error}")
+            return None
+        with _lock:
+            current = _drives.get(devpath)
+    return dict(current) if current else None
+
+
+def drives():
+    """
+    The state of every drive present, without rescanning when the monitor is running\n
+    :return: dict of devpath -> state
+    """
+    if not running():
+        scan()
+    with _lock:
+        return {devpath: dict(drive) for devpath, drive in _drives.items() if drive['present']}
+
+
+def wait_for_media(devpath, timeout):
+    """
+    Wait until the disc in a drive is ready to read\n
+    :param devpath: path to the drive
+    :param timeout: seconds to wait
+    :return: bool whether the disc is ready
+    """
+    deadline = time.monotonic() + timeout
+    start()
+    current = state(devpath)
+    reported = None
+    while current is None or not current['ready']:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        tray = current['tray'] if current else "missing"
+        if tray != reported:
+            logging.info(f"Drive {devpath} is {tray}, waiting up to {int(remaining)}s for the disc")
+            reported = tray
+        with _changed:
+            changed = _changed.wait(min(remaining, READY_RECHECK))
+        if not changed:
+            # No event, the drive may still have become ready
+            try:
+                update(pyudev.Devices.from_device_file(get_context(), devpath))
+            except Exception as error:
+                logging.debug(f"No udev device for {devpath} - {error}")
+        with _lock:
+            current = _drives.get(devpath)
+    return True
@@ -0,0 +1,354 @@
+"""
+Moves finished files to the COMPLETED_PATH
+
+A move on the same filesystem is a rename. Anything else is copied in the kernel with
+copy_file_range (or sendfile) to a temporary name next to the destination, then renamed into
+place so a half copied file is never seen under its real name. Several files are copied at
+once and the copy can be checked against a SHA-256 of the source.
+"""
+import errno
+import grp
+import hashlib
+import logging
+import os
+import pwd
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Bytes handed to the kernel per copy_file_range/sendfile call
+ZERO_COPY_CHUNK = 64 * 1024 * 1024
+# Bytes read at a time when the copy is verified, the data has to pass through python to be hashed
+VERIFY_CHUNK = 8 * 1024 * 1024
+# Added to the destination while it's being copied
+TMP_SUFFIX = ".arm-part"
+# Seconds between progress reports
+PROGRESS_INTERVAL = 5
+# Errors that mean copy_file_range can't be used between these two files
+NO_COPY_FILE_RANGE = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP)
+
+
+class Progress:
+    """Bytes moved so far across all the files of a move, updated by the copy threads"""
+
+    def __init__(self, size=0, files=0, limit=0):
+        self.size = size
+        self.files = files
+        self.copied = 0
+        self.files_done = 0
+        self.started = time.monotonic()
+        # Bytes per second the copies are held to, 0 for no limit
+        self.limit = limit
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def add(self, count, throttle=True):
+        """
+        Count bytes that have been copied\n
+        With a limit the copying thread sleeps until the copies are back down to it, renames aren't held back
+        """
+        with self._lock:
+            self.copied += count
+            if not throttle or not self.limit:
+                return
+            self.throttled += count
+            ahead = self.throttled / self.limit - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def file_done(self):
+        """Count a finished file"""
+        with self._lock:
+            self.files_done += 1
+
+    def rate(self):
+        """Average bytes per second"""
+        elapsed = time.monotonic() - self.started
+        return self.copied / elapsed if elapsed else 0.0
+
+    def describe(self):
+        """
+        One line progress for the job page\n
+        :return: str e.g. "42% - file 3 of 7, 1.9 of 4.4 GB at 80.3 MB/s, ETA 0:00:31"
+        """
+        percent = 100 * self.copied / self.size if self.size else 100
+        rate = self.rate()
+        remaining = int((self.size - self.copied) / rate) if rate else 0
+        return (f"{percent:.0f}% - file {min(self.files_done + 1, self.files)} of {self.files}, "
+                f"{self.copied / 1e9:.1f} of {self.size / 1e9:.1f} GB at {rate / 1e6:.1f} MB/s, "
+                f"ETA {remaining // 3600}:{remaining % 3600 // 60:02}:{remaining % 60:02}")
+
+
+class MediaPermissions:
+    """
+    Mode and owner given to everything put in the COMPLETED_PATH, set through a file descriptor
+    as each file arrives so the tree doesn't have to be walked again afterwards\n
+    None leaves the mode/owner as it is
+    """
+
+    def __init__(self, mode=None, uid=None, gid=None):
+        self.mode = mode
+        self.uid = uid
+        self.gid = gid
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build from SET_MEDIA_PERMISSIONS/CHMOD_VALUE and SET_MEDIA_OWNER/CHOWN_USER/CHOWN_GROUP\n
+        :param config: cfg.arm_config or a job's Config
+        :return: MediaPermissions
+        """
+        def setting(name):
+            return config.get(name) if isinstance(config, dict) else getattr(config, name, None)
+
+        permissions = cls()
+        try:
+            if setting('SET_MEDIA_PERMISSIONS'):
+                permissions.mode = int(str(setting('CHMOD_VALUE')), 8)
+            if setting('SET_MEDIA_OWNER') and setting('CHOWN_USER') and setting('CHOWN_GROUP'):
+                permissions.uid = pwd.getpwnam(str(setting('CHOWN_USER'))).pw_uid
+                permissions.gid = grp.getgrnam(str(setting('CHOWN_GROUP'))).gr_gid
+        except (KeyError, ValueError) as error:
+            logging.error(f"Media permissions setting is invalid - {error}")
+        return permissions
+
+    def __bool__(self):
+        return self.mode is not None or self.uid is not None or self.gid is not None
+
+    def apply_fd(self, fd):
+        """Set the mode and owner of an open file or folder"""
+        if self.mode is not None:
+            os.fchmod(fd, self.mode)
+        if self.uid is not None or self.gid is not None:
+            os.fchown(fd, -1 if self.uid is None else self.uid, -1 if self.gid is None else self.gid)
+
+    def apply(self, path):
+        """Set the mode and owner of a file or folder, symlinks aren't followed"""
+        if not self:
+            return
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+        try:
+            self.apply_fd(fd)
+        finally:
+            os.close(fd)
+
+    def __repr__(self):
+        mode = oct(self.mode) if self.mode is not None else None
+        return f'<MediaPermissions mode={mode} uid={self.uid} gid={self.gid}>'
+
+
+def apply_tree(path, permissions):
+    """
+    Set the mode and owner of a folder and everything in it, for files that didn't get them when
+    they were moved\n
+    :param str path: folder
+    :param MediaPermissions permissions: mode/owner to set
+    :return: (number of paths set, list of (path, error) that failed)
+    """
+    done = 0
+    failed = []
+    folders = [path]
+    while folders:
+        folder = folders.pop()
+        try:
+            permissions.apply(folder)
+            done += 1
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        folders.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        try:
+                            permissions.apply(entry.path)
+                            done += 1
+                        except OSError as error:
+                            failed.append((entry.path, error))
+        except OSError as error:
+            failed.append((folder, error))
+    return done, failed
+
+
+def same_device(src, dst):
+    """True if dst's folder is on the same filesystem as src, so it can be renamed"""
+    return os.stat(src).st_dev == os.stat(os.path.dirname(dst) or ".").st_dev
+
+
+def zero_copy(in_fd, out_fd, size, progress):
+    """
+    Copy without the data passing through python, copy_file_range then sendfile\n
+    Both use and move the file positions so they can take over from each other part way
+    """
+    use_copy_file_range = hasattr(os, "copy_file_range")
+    # A second's worth at a time when the copy is held to a limit, so it doesn't go in bursts
+    chunk = min(ZERO_COPY_CHUNK, progress.limit) if progress.limit else ZERO_COPY_CHUNK
+    copied = 0
+    while copied < size:
+        count = min(chunk, size - copied)
+        try:
+            if use_copy_file_range:
+                sent = os.copy_file_range(in_fd, out_fd, count)
+            else:
+                sent = os.sendfile(out_fd, in_fd, None, count)
+        except OSError as error:
+            if use_copy_file_range and error.errno in NO_COPY_FILE_RANGE:
+                use_copy_file_range = False
+                continue
+            raise
+        if sent == 0:
+            break
+        copied += sent
+        progress.add(sent)
+    if copied != size:
+        raise OSError(errno.EIO, f"copied {copied} of {size} bytes")
+
+
+def hashed_copy(in_fd, out_fd, progress):
+    """
+    Copy through python, hashing the source on the way\n
+    :return: str sha256 of the source
+    """
+    sha = hashlib.sha256()
+    while True:
+        data = os.read(in_fd, VERIFY_CHUNK)
+        if not data:
+            return sha.hexdigest()
+        sha.update(data)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(out_fd, view):]
+        progress.add(len(data))
+
+
+def file_sha256(path):
+    """SHA-256 of a file"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as reader:
+        for data in iter(lambda: reader.read(VERIFY_CHUNK), b""):
+            sha.update(data)
+    return sha.hexdigest()
+
+
+def copy_file(src, dst, verify=False, progress=None, permissions=None):
+    """
+    Copy src to dst through a temporary file that's renamed into place when it's complete\n
+    The copy keeps the times of src, and the mode of src unless permissions has one\n
+    :param bool verify: check the copy against a SHA-256 of the source taken while copying
+    :param Progress progress: bytes copied are added to it
+    :param MediaPermissions permissions: mode/owner for the copy
+    :raises OSError: if the copy fails or doesn't match, the temporary file is removed
+    """
+    progress = progress or Progress()
+    tmp_path = dst + TMP_SUFFIX
+    try:
+        with open(src, "rb") as reader, open(tmp_path, "wb") as writer:
+            source_stat = os.fstat(reader.fileno())
+            if verify:
+                source_sha = hashed_copy(reader.fileno(), writer.fileno(), progress)
+            else:
+                zero_copy(reader.fileno(), writer.fileno(), source_stat.st_size, progress)
+            os.fchmod(writer.fileno(), source_stat.st_mode & 0o7777)
+            try:
+                if permissions:
+                    permissions.apply_fd(writer.fileno())
+            except OSError as error:
+                logging.warning(f"Couldn't set {permissions} on {dst} - {error}")
+            os.fsync(writer.fileno())
+            os.utime(writer.fileno(), ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        if verify and file_sha256(tmp_path) != source_sha:
+            raise OSError(errno.EIO, f"copy of {src} doesn't match, sha256 {source_sha}")
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.isfile(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def move_file(src, dst, verify=False, progress=None, permissions=None):
+    """
+    Move a file, renaming it when it's on the same filesystem\n
+    :param bool verify: check copies between filesystems with a SHA-256
+    :param Progress progress: bytes moved are added to it
+    :param MediaPermissions permissions: mode/owner set on the moved file
+    :return: True if it was moved, False if dst already exists
+    :raises OSError: if it couldn't be moved, src is left where it was
+    """
+    progress = progress or Progress()
+    if os.path.isfile(dst):
+        logging.info(f"File: {dst} already exists.  Not moving.")
+        return False
+    size = os.path.getsize(src)
+    if same_device(src, dst):
+        try:
+            os.rename(src, dst)
+            progress.add(size, throttle=False)
+            apply_moved(dst, permissions)
+            return True
+        except OSError as error:
+            # Bind mounts of the same filesystem still can't be renamed across
+            if error.errno != errno.EXDEV:
+                raise
+    copy_file(src, dst, verify, progress, permissions)
+    os.unlink(src)
+    return True
+
+
+def apply_moved(path, permissions):
+    """
+    Set the mode/owner of a renamed file, the file is already in place so a failure is only logged
+    """
+    try:
+        if permissions:
+            permissions.apply(path)
+    except OSError as error:
+        logging.warning(f"Couldn't set {permissions} on {path} - {error}")
+
+
+def move_all(moves, workers=2, verify=False, report=None, permissions=None, limit=0):
+    """
+    Move several files at once\n
+    Files whose destination already exists are skipped, as are later moves to a destination
+    another move of the batch already goes to\n
+    :param list moves: (src, dst) pairs
+    :param int workers: files copied at the same time
+    :param bool verify: check copies between filesystems with a SHA-256
+    :param report: called with the Progress every PROGRESS_INTERVAL seconds from the calling thread
+    :param MediaPermissions permissions: mode/owner set on the moved files
+    :param int limit: bytes per second for all the copies together, 0 for no limit
+    :return: list of (src, dst, error) for the moves that failed
+    """
+    unique = []
+    skipped = []
+    destinations = set()
+    for src, dst in moves:
+        if os.path.normpath(dst) in destinations:
+            logging.info(f"File: {src} goes to {dst} as well.  Not moving.")
+            skipped.append((src, dst))
+        else:
+            destinations.add(os.path.normpath(dst))
+            unique.append((src, dst))
+    sizes = [os.path.getsize(src) if os.path.isfile(src) else 0 for src, _ in unique]
+    progress = Progress(sum(sizes), len(unique), limit)
+
+    def run(src, dst):
+        try:
+            return move_file(src, dst, verify, progress, permissions)
+        finally:
+            progress.file_done()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="finalize") as executor:
+        futures = {executor.submit(run, src, dst): (src, dst) for src, dst in unique}
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=PROGRESS_INTERVAL)
+            if pending and report is not None:
+                report(progress)
+    failed = []
+    for future, (src, dst) in futures.items():
+        if future.exception() is not None:
+            failed.append((src, dst, future.exception()))
+        elif not future.result():
+            skipped.append((src, dst))
+    logging.info(f"Moved {len(moves) - len(failed) - len(skipped)} of {len(moves)} files, "
+                 f"{len(skipped)} skipped as the destination exists, "
+                 f"{progress.copied / 1e9:.1f} GB at {progress.rate() / 1e6:.1f} MB/s")
+    return failed
@@ -0,0 +1,194 @@
+"""
+Disc fingerprints - recognise a disc that has been ripped before without asking any web service
+
+Every job records the fingerprints of its disc. When a disc with a matching fingerprint was
+ripped successfully before, its title, year, type and poster are reused straight away.
+"""
+import hashlib
+import logging
+import os
+
+import pydvdid
+
+from arm.models.disc_fingerprint import DiscFingerprint
+# job.py imports music_brainz which imports this, so Job is looked up when it's used
+from arm.models import job as job_model
+from arm.ripper import utils
+from arm.ui import db
+
+# Most specific first, layout is only the label and the file sizes so it's used last
+KINDS = ("crc64", "bluray", "musicbrainz", "layout")
+# Files read for the blu-ray content hash, they describe the titles and playlists on the disc
+BLURAY_FILES = ("BDMV/index.bdmv", "BDMV/MovieObject.bdmv")
+
+
+def dvd_crc64(mountpoint):
+    """
+    The dvd crc64 from the ifo files, the same id the ARM api uses\n
+    :return: str or None if the disc can't be read
+    """
+    try:
+        return str(pydvdid.compute(str(mountpoint)))
+    except Exception as error:
+        logging.info(f"Couldn't compute the dvd crc64 - {error}")
+        return None
+
+
+def bluray_hash(mountpoint):
+    """
+    Hash of the blu-ray index, movie object and playlist files\n
+    :return: str or None if the disc can't be read
+    """
+    sha = hashlib.sha256()
+    try:
+        for name in BLURAY_FILES:
+            with open(os.path.join(mountpoint, name), "rb") as reader:
+                sha.update(reader.read())
+        playlist_dir = os.path.join(mountpoint, "BDMV", "PLAYLIST")
+        for name in sorted(os.listdir(playlist_dir)):
+            sha.update(name.encode())
+            with open(os.path.join(playlist_dir, name), "rb") as reader:
+                sha.update(reader.read())
+    except OSError as error:
+        logging.info(f"Couldn't compute the blu-ray hash - {error}")
+        return None
+    return sha.hexdigest()[:40]
+
+
+def layout_hash(job):
+    """
+    Hash of the disc label and the names and sizes of the video files\n
+    :return: str or None if there are no video files to hash
+    """
+    layout = []
+    for folder in ("VIDEO_TS", "video_ts", "BDMV/STREAM", "BDMV/PLAYLIST"):
+        path = os.path.join(str(job.mountpoint), folder)
+        if not os.path.isdir(path):
+            continue
+        with os.scandir(path) as entries:
+            layout.extend(f"{folder}/{entry.name}:{entry.stat().st_size}" for entry in entries if entry.is_file())
+    if not layout:
+        return None
+    sha = hashlib.sha256(f"{job.label}|{job.disctype}".encode())
+    for item in sorted(layout):
+        sha.update(item.encode())
+    return sha.hexdigest()[:40]
+
+
+def disc_fingerprints(job):
+    """
+    Work out the fingerprints of a mounted dvd or blu-ray\n
+    :param job: Current job
+    :return: list of (kind, value)
+    """
+    fingerprints = []
+    if job.disctype == "dvd":
+        fingerprints.append(("crc64", dvd_crc64(job.mountpoint)))
+    elif job.disctype == "bluray":
+        fingerprints.append(("bluray", bluray_hash(job.mountpoint)))
+    fingerprints.append(("layout", layout_hash(job)))
+    return [(kind, value) for kind, value in fingerprints if value]
+
+
+def record(job, fingerprints):
+    """
+    Save the fingerprints of the current job's disc\n
+    :param job: Current job
+    :param list fingerprints: (kind, value)
+    """
+    known = {(fingerprint.kind, fingerprint.value) for fingerprint in job.fingerprints}
+    for kind, value in fingerprints:
+        if (kind, value) not in known:
+            db.session.add(DiscFingerprint(job.job_id, kind, value))
+    utils.database_updater({}, job)
+
+
+def find_previous(job, fingerprints=None):
+    """
+    Find the latest successful job that ripped the same disc, in one indexed lookup\n
+    :param job: Current job
+    :param list fingerprints: (kind, value) - defaults to the fingerprints recorded for the job
+    :return: (Job, kind) or (None, None)
+    """
+    if fingerprints is None:
+        fingerprints = [(fingerprint.kind, fingerprint.value) for fingerprint in job.fingerprints]
+    if not fingerprints:
+        return None, None
+    job_class = job_model.Job
+    matches = db.session.query(job_class, DiscFingerprint.kind) \
+        .join(DiscFingerprint, DiscFingerprint.job_id == job_class.job_id) \
+        .filter(db.tuple_(DiscFingerprint.kind, DiscFingerprint.value).in_(fingerprints),
+                job_class.status == "success", job_class.job_id != job.job_id) \
+        .order_by(job_class.job_id.desc()).all()
+    if not matches:
+        return None, None
+    previous, kind = min(matches, key=lambda match: KINDS.index(match[1]))
+    logging.info(f"Disc matches job {previous.job_id} ({previous.title}) by {kind}")
+    return previous, kind
+
+
+def apply_previous(job, previous):
+    """
+    Give the current job the identity of the job that ripped the same disc before\n
+    :param job: Current job
+    :param previous: Job found by find_previous
+    """
+    args = {
+        'title': previous.title,
+        'title_auto': previous.title,
+        'year': previous.year,
+        'year_auto': previous.year,
+        'video_type': previous.video_type,
+        'video_type_auto': previous.video_type,
+        'imdb_id': previous.imdb_id,
+        'imdb_id_auto': previous.imdb_id,
+        'poster_url': previous.poster_url,
+        'poster_url_auto': previous.poster_url,
+        'hasnicetitle': previous.hasnicetitle,
+    }
+    utils.database_updater(args, job)
+
+
+def copy_tracks(job, previous):
+    """
+    Copy the track list of the job that ripped the same music cd before\n
+    :param job: Current job
+    :param previous: Job found by find_previous
+    """
+    if job.tracks.count() > 0:
+        return
+    for track in previous.tracks:
+        utils.put_track(job, track.track_number, track.length, track.aspect_ratio, track.fps,
+                        track.main_feature, track.source, track.filename)
+
+
+def job_dupe_check(job):
+    """
+    function for checking the database to look for jobs that have completed
+    successfully with the same disc\n
+    Uses the disc fingerprints, discs that couldn't be fingerprinted fall back to
+    a single previous job with the same label
+    :param job: The job obj, so we can use the crc/title etc.
+    :return: True/False
+    """
+    previous, _ = find_previous(job)
+    if previous is None and job.fingerprints.count() == 0 and job.label:
+        logging.debug(f"No fingerprints, trying to find jobs with matching Label={job.label}")
+        job_class = job_model.Job
+        previous_rips = job_class.query.filter(job_class.label == job.label, job_class.status == "success",
+                                               job_class.job_id != job.job_id).limit(2).all()
+        if len(previous_rips) == 1:
+            previous = previous_rips[0]
+        elif previous_rips:
+            logging.debug("Skipping - There is more than one job with this label")
+    if previous is None:
+        logging.info("We have no previous rips/jobs matching this disc")
+        return False
+    active_rip = {
+        "title": previous.title if previous.title else job.label,
+        "year": previous.year if previous.year else "",
+        "poster_url": previous.poster_url if previous.poster_url else None,
+        "hasnicetitle": bool(previous.hasnicetitle),
+        "video_type": previous.video_type if previous.video_type else "unknown"}
+    utils.database_updater(active_rip, job)
+    return True
@@ -14,6 +14,21 @@ from arm.ui import app, db  # noqa E402
 PROCESS_COMPLETE = "Handbrake processing complete"
 
 
+def wait_for_transcode_slot(job):
+    """
+    Wait until fewer than MAX_CONCURRENT_TRANSCODES HandBrakeCLI are running\n
+    Called before the transcode's disk space and I/O share are taken, so a queued job holds neither\n
+    :param job: Disc object\n
+    :return: None
+    """
+    utils.database_updater({'status': "waiting_transcode"}, job)
+    # TODO: send a notification that jobs are waiting ?
+    with utils.job_stage(job, "transcode_wait"):
+        utils.sleep_check_process("HandBrakeCLI", int(cfg.arm_config["MAX_CONCURRENT_TRANSCODES"]))
+    logging.debug("Setting job status to 'transcoding'")
+    utils.database_updater({'status': "transcoding"}, job)
+
+
 def handbrake_main_feature(srcpath, basepath, logfile, job):
     """
     Process dvd with main_feature enabled.\n\n
@@ -27,16 +42,12 @@ def handbrake_main_feature(srcpath, basepath, logfile, job):
     logging.debug("Handbrake starting: ")
     logging.debug(f"\n\r{job.pretty_table()}")
 
-    utils.database_updater({'status': "waiting_transcode"}, job)
-    # TODO: send a notification that jobs are waiting ?
-    utils.sleep_check_process("HandBrakeCLI", int(cfg.arm_config["MAX_CONCURRENT_TRANSCODES"]))
-    logging.debug("Setting job status to 'transcoding'")
-    utils.database_updater({'status': "transcoding"}, job)
     filename = os.path.join(basepath, job.title + "." + cfg.arm_config["DEST_EXT"])
     filepathname = os.path.join(basepath, filename)
     logging.info(f"Ripping title main_feature to {shlex.quote(filepathname)}")
 
-    get_track_info(srcpath, job)
+    with utils.job_stage(job, "transcode_scan"):
+        get_track_info(srcpath, job)
 
     track = job.tracks.filter_by(main_feature=True).first()
     if track is None:
@@ -59,7 +70,8 @@ def handbrake_main_feature(srcpath, basepath, logfile, job):
     logging.debug(f"Sending command: {cmd}")
 
     try:
-        subprocess.check_output(cmd, shell=True).decode("utf-8")
+        with utils.job_stage(job, "transcode", "main_feature"):
+            subprocess.check_output(cmd, shell=True).decode("utf-8")
         logging.info("Handbrake call successful")
         track.status = "success"
     except subprocess.CalledProcessError as hb_error:
@@ -86,16 +98,11 @@ def handbrake_all(srcpath, basepath, logfile, job):
     :param job: Disc object\n
     :return: None
     """
-    # Wait until there is a spot to transcode
-    job.status = "waiting_transcode"
-    db.session.commit()
-    utils.sleep_check_process("HandBrakeCLI", int(cfg.arm_config["MAX_CONCURRENT_TRANSCODES"]))
-    job.status = "transcoding"
-    db.session.commit()
     logging.info("Starting BluRay/DVD transcoding - All titles")
 
     hb_args, hb_preset = correct_hb_settings(job)
-    get_track_info(srcpath, job)
+    with utils.job_stage(job, "transcode_scan"):
+        get_track_info(srcpath, job)
 
     logging.debug(f"Total number of tracks is {job.no_of_titles}")
 
@@ -137,10 +144,11 @@ def handbrake_all(srcpath, basepath, logfile, job):
             logging.debug(f"Sending command: {cmd}")
 
             try:
-                hand_brake_output = subprocess.check_output(
-                    cmd,
-                    shell=True
-                ).decode("utf-8")
+                with utils.job_stage(job, "transcode", f"title {track.track_number}"):
+                    hand_brake_output = subprocess.check_output(
+                        cmd,
+                        shell=True
+                    ).decode("utf-8")
                 logging.debug(f"Handbrake exit code: {hand_brake_output}")
                 track.status = "success"
             except subprocess.CalledProcessError as hb_error:
@@ -185,12 +193,6 @@ def handbrake_mkv(srcpath, basepath, logfile, job):
     :param job: Disc object\n
     :return: None
     """
-    # Added to limit number of transcodes
-    job.status = "waiting_transcode"
-    db.session.commit()
-    utils.sleep_check_process("HandBrakeCLI", int(cfg.arm_config["MAX_CONCURRENT_TRANSCODES"]))
-    job.status = "transcoding"
-    db.session.commit()
     hb_args, hb_preset = correct_hb_settings(job)
 
     # This will fail if the directory raw gets deleted
@@ -219,10 +221,11 @@ def handbrake_mkv(srcpath, basepath, logfile, job):
         logging.debug(f"Sending command: {cmd}")
 
         try:
-            hand_break_output = subprocess.check_output(
-                cmd,
-                shell=True
-            ).decode("utf-8")
+            with utils.job_stage(job, "transcode", files):
+                hand_break_output = subprocess.check_output(
+                    cmd,
+                    shell=True
+                ).decode("utf-8")
             logging.debug(f"Handbrake exit code: {hand_break_output}")
         except subprocess.CalledProcessError as hb_error:
             err = f"Handbrake encoding of file {shlex.quote(files)} failed with code: {hb_error.returncode}" \
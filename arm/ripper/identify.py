@@ -3,20 +3,25 @@
 
 import os
 import logging
-import urllib
 import re
 import datetime
 import unicodedata
 import json
+from concurrent.futures import ThreadPoolExecutor
 import pydvdid
+import requests
 import xmltodict
 import arm.config.config as cfg
 
-from arm.ripper import utils
-from arm.ui import db
+from arm.ripper import utils, fingerprint
+from arm.ui import app, db
 
 # flake8: noqa: W605
 from arm.ui import utils as ui_utils
+from arm.ui import metadata
+
+# How many metadata lookups identify_loop runs at the same time
+IDENTIFY_WORKERS = 4
 
 
 def check_if_mounted(mount_return_code, findmnt_return_code):
@@ -60,8 +65,13 @@ def identify(job):
     if job.disctype in ["dvd", "bluray"]:
 
         logging.info("Disc identified as video")
+        fingerprints = fingerprint.disc_fingerprints(job) if mounted else []
+        fingerprint.record(job, fingerprints)
+        job.crc_id = dict(fingerprints).get("crc64", job.crc_id)
 
-        if cfg.arm_config["GET_VIDEO_TITLE"]:
+        if cfg.arm_config["GET_VIDEO_TITLE"] and identify_from_fingerprint(job, fingerprints):
+            logging.info(f"Disc title from a previous rip -  title:{job.title} year:{job.year}")
+        elif cfg.arm_config["GET_VIDEO_TITLE"]:
             res = False
             if job.disctype == "dvd":
                 res = identify_dvd(job)
@@ -81,6 +91,20 @@ def identify(job):
     os.system("umount " + job.devpath)
 
 
+def identify_from_fingerprint(job, fingerprints):
+    """
+    Reuse the title, year, type and poster of a previous rip of the same disc\n
+    :param job: Current job
+    :param list fingerprints: (kind, value) of the disc
+    :return: True if a previous rip was found, no web service needs asking
+    """
+    previous, _ = fingerprint.find_previous(job, fingerprints)
+    if previous is None or not previous.hasnicetitle:
+        return False
+    fingerprint.apply_previous(job, previous)
+    return True
+
+
 def identify_bluray(job):
     """ Get's Blu-Ray title by parsing XML in bdmt_eng.xml """
 
@@ -144,13 +168,14 @@ def identify_dvd(job):
     if not job.label or job.label == "":
         job.label = "not identified"
     try:
-        crc64 = pydvdid.compute(str(job.mountpoint))
+        # Normally already worked out for the disc fingerprint
+        crc64 = job.crc_id if job.crc_id else pydvdid.compute(str(job.mountpoint))
         dvd_title = f"{job.label}_{crc64}"
         logging.info(f"DVD CRC64 hash is: {crc64}")
         job.crc_id = str(crc64)
         urlstring = f"https://1337server.pythonanywhere.com/api/v1/?mode=s&crc64={crc64}"
         logging.debug(urlstring)
-        dvd_info_xml = urllib.request.urlopen(urlstring).read()
+        dvd_info_xml = metadata.provider_urlopen("arm", "crc64", urlstring)
         arm_api_json = json.loads(dvd_info_xml)
         logging.debug(f"dvd xml - {arm_api_json}")
         logging.debug(f"results = {arm_api_json['results']}")
@@ -171,6 +196,9 @@ def identify_dvd(job):
                 'hasnicetitle': True
             }
             utils.database_updater(args, job)
+    except requests.exceptions.RequestException as error:
+        logging.warning(f"ARM crc64 api unavailable, carrying on with the disc label - {error}")
+        dvd_title = str(job.label)
     except Exception as error:
         logging.error(f"Pydvdid failed with the error: {error}")
         dvd_title = str(job.label)
@@ -235,6 +263,8 @@ def update_job(job, search_results):
     # logging.debug(f"s =======  {search_results}")
     if 'Search' not in search_results:
         return None
+    # tmdb results only carry the tmdb id, look up the imdb id for the one we use
+    metadata.tmdb_resolve_imdb(search_results['Search'][0])
     new_year = search_results['Search'][0]['Year']
     title = utils.clean_for_filename(search_results['Search'][0]['Title'])
     logging.debug(f"Webservice successful.  New title is {title}.  New Year is: {new_year}")
@@ -254,6 +284,33 @@ def update_job(job, search_results):
     return utils.database_updater(args, job)
 
 
+def fetch_metadata(title=None, year=None):
+    """
+    Query OMDB or TMDB (as set by METADATA_PROVIDER) without touching the job\n
+    - TMDB returned queries are converted into the OMDB format
+    Safe to call from worker threads\n
+    :param title: this can either be a search string or movie/show title
+    :param year: the year of movie/show release
+    :return: json/dict object or None
+    """
+    search_results = None
+    with app.app_context():
+        try:
+            if cfg.arm_config['METADATA_PROVIDER'].lower() == "tmdb":
+                logging.debug("provider tmdb")
+                search_results = ui_utils.tmdb_search(title, year)
+            elif cfg.arm_config['METADATA_PROVIDER'].lower() == "omdb":
+                logging.debug("provider omdb")
+                search_results = ui_utils.call_omdb_api(str(title), str(year))
+            else:
+                logging.debug(cfg.arm_config['METADATA_PROVIDER'])
+                logging.debug("unknown provider - doing nothing, saying nothing. Getting Kryten")
+        except requests.exceptions.RequestException as error:
+            # Timeouts and an open circuit breaker end up here, the label is used for the title instead
+            logging.warning(f"Metadata provider unavailable for {title} ({year}) - {error}")
+    return search_results
+
+
 def metadata_selector(job, title=None, year=None):
     """
     Used to switch between OMDB or TMDB as the metadata provider\n
@@ -265,93 +322,68 @@ def metadata_selector(job, title=None, year=None):
 
     :return: json/dict object or None
     """
-    search_results = None
-    if cfg.arm_config['METADATA_PROVIDER'].lower() == "tmdb":
-        logging.debug("provider tmdb")
-        search_results = ui_utils.tmdb_search(title, year)
-        if search_results is not None:
-            update_job(job, search_results)
-    elif cfg.arm_config['METADATA_PROVIDER'].lower() == "omdb":
-        logging.debug("provider omdb")
-        search_results = ui_utils.call_omdb_api(str(title), str(year))
-        if search_results is not None:
-            update_job(job, search_results)
-    else:
-        logging.debug(cfg.arm_config['METADATA_PROVIDER'])
-        logging.debug("unknown provider - doing nothing, saying nothing. Getting Kryten")
+    search_results = fetch_metadata(title, year)
+    if search_results is not None:
+        update_job(job, search_results)
     return search_results
 
 
-def identify_loop(job, response, title, year):
+def candidate_queries(title, year):
     """
-
-    :param job:
-    :param response:
-    :param title:
-    :param year:
-    """
-    # handle failures
-    # this is a little kludgy, but it kind of works...
-    logging.debug(f"Response = {response}")
-    if response is None:
-        # try with year first
-        response = try_with_year(job, response, title, year)
-        # try submitting without the year
-        response = try_without_year(job, response, title)
-
-        if response is None:
-            while response is None and title.find("-") > 0:
-                title = title.rsplit('-', 1)[0]
-                logging.debug(f"Trying title: {title}")
-                response = metadata_selector(job, title, year)
-                logging.debug(f"response: {response}")
-
-            # if still fail, then try slicing off the last word in a loop
-            while response is None and title.count('+') > 0:
-                title = title.rsplit('+', 1)[0]
-                logging.debug(f"Trying title: {title}")
-                response = metadata_selector(job, title, year)
-                logging.debug(f"response: {response}")
-                if response is None:
-                    # Still failing - try the words we have without year
-                    logging.debug("Removing year...")
-                    response = metadata_selector(job, title)
-
-
-def try_without_year(job, response, title):
-    """
-
-    :param job:
-    :param response:
-    :param title:
-    :return:
+    Build every (title, year) query identify_loop will try, best first\n
+    With year, the year before (dvd releases often come out the year after the movie), without year,
+    then dropping '-' segments off the end and finally dropping '+' words off the end one at a time\n
+    :param str title: search title, words separated by +
+    :param year: year of release or None/""
+    :return: list of (title, year) tuples
     """
-    if response is None:
-        logging.debug("Removing year...")
-        response = metadata_selector(job, title)
-        logging.debug(f"response: {response}")
-    return response
+    candidates = []
+    if year:
+        candidates.append((title, str(year)))
+        candidates.append((title, str(int(year) - 1)))
+    candidates.append((title, None))
+    while title.find("-") > 0:
+        title = title.rsplit('-', 1)[0]
+        candidates.append((title, year))
+    while title.count('+') > 0:
+        title = title.rsplit('+', 1)[0]
+        candidates.append((title, year))
+        candidates.append((title, None))
+    # Keep the first (highest priority) copy of any repeated query
+    return list(dict.fromkeys(candidates))
 
 
-def try_with_year(job, response, title, year):
+def identify_loop(job, response, title, year):
     """
-
-    :param job:
-    :param response:
-    :param title:
-    :param year:
-    :return:
+    Try all the variations of the title at the same time and keep the best match\n
+    Queries run in a bounded thread pool, the result of the highest priority query that
+    found something wins. Once it's known the queries behind it are cancelled\n
+    :param job: The job class
+    :param response: result of the first lookup, nothing is done if it already found something
+    :param title: search title, words separated by +
+    :param year: year of release
     """
-    # If we have a response don't overwrite it
+    logging.debug(f"Response = {response}")
     if response is not None:
-        return response
-    if year:
-        response = metadata_selector(job, title, str(year))
-        logging.debug(f"response: {response}")
-    # If we still don't have a response try removing a year off
-    if response is None and year:
-        # This accounts for when
-        # the dvd release date is the year following the movie release date
-        logging.debug("Subtracting 1 year...")
-        response = metadata_selector(job, title, str(int(year) - 1))
-    return response
+        return
+    candidates = candidate_queries(title, year)
+    logging.debug(f"Trying {len(candidates)} title variations: {candidates}")
+    executor = ThreadPoolExecutor(max_workers=IDENTIFY_WORKERS, thread_name_prefix="identify")
+    futures = [executor.submit(fetch_metadata, query_title, query_year) for query_title, query_year in candidates]
+    try:
+        for (query_title, query_year), future in zip(candidates, futures):
+            try:
+                response = future.result()
+            except Exception as error:
+                logging.debug(f"Lookup for {query_title} ({query_year}) failed - {error}")
+                continue
+            logging.debug(f"Title: {query_title} Year: {query_year} response: {response}")
+            if response is not None:
+                update_job(job, response)
+                break
+    finally:
+        # Anything still queued is lower priority than the answer we have
+        # cancel_futures of shutdown() needs python 3.9, so cancel them here
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
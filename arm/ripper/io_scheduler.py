@@ -0,0 +1,248 @@
+"""
+Disk I/O scheduler - rip, transcode and finalize stages share the disks they use instead of all
+running at once
+
+Every stage names the paths it reads and writes, those are turned into the filesystems they're
+on (by st_dev, so RAW_PATH and TRANSCODE_PATH on the same disk count as one). Before it starts the
+stage adds an io_allocation row and waits until, on every filesystem it touches:
+- fewer than IO_<STAGE>_PER_DEVICE stages of its kind are running
+- its IO_<STAGE>_MBPS fits in what's left of IO_DEVICE_MBPS
+Each stage waits behind the stages of its kind that asked first on the same filesystem. 0 turns
+a limit off, and every limit is off in the arm.yaml that ships.
+
+The rippers are separate processes, the decisions are made under a lock file next to the
+database so two of them can't both take the last slot. The finalize copies are held to the MB/s
+they were given, MakeMKV and HandBrake can't be slowed down from here so their MB/s is only an
+estimate of what they use, counted against the budget.
+"""
+import datetime
+import fcntl
+import logging
+import os
+import stat
+import time
+from contextlib import contextmanager
+
+import psutil
+
+import arm.config.config as cfg
+from arm.models.io_allocation import IoAllocation
+from arm.ripper import utils
+from arm.ui import db
+
+# Seconds between checks while a stage waits
+POLL_INTERVAL = 5
+# Next to the database, held while a decision is made
+LOCK_FILE = ".io_scheduler.lock"
+MB = 1000 * 1000
+
+
+def stage_limits(stage):
+    """
+    The concurrency and MB/s of a stage from the arm.yaml\n
+    :return: (int stages per device or 0, int MB/s or 0)
+    """
+    per_device = int(cfg.arm_config.get(f"IO_{stage.upper()}_PER_DEVICE", 0) or 0)
+    mbps = int(cfg.arm_config.get(f"IO_{stage.upper()}_MBPS", 0) or 0)
+    return per_device, mbps
+
+
+def device_budget():
+    """MB/s each filesystem can give to all stages together, 0 for no limit"""
+    return int(cfg.arm_config.get("IO_DEVICE_MBPS", 0) or 0)
+
+
+def device_of(path):
+    """
+    The filesystem a path is on, the path doesn't have to exist yet\n
+    :return: (str major:minor, str mount point) or None for a drive like /dev/sr0
+    """
+    if not path:
+        return None
+    path = os.path.abspath(str(path))
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    path_stat = os.stat(path)
+    if stat.S_ISBLK(path_stat.st_mode):
+        return None
+    st_dev = path_stat.st_dev
+    mount = path
+    while not os.path.ismount(mount):
+        mount = os.path.dirname(mount)
+    return f"{os.major(st_dev)}:{os.minor(st_dev)}", mount
+
+
+def device_name(device):
+    """
+    The kernel name of a device for the UI\n
+    :param device: major:minor
+    :return: str like sda1, or the major:minor when it isn't a block device (tmpfs, overlay)
+    """
+    sys_path = os.path.join("/sys/dev/block", device)
+    return os.path.basename(os.path.realpath(sys_path)) if os.path.exists(sys_path) else device
+
+
+@contextmanager
+def decision_lock(lock_file=LOCK_FILE):
+    """Only one process decides at a time"""
+    with open(os.path.join(os.path.dirname(cfg.arm_config['DBFILE']), lock_file), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def clear_stale():
+    """Drop the allocations of ripper processes that have gone, the caller commits"""
+    for allocation in IoAllocation.query.all():
+        if allocation.pid is not None and not psutil.pid_exists(allocation.pid):
+            logging.info(f"Releasing {allocation.stage} I/O of job {allocation.job_id}, its ripper has stopped")
+            db.session.delete(allocation)
+
+
+def blocked_by(allocation, others):
+    """
+    Why an allocation can't start yet\n
+    :param IoAllocation allocation: the waiting allocation
+    :param list others: every other allocation
+    :return: str reason or None when it can start
+    """
+    per_device, _ = stage_limits(allocation.stage)
+    budget = device_budget()
+    for device in allocation.device_list():
+        sharing = [other for other in others if device in other.device_list()]
+        active = [other for other in sharing if other.status == "active"]
+        if any(other.status == "waiting" and other.stage == allocation.stage
+               and other.allocation_id < allocation.allocation_id for other in sharing):
+            return f"queued behind another {allocation.stage} on {device_name(device)}"
+        if per_device and sum(1 for other in active if other.stage == allocation.stage) >= per_device:
+            return f"{per_device} {allocation.stage} already running on {device_name(device)}"
+        used = sum(other.mbps or 0 for other in active)
+        # A stage bigger than the whole budget still runs on its own
+        if budget and active and used + (allocation.mbps or 0) > budget:
+            return f"{used} of {budget} MB/s in use on {device_name(device)}"
+    return None
+
+
+def try_start(allocation):
+    """
+    Start the allocation if it fits\n
+    :return: str reason it has to wait, None once it's started
+    """
+    with decision_lock():
+        try:
+            clear_stale()
+            others = IoAllocation.query.filter(IoAllocation.allocation_id != allocation.allocation_id).all()
+            reason = blocked_by(allocation, others)
+            if reason is None:
+                allocation.status = "active"
+                allocation.started = datetime.datetime.now()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return reason
+
+
+def request(job, stage, reads=(), writes=()):
+    """
+    Add the allocation for a stage, it waits until acquire() starts it\n
+    :return: IoAllocation or None when the stage doesn't use any disk the scheduler manages
+    """
+    reads = [found for found in map(device_of, reads) if found is not None]
+    writes = [found for found in map(device_of, writes) if found is not None]
+    if not reads and not writes:
+        return None
+    _, mbps = stage_limits(stage)
+    allocation = IoAllocation(job.job_id if job is not None else None, stage,
+                              sorted({device for device, _ in reads + writes}),
+                              sorted({mount for _, mount in reads}), sorted({mount for _, mount in writes}),
+                              mbps, os.getpid())
+    try:
+        db.session.add(allocation)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return allocation
+
+
+def acquire(job, allocation):
+    """Wait until the allocation can start, the wait is recorded as an io_wait stage of the job"""
+    reason = try_start(allocation)
+    if reason is not None:
+        with utils.job_stage(job, "io_wait", f"{allocation.stage} - {reason}") as wait_stage:
+            logging.info(f"Waiting to {allocation.stage} - {reason}")
+            while reason is not None:
+                time.sleep(POLL_INTERVAL)
+                reported, reason = reason, try_start(allocation)
+                if reason is not None and reason != reported:
+                    logging.info(f"Waiting to {allocation.stage} - {reason}")
+                    if wait_stage is not None:
+                        utils.database_updater({'detail': f"{allocation.stage} - {reason}"}, wait_stage)
+    logging.info(f"Starting {allocation.stage} on {allocation.devices}"
+                 f"{f' at {allocation.mbps} MB/s' if allocation.mbps else ''}")
+
+
+def release(allocation):
+    """Give the allocation's share back"""
+    try:
+        db.session.delete(allocation)
+        db.session.commit()
+    except Exception as error:
+        db.session.rollback()
+        logging.error(f"Couldn't release the {allocation.stage} I/O allocation - {error}")
+
+
+@contextmanager
+def allocation_for(job, stage, reads=(), writes=()):
+    """
+    Hold a share of the disks a stage uses while the block runs\n
+    Usage: with allocation_for(job, "rip", writes=[raw_path]) as rate: ...\n
+    :param job: Current job
+    :param str stage: rip, transcode or finalize
+    :param reads: paths the stage reads from
+    :param writes: paths the stage writes to
+    :return: bytes per second the stage was given, 0 for no limit
+    """
+    allocation = None
+    try:
+        allocation = request(job, stage, reads, writes)
+        if allocation is not None:
+            acquire(job, allocation)
+    except Exception as error:
+        # The stage runs without the scheduler rather than not at all
+        logging.error(f"Couldn't schedule {stage} I/O, running it straight away - {error}")
+        if allocation is not None:
+            release(allocation)
+            allocation = None
+    if allocation is None:
+        yield 0
+        return
+    try:
+        yield (allocation.mbps or 0) * MB
+    finally:
+        release(allocation)
+
+
+def snapshot():
+    """
+    The allocations by filesystem for the UI\n
+    :return: list of dicts with device, name, mounts, budget, used MB/s and the allocations on it
+    """
+    devices = {}
+    for allocation in IoAllocation.query.order_by(IoAllocation.allocation_id).all():
+        for device in allocation.device_list():
+            entry = devices.setdefault(device, {'device': device, 'name': device_name(device), 'mounts': set(),
+                                                'budget': device_budget(), 'used': 0, 'allocations': []})
+            if allocation.status == "active":
+                entry['used'] += allocation.mbps or 0
+            entry['allocations'].append(allocation)
+        for mount in filter(None, f"{allocation.reads or ''},{allocation.writes or ''}".split(",")):
+            found = device_of(mount)
+            if found is not None and found[0] in devices:
+                devices[found[0]]['mounts'].add(mount)
+    for entry in devices.values():
+        entry['mounts'] = sorted(entry['mounts'])
+    return sorted(devices.values(), key=lambda entry: entry['name'])
@@ -0,0 +1,277 @@
+"""
+Log maintenance - compress the logs of finished jobs and keep the log folder inside its budgets
+
+MakeMKV progress logs and HandBrake logs can be hundreds of MB each. Once a job has finished its
+logs are gzipped in place (x.log becomes x.log.gz), logs older than LOGLIFE days are deleted and
+then the oldest logs are deleted until the folder fits in LOG_MAX_SIZE_MB. It runs in a
+background thread so the job doesn't wait for it, and only one ARM process does it at a time.
+
+Readers use resolve/open_log/tail_lines, which find and read x.log.gz when x.log has gone.
+"""
+import codecs
+import collections
+import fcntl
+import gzip
+import logging
+import os
+import shutil
+import threading
+import time
+
+GZ_SUFFIX = ".gz"
+# Added to a log while it's being compressed
+TMP_SUFFIX = ".arm-part"
+# Held while a process maintains the logs
+LOCK_FILE = ".maintenance.lock"
+# Seconds a log has to go unwritten before it's compressed, even when no running job owns it
+COMPRESS_AFTER = 600
+# Bytes read at a time when looking for the last lines of a log
+TAIL_BLOCK = 64 * 1024
+
+
+def resolve(path):
+    """
+    Find a log that may have been compressed\n
+    :param str path: path of the log as the job knows it e.g. /home/arm/logs/x.log
+    :return: str path of x.log, or of x.log.gz if only that exists
+    """
+    path = str(path)
+    if not os.path.isfile(path) and os.path.isfile(path + GZ_SUFFIX):
+        return path + GZ_SUFFIX
+    return path
+
+
+def open_log(path):
+    """
+    Open a log as text whether or not it has been compressed\n
+    :raises FileNotFoundError: if neither the log nor its .gz exist
+    """
+    path = resolve(path)
+    if path.endswith(GZ_SUFFIX):
+        return gzip.open(path, "rt", encoding="utf8", errors="ignore")
+    return open(path, "r", encoding="utf8", errors="ignore")
+
+
+def tail_lines(path, count):
+    """
+    Last lines of a log the same as tail -n, read from the end so only the tail of a big log is read\n
+    The lines are then split on carriage returns too, which HandBrake and abcde use for their progress\n
+    :param int count: number of lines
+    :return: list of str
+    :raises FileNotFoundError: if neither the log nor its .gz exist
+    """
+    path = resolve(path)
+    if path.endswith(GZ_SUFFIX):
+        # gzip can't be read backwards, these are only the logs of finished jobs
+        with gzip.open(path, "rb") as reader:
+            lines = list(collections.deque(reader, maxlen=count))
+    else:
+        with open(path, "rb") as reader:
+            position = reader.seek(0, os.SEEK_END)
+            data = b""
+            while position > 0 and data.count(b"\n") <= count:
+                size = min(TAIL_BLOCK, position)
+                position -= size
+                reader.seek(position)
+                data = reader.read(size) + data
+        lines = data.split(b"\n")
+        # The last line is empty when the log ends in a newline, the first may only be part of a line
+        lines = lines[:-1] if not lines[-1] else lines
+        lines = [line + b"\n" for line in lines]
+    return b"".join(lines[-count:]).decode("utf8", errors="ignore").splitlines()
+
+
+def log_size(path):
+    """
+    Size of a log once it's decompressed\n
+    gzip keeps the size modulo 4 GiB in its last 4 bytes, far more than any log
+    :raises FileNotFoundError: if neither the log nor its .gz exist
+    """
+    path = resolve(path)
+    if not path.endswith(GZ_SUFFIX):
+        return os.path.getsize(path)
+    with open(path, "rb") as reader:
+        reader.seek(-4, os.SEEK_END)
+        return int.from_bytes(reader.read(4), "little")
+
+
+def tail_offset(path, count):
+    """
+    Where the last lines of a log start\n
+    :param int count: number of lines
+    :return: int byte offset, the end of the log when no lines are asked for
+    :raises FileNotFoundError: if neither the log nor its .gz exist
+    """
+    path = resolve(path)
+    if count <= 0:
+        return log_size(path)
+    if path.endswith(GZ_SUFFIX):
+        starts = collections.deque([0], maxlen=count)
+        offset = 0
+        with gzip.open(path, "rb") as reader:
+            for line in reader:
+                starts.append(offset)
+                offset += len(line)
+        return starts[0]
+    with open(path, "rb") as reader:
+        position = reader.seek(0, os.SEEK_END)
+        data = b""
+        while position > 0 and data.count(b"\n") <= count:
+            block = min(TAIL_BLOCK, position)
+            position -= block
+            reader.seek(position)
+            data = reader.read(block) + data
+    # A line starts after every newline but the one ending the log
+    starts = [index + 1 for index, byte in enumerate(data[:-1]) if byte == 10]
+    if position == 0:
+        starts.insert(0, 0)
+    return position + starts[-count] if len(starts) >= count else 0
+
+
+def read_range(path, offset=0, limit=None, chunk=TAIL_BLOCK):
+    """
+    Read part of a log a chunk at a time, so a big log is never held in memory\n
+    :param int offset: byte offset in the decompressed log
+    :param int limit: bytes to read, None reads to the end
+    :return: iterator of str, multibyte characters cut by the range are dropped
+    :raises FileNotFoundError: if neither the log nor its .gz exist
+    """
+    path = resolve(path)
+    reader = gzip.open(path, "rb") if path.endswith(GZ_SUFFIX) else open(path, "rb")
+    decoder = codecs.getincrementaldecoder("utf8")(errors="ignore")
+
+    def generate():
+        remaining = limit
+        with reader:
+            reader.seek(offset)
+            while remaining is None or remaining > 0:
+                data = reader.read(chunk if remaining is None else min(chunk, remaining))
+                if not data:
+                    break
+                if remaining is not None:
+                    remaining -= len(data)
+                text = decoder.decode(data)
+                if text:
+                    yield text
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield text
+    return generate()
+
+
+def log_files(logpath):
+    """
+    Every log in the log folder and its progress folder\n
+    :return: list of os.DirEntry
+    """
+    files = []
+    for folder in (logpath, os.path.join(logpath, "progress")):
+        try:
+            with os.scandir(folder) as entries:
+                files.extend(entry for entry in entries if entry.is_file(follow_symlinks=False)
+                             and entry.name.endswith((".log", ".log" + GZ_SUFFIX, TMP_SUFFIX)))
+        except FileNotFoundError:
+            continue
+    return files
+
+
+def compress(path):
+    """
+    Gzip a log in place, keeping its times\n
+    The log is left as it was if it's written to while it's being compressed\n
+    :return: True if it was compressed
+    """
+    tmp_path = path + GZ_SUFFIX + TMP_SUFFIX
+    before = os.stat(path)
+    try:
+        with open(path, "rb") as reader, gzip.open(tmp_path, "wb") as writer:
+            shutil.copyfileobj(reader, writer, TAIL_BLOCK * 16)
+        after = os.stat(path)
+        if (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+            logging.debug(f"{path} changed while it was being compressed, leaving it")
+            os.unlink(tmp_path)
+            return False
+        os.utime(tmp_path, ns=(before.st_atime_ns, before.st_mtime_ns))
+        os.replace(tmp_path, path + GZ_SUFFIX)
+        os.unlink(path)
+    except BaseException:
+        if os.path.isfile(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return True
+
+
+def maintain(logpath, loglife, max_bytes, active=()):
+    """
+    Compress the logs of finished jobs, then delete logs by age and by the size budget\n
+    :param str logpath: LOGPATH
+    :param int loglife: days to keep logs, 0 keeps them forever
+    :param int max_bytes: total size the logs may use, 0 for no limit
+    :param active: log paths that belong to running jobs, they are never touched
+    :return: dict of what was done, or None if another process is already doing it
+    """
+    active = {os.path.realpath(path) for path in active}
+    summary = {'compressed': 0, 'deleted': 0, 'freed': 0, 'size': 0}
+    with open(os.path.join(logpath, LOCK_FILE), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logging.debug("Logs are already being maintained by another job")
+            return None
+        now = time.time()
+        # (mtime, size, path) of the logs that may be deleted
+        finished = []
+        for entry in log_files(logpath):
+            path = entry.path
+            if os.path.realpath(path) in active:
+                summary['size'] += entry.stat().st_size
+                continue
+            try:
+                if path.endswith(TMP_SUFFIX):
+                    # Left by a process that stopped part way through compressing
+                    os.unlink(path)
+                    continue
+                if path.endswith(".log") and entry.stat().st_mtime < now - COMPRESS_AFTER and compress(path):
+                    summary['compressed'] += 1
+                    path += GZ_SUFFIX
+                stat = os.stat(path)
+            except OSError as error:
+                logging.warning(f"Couldn't compress log {path} - {error}")
+                continue
+            finished.append((stat.st_mtime, stat.st_size, path))
+            summary['size'] += stat.st_size
+
+        finished.sort()
+        for mtime, size, path in finished:
+            too_old = loglife > 0 and mtime < now - loglife * 86400
+            too_big = 0 < max_bytes < summary['size']
+            if not too_old and not too_big:
+                continue
+            try:
+                os.unlink(path)
+            except OSError as error:
+                logging.warning(f"Couldn't delete log {path} - {error}")
+                continue
+            logging.info(f"Deleted log file: {os.path.basename(path)} ({'age' if too_old else 'size budget'})")
+            summary['deleted'] += 1
+            summary['freed'] += size
+            summary['size'] -= size
+    logging.info(f"Log maintenance compressed {summary['compressed']} and deleted {summary['deleted']} logs, "
+                 f"{summary['freed'] / 1e6:.1f} MB freed, {summary['size'] / 1e6:.1f} MB in use")
+    return summary
+
+
+def start(logpath, loglife, max_bytes, active=()):
+    """
+    Maintain the logs in a background thread\n
+    :return: the thread
+    """
+    def run():
+        try:
+            maintain(logpath, loglife, max_bytes, active)
+        except Exception as error:
+            logging.error(f"Log maintenance failed - {error}", exc_info=True)
+
+    thread = threading.Thread(target=run, name="log_maintenance", daemon=True)
+    thread.start()
+    return thread
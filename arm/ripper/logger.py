@@ -8,7 +8,6 @@ Also triggers CD identification
 import os
 import logging
 import logging.handlers
-import time
 
 import arm.config.config as cfg
 
@@ -65,33 +64,6 @@ def clean_loggers():
         return
 
 
-def clean_up_logs(logpath, loglife):
-    """
-    Delete all log files older than {loglife} days\n
-    if {loglife} is 0 don't delete anything\n
-    :param logpath: path of log files\n
-    :param loglife: days to let logs live\n
-    :return:
-    """
-    if loglife < 1:
-        logging.info("loglife is set to 0. Removal of logs is disabled")
-        return False
-    now = time.time()
-    logging.info(f"Looking for log files older than {loglife} days old.")
-
-    logs_folders = [logpath, os.path.join(logpath, 'progress')]
-    # Loop through each log path
-    for log_dir in logs_folders:
-        logging.info(f"Checking path {log_dir} for old log files...")
-        # Loop through each file in current folder and remove files older than set in arm.yaml
-        for filename in os.listdir(log_dir):
-            fullname = os.path.join(log_dir, filename)
-            if fullname.endswith(".log") and os.stat(fullname).st_mtime < now - loglife * 86400:
-                logging.info(f"Deleting log file: {filename}")
-                os.remove(fullname)
-    return True
-
-
 def create_logger(app_name, log_level=logging.DEBUG, stdout=True, syslog=False, file=False):
     """
     From: https://gist.github.com/danielkraic/a1657f19bad9c158cbf9532e1ed1503b\n
@@ -19,12 +19,15 @@ import psutil  # noqa E402
 # set the PATH to /opt/arm so we can handle imports properly
 sys.path.append("/opt/arm")
 
-from arm.ripper import logger, utils, identify, arm_ripper, music_brainz  # noqa: E402
+from arm.ripper import logger, utils, identify, arm_ripper, music_brainz, music_ripper, fingerprint  # noqa: E402
+from arm.ripper import disk_space, drive_state, log_maintenance, notify_queue  # noqa: E402
 import arm.config.config as cfg  # noqa E402
 from arm.models.config import Config  # noqa: E402
 from arm.models.job import Job  # noqa: E402
 from arm.ui import app, db, constants  # noqa E402
 from arm.ui.settings import DriveUtils as drive_utils # noqa E402
+from arm.ui.notifications import bulk as notification_bulk  # noqa E402
+from arm.ui.metrics import shared as shared_metrics  # noqa E402
 import arm.config.config as cfg  # noqa E402
 from arm.ripper.ARMInfo import ARMInfo  # noqa E402
 
@@ -41,8 +44,7 @@ def log_udev_params(dev_path):
     """log all udev parameters"""
 
     logging.debug("******************* Logging udev attributes *******************")
-    context = pyudev.Context()
-    device = pyudev.Devices.from_device_file(context, dev_path)
+    device = pyudev.Devices.from_device_file(drive_state.get_context(), dev_path)
     for key, value in device.items():
         logging.debug(f"{key}:{value}")
     logging.debug("******************* End udev attributes *******************")
@@ -91,15 +93,18 @@ def check_fstab():
 def main(logfile, job, protection=0):
     """main disc processing function"""
     logging.info("Starting Disc identification")
-    identify.identify(job)
+    with utils.job_stage(job, "identify"):
+        identify.identify(job)
 
-    # Check db for entries matching the crc and successful
-    have_dupes = utils.job_dupe_check(job)
+    # Check db for successful jobs with the same disc fingerprint
+    with utils.job_stage(job, "dupe_check"):
+        have_dupes = fingerprint.job_dupe_check(job)
     logging.debug(f"Value of have_dupes: {have_dupes}")
 
     utils.notify_entry(job)
     # Check if user has manual wait time enabled
-    utils.check_for_wait(job)
+    with utils.job_stage(job, "manual_wait"):
+        utils.check_for_wait(job)
 
     log_arm_params(job)
     check_fstab()
@@ -113,7 +118,9 @@ def main(logfile, job, protection=0):
     elif job.disctype == "music":
         # Try to recheck music disc for auto ident
         music_brainz.main(job)
-        if utils.rip_music(job, logfile):
+        # Records its own rip and encode stages, the disc is ejected between them
+        music_ripped = music_ripper.rip_music(job, logfile)
+        if music_ripped:
             utils.notify(job, constants.NOTIFY_TITLE, f"Music CD: {job.title} {constants.PROCESS_COMPLETE}")
             utils.scan_emby()
             # This shouldn't be needed. but to be safe
@@ -128,7 +135,9 @@ def main(logfile, job, protection=0):
     # Type: Data
     elif job.disctype == "data":
         logging.info("Disc identified as data")
-        if utils.rip_data(job):
+        with utils.job_stage(job, "rip") as rip_stage:
+            data_ripped = utils.rip_data(job, rip_stage)
+        if data_ripped:
             utils.notify(job, constants.NOTIFY_TITLE, f"Data disc: {job.label} copying complete. ")
         else:
             logging.info("Data rip failed.  See previous errors.  Exiting.")
@@ -151,14 +160,8 @@ if __name__ == "__main__":
 
     # With some drives and some disks, there is a race condition between creating the Job()
     # below and the drive being ready, so give it a chance to get ready (observed with LG SP80NB80)
-    for i in range(10):
-        if utils.get_cdrom_status(devpath) != 4:
-            logging.info(f"[{i} of 10] Drive appears to be empty or is not ready.  Waiting 1s")
-            arm_log.info(f"[{i} of 10] Drive appears to be empty or is not ready.  Waiting 1s")
-            time.sleep(1)
-
-    # Exit if drive isn't ready
-    if utils.get_cdrom_status(devpath) != 4:
+    # Wait for the drive to report the disc is ready, exit if it doesn't
+    if not drive_state.wait_for_media(devpath, int(cfg.arm_config.get('DRIVE_READY_TIMEOUT', 10))):
         # This should really never trigger now as arm_wrapper should be taking care of this.
         logging.info("Drive appears to be empty or is not ready.  Exiting ARM.")
         arm_log.info("Drive appears to be empty or is not ready.  Exiting ARM.")
@@ -201,11 +204,16 @@ if __name__ == "__main__":
     with open(os.path.join(cfg.arm_config["INSTALLPATH"], 'VERSION')) as version_file:
         version = version_file.read().strip()
 
-    # Delete old log files
-    logger.clean_up_logs(cfg.arm_config["LOGPATH"], cfg.arm_config["LOGLIFE"])
     logging.info(f"Job: {job.label}")  # This will sometimes be none
     # Check for zombie jobs and update status to failed
     utils.clean_old_jobs()
+    # Hand what this ripper records to /metrics
+    shared_metrics.start()
+    # Compress and delete old log files in the background
+    log_maintenance.start(cfg.arm_config["LOGPATH"], int(cfg.arm_config["LOGLIFE"]),
+                          int(cfg.arm_config.get("LOG_MAX_SIZE_MB", 0)) * 1024 * 1024, utils.active_logs())
+    # Keep the notifications table bounded
+    notification_bulk.apply_retention()
     # Log all params/attribs from the drive
     log_udev_params(devpath)
 
@@ -229,3 +237,7 @@ if __name__ == "__main__":
         hours, minutes = divmod(minutes, 60)
         job.job_length = f'{hours:d}:{minutes:02d}:{seconds:02d}'
         db.session.commit()
+        # The job's files are moved, deleted or left behind by now
+        disk_space.release_job(job)
+        # Deliver the notifications of this job before the ripper exits
+        notify_queue.flush(int(cfg.arm_config.get('NOTIFY_FLUSH_TIMEOUT', 60)))
@@ -8,7 +8,7 @@ import subprocess
 import shlex
 
 from arm.models.track import Track
-from arm.ripper import utils  # noqa: E402
+from arm.ripper import utils, disk_space, io_scheduler  # noqa: E402
 from arm.ui import db  # noqa: F401, E402
 import arm.config.config as cfg  # noqa E402
 
@@ -35,53 +35,61 @@ def makemkv(logfile, job):
     :return: path to ripped files.
     """
 
-    # confirm MKV is working, beta key hasn't expired
-    prep_mkv(logfile)
-    logging.info(f"Starting MakeMKV rip. Method is {job.config.RIPMETHOD}")
-    # get MakeMKV disc number
-    logging.debug("Getting MakeMKV disc number")
-    cmd = f"makemkvcon -r info disc:9999 | grep {job.devpath} | grep -oP '(?<=:).*?(?=,)'"
-    logging.debug(f"Using command: {cmd}")
-    try:
-        mdisc = subprocess.check_output(
-            cmd,
-            shell=True
-        ).decode("utf-8")
-        logging.info(f"MakeMKV disc number: {mdisc.strip()}")
-        logging.debug(f"Disk raw number: {mdisc}")
-    except subprocess.CalledProcessError as mdisc_error:
-        raise MakeMkvRuntimeError(mdisc_error) from mdisc_error
+    with utils.job_stage(job, "mkv_info"):
+        # confirm MKV is working, beta key hasn't expired
+        prep_mkv(logfile)
+        logging.info(f"Starting MakeMKV rip. Method is {job.config.RIPMETHOD}")
+        # get MakeMKV disc number
+        logging.debug("Getting MakeMKV disc number")
+        cmd = f"makemkvcon -r info disc:9999 | grep {job.devpath} | grep -oP '(?<=:).*?(?=,)'"
+        logging.debug(f"Using command: {cmd}")
+        try:
+            mdisc = subprocess.check_output(
+                cmd,
+                shell=True
+            ).decode("utf-8")
+            logging.info(f"MakeMKV disc number: {mdisc.strip()}")
+            logging.debug(f"Disk raw number: {mdisc}")
+        except subprocess.CalledProcessError as mdisc_error:
+            raise MakeMkvRuntimeError(mdisc_error) from mdisc_error
+        backup = job.config.RIPMETHOD in ("backup", "backup_dvd") and job.disctype == "bluray"
+        if not backup and (job.config.RIPMETHOD == "mkv" or job.disctype == "dvd"):
+            # The track lengths are needed to work out the space the rip needs
+            get_track_info(mdisc, job)
 
     # get filesystem in order
     rawpath = setup_rawpath(job, os.path.join(str(job.config.RAW_PATH), str(job.title)))
     logging.info(f"Processing files to: {rawpath}")
-    # Rip bluray
-    if (job.config.RIPMETHOD == "backup" or job.config.RIPMETHOD == "backup_dvd") and job.disctype == "bluray":
-        # backup method
-        cmd = f'makemkvcon backup --decrypt {job.config.MKV_ARGS} --minlength={job.config.MINLENGTH}' \
-              f'--progress={os.path.join(job.config.LOGPATH, "progress", str(job.job_id))}.log ' \
-              f'--messages=-stdout ' \
-              f'-r disc:{mdisc.strip()} {shlex.quote(rawpath)}'
-        logging.info("Backing up disc")
-        run_makemkv(cmd, logfile)
-    # Rip Blu-ray without enhanced protection or dvd disc
-    elif job.config.RIPMETHOD == "mkv" or job.disctype == "dvd":
-        get_track_info(mdisc, job)
-        if job.config.MAINFEATURE:
-            logging.info("Trying to find mainfeature")
-            track = Track.query.filter_by(job_id=job.job_id).order_by(Track.length.desc()).first()
-            rip_mainfeature(job, track, logfile, rawpath)
-        # if no maximum length, process the whole disc in one command
-        elif int(job.config.MAXLENGTH) > 99998:
-            cmd = f'makemkvcon mkv {job.config.MKV_ARGS} -r ' \
+    # Wait for the space before taking a rip slot, so a job short of space doesn't hold up other drives
+    with disk_space.reserve(job, "rip", rawpath, job.devpath), \
+            io_scheduler.allocation_for(job, "rip", writes=[rawpath]), \
+            utils.job_stage(job, "rip", job.config.RIPMETHOD):
+        # Rip bluray
+        if backup:
+            # backup method
+            cmd = f'makemkvcon backup --decrypt {job.config.MKV_ARGS} --minlength={job.config.MINLENGTH}' \
                   f'--progress={os.path.join(job.config.LOGPATH, "progress", str(job.job_id))}.log ' \
                   f'--messages=-stdout ' \
-                  f'dev:{job.devpath} all {shlex.quote(rawpath)} --minlength={job.config.MINLENGTH}'
+                  f'-r disc:{mdisc.strip()} {shlex.quote(rawpath)}'
+            logging.info("Backing up disc")
             run_makemkv(cmd, logfile)
+        # Rip Blu-ray without enhanced protection or dvd disc
+        elif job.config.RIPMETHOD == "mkv" or job.disctype == "dvd":
+            if job.config.MAINFEATURE:
+                logging.info("Trying to find mainfeature")
+                track = Track.query.filter_by(job_id=job.job_id).order_by(Track.length.desc()).first()
+                rip_mainfeature(job, track, logfile, rawpath)
+            # if no maximum length, process the whole disc in one command
+            elif int(job.config.MAXLENGTH) > 99998:
+                cmd = f'makemkvcon mkv {job.config.MKV_ARGS} -r ' \
+                      f'--progress={os.path.join(job.config.LOGPATH, "progress", str(job.job_id))}.log ' \
+                      f'--messages=-stdout ' \
+                      f'dev:{job.devpath} all {shlex.quote(rawpath)} --minlength={job.config.MINLENGTH}'
+                run_makemkv(cmd, logfile)
+            else:
+                process_single_tracks(job, logfile, rawpath)
         else:
-            process_single_tracks(job, logfile, rawpath)
-    else:
-        logging.info("I'm confused what to do....  Passing on MakeMKV")
+            logging.info("I'm confused what to do....  Passing on MakeMKV")
 
     job.eject()
     logging.info(f"Exiting MakeMKV processing with return value of: {rawpath}")
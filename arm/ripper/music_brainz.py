@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Module to connect to A.R.M to MusicBrainz API"""
 
+import json
 import logging
 import re
 import musicbrainzngs as mb
@@ -9,10 +10,20 @@ import arm.config.config as cfg
 from discid import read, Disc
 
 from arm.ripper import utils as u
+from arm.ripper import fingerprint
+from arm.ui import http_client
+from arm.ui import metadata
 import werkzeug
 
 werkzeug.cached_property = werkzeug.utils.cached_property
 
+# Everything music_brainz and get_title read from the release, fetched in the one request
+RELEASE_INCLUDES = ['artist-credits', 'recordings']
+# The disc is only read once per job, keyed by the device
+_disc_ids = {}
+# Answers for this job, keyed by disc/release id - includes the lookups that weren't found
+_responses = {}
+
 
 def main(disc):
     """
@@ -21,19 +32,85 @@ def main(disc):
     or "".
     """
     discid = get_disc_id(disc)
+    fingerprints = [("musicbrainz", discid.id)] if discid else []
+    fingerprint.record(disc, fingerprints)
     if cfg.arm_config['GET_AUDIO_TITLE'] == 'musicbrainz':
+        # A cd that has been ripped before doesn't need musicbrainz
+        previous, _ = fingerprint.find_previous(disc, fingerprints)
+        if previous is not None and previous.hasnicetitle:
+            fingerprint.apply_previous(disc, previous)
+            u.database_updater({'crc_id': previous.crc_id, 'no_of_titles': previous.no_of_titles}, disc)
+            fingerprint.copy_tracks(disc, previous)
+            return previous.title
         return music_brainz(discid, disc)
     return ""
 
 
+def mb_request(func, *args, **kwargs):
+    """
+    Call musicbrainzngs behind the musicbrainz circuit breaker\n
+    musicbrainzngs makes its own connections so only network errors count against the breaker,
+    an open breaker is raised as a NetworkError so the callers handling still applies\n
+    :param func: musicbrainzngs function to call
+    :return: the result of func
+    """
+    try:
+        with http_client.guard("musicbrainz", errors=(mb.NetworkError,)):
+            return func(*args, **kwargs)
+    except http_client.CircuitOpenError as error:
+        raise mb.NetworkError(message=str(error), cause=error)
+
+
 def get_disc_id(disc):
     """
-    Calculates the identifier of the disc
+    Calculates the identifier of the disc, the disc is only read the first time
 
     return:
     identification object from discid package
     """
-    return read(disc.devpath)
+    if disc.devpath not in _disc_ids:
+        _disc_ids[disc.devpath] = read(disc.devpath)
+    return _disc_ids[disc.devpath]
+
+
+def cached_request(endpoint, key, func, *args, **kwargs):
+    """
+    Call musicbrainz once per key\n
+    Found answers are kept in the metadata cache so a disc that's inserted again isn't looked up,
+    not found is only remembered for this job. Network errors aren't remembered at all\n
+    :param str endpoint: releases/coverart
+    :param str key: disc id or release id
+    :param func: musicbrainzngs function to call
+    :return: the result of func
+    :raises mb.WebServiceError: if musicbrainz couldn't answer
+    """
+    if (endpoint, key) in _responses:
+        response = _responses[(endpoint, key)]
+        if isinstance(response, mb.WebServiceError):
+            raise response
+        return response
+    body = metadata.cache_lookup("musicbrainz", endpoint, key)
+    if body is not None:
+        response = json.loads(body)
+    else:
+        mb.set_useragent("arm", "v2_devel")
+        try:
+            response = mb_request(func, *args, **kwargs)
+        except mb.ResponseError as error:
+            _responses[(endpoint, key)] = error
+            raise
+        metadata.cache_store("musicbrainz", endpoint, key, json.dumps(response))
+    _responses[(endpoint, key)] = response
+    return response
+
+
+def get_releases(discid):
+    """
+    The releases for a disc, every caller shares the one lookup per disc id\n
+    :param discid: identification object from discid package
+    :return: dict from musicbrainz
+    """
+    return cached_request("releases", discid.id, mb.get_releases_by_discid, discid.id, includes=RELEASE_INCLUDES)
 
 
 def music_brainz(discid, job):
@@ -43,9 +120,8 @@ def music_brainz(discid, job):
     :param job: the job class/obj
     :return: the label of the disc as a string or "" if nothing was found
     """
-    mb.set_useragent("arm", "v2_devel")
     try:
-        infos = mb.get_releases_by_discid(discid, includes=['artist-credits', 'recordings'])
+        infos = get_releases(discid)
         logging.debug(f"Infos: {infos}")
         logging.debug(f"discid = {discid}")
         if 'disc' in infos:
@@ -157,9 +233,8 @@ def get_title(discid, job):
 
     Notes: dont try to use logging here -  doing so will break the arm setup_logging() function
     """
-    mb.set_useragent("arm", "v2_devel")
     try:
-        infos = mb.get_releases_by_discid(discid, includes=['artist-credits'])
+        infos = get_releases(discid)
         logging.debug(f"Infos: {infos}")
         logging.debug(f"discid = {discid}")
         if 'disc' in infos:
@@ -208,13 +283,16 @@ def get_cd_art(job, infos):
             )
 
             if first_release_with_artwork is not None:
-                artlist = mb.get_image_list(first_release_with_artwork['id'])
+                release_id = first_release_with_artwork['id']
+                artlist = cached_request("coverart", release_id, mb.get_image_list, release_id)
                 for image in artlist["images"]:
                     # We dont care if its verified ?
                     if "image" in image:
+                        # The full size scans can be several MB, the 500px thumbnail is plenty for the ui
+                        image_url = image.get("thumbnails", {}).get("large") or image["image"]
                         args = {
-                            'poster_url': str(image["image"]),
-                            'poster_url_auto': str(image["image"])
+                            'poster_url': str(image_url),
+                            'poster_url_auto': str(image_url)
                         }
                         u.database_updater(args, job)
                         return True
@@ -233,6 +311,9 @@ def process_tracks(job, mb_track_list, is_stub=False):
     :param is_stub:
     :return:
     """
+    # main runs again before the rip, the tracks are already there from identifying the disc
+    if job.tracks.count() > 0:
+        return
     for (idx, track) in enumerate(mb_track_list):
         track_leng = 0
         try:
@@ -0,0 +1,201 @@
+"""
+Audio cd ripping with abcde in two passes
+
+The first pass only reads the tracks to wav in abcde's working folder. The disc is ejected as
+soon as that's done, then abcde resumes the same session without the disc to encode, tag and
+move the tracks with one encoder per core. abcde's status file is followed while it runs so each
+Track row shows how far it has got.
+"""
+import glob
+import logging
+import os
+import re
+import subprocess
+import time
+
+import arm.config.config as cfg
+from arm.ripper import music_brainz
+from arm.ripper import utils
+
+# Seconds between reads of abcde's status file
+STATUS_POLL = 2
+# abcde writes e.g. readtrack-3, encodetrack-flac-3, movetrack-flac-3 to its status file
+STATUS_LINE = re.compile(r"^(readtrack|encodetrack|tagtrack|movetrack)-(?:[\w.]+-)?(\d+)$")
+# What each status line means for the track, later steps win
+TRACK_STATUS = {"readtrack": "ripped", "encodetrack": "encoded", "tagtrack": "encoded", "movetrack": "success"}
+STATUS_ORDER = (None, "ripped", "encoded", "success")
+# abcde.conf settings that decide where abcde keeps its working folder
+WORKING_DIR_SETTING = re.compile(r"""^\s*(WAVOUTPUTDIR|OUTPUTDIR)=["']?([^"'\n#]+?)["']?\s*(?:#.*)?$""", re.MULTILINE)
+
+
+def abcde_command(job, *args):
+    """
+    Build the abcde command line, using the ABCDE_CONFIG_FILE if the user has one\n
+    :param job: Current job
+    :param args: extra abcde options
+    :return: list
+    """
+    cmd = ["abcde", "-N"]
+    abcfile = cfg.arm_config["ABCDE_CONFIG_FILE"]
+    if os.path.isfile(abcfile):
+        cmd += ["-c", abcfile]
+    return cmd + list(args)
+
+
+def encoder_count():
+    """Number of encoders abcde runs at once, ABCDE_ENCODERS of 0 uses every core"""
+    encoders = int(cfg.arm_config.get('ABCDE_ENCODERS', 0))
+    return encoders if encoders > 0 else os.cpu_count() or 1
+
+
+def working_dir():
+    """
+    The folder abcde creates its abcde.<discid> session in - WAVOUTPUTDIR, then OUTPUTDIR from the
+    abcde config, then the current directory the same as abcde\n
+    :return: str path
+    """
+    settings = {}
+    abcfile = cfg.arm_config["ABCDE_CONFIG_FILE"]
+    try:
+        with open(abcfile, "r") as reader:
+            for name, value in WORKING_DIR_SETTING.findall(reader.read()):
+                settings[name] = value.strip()
+    except OSError:
+        logging.debug(f"Couldn't read {abcfile}, abcde will use the current directory")
+    return settings.get("WAVOUTPUTDIR") or settings.get("OUTPUTDIR") or os.getcwd()
+
+
+def find_session(started):
+    """
+    Find the session the read pass left behind\n
+    :param float started: time the read pass started
+    :return: (session dir, disc id) or (None, None)
+    """
+    sessions = [path for path in glob.glob(os.path.join(working_dir(), "abcde.*"))
+                if os.path.isdir(path) and os.path.getmtime(path) >= started - 1]
+    if not sessions:
+        return None, None
+    session = max(sessions, key=os.path.getmtime)
+    return session, os.path.basename(session)[len("abcde."):]
+
+
+def prepare_tracks(job):
+    """
+    Make sure there's a Track row for every track on the disc so they can show their progress,
+    discs musicbrainz didn't know have none yet\n
+    :param job: Current job
+    :return: dict of track number to Track
+    """
+    if job.tracks.count() == 0:
+        try:
+            disc_id = music_brainz.get_disc_id(job)
+            for track in disc_id.tracks:
+                utils.put_track(job, track.number, int(track.seconds) * 1000, "n/a", 0.1, False, "ABCDE")
+            utils.database_updater({'no_of_titles': len(disc_id.tracks)}, job)
+        except Exception as error:
+            logging.info(f"Couldn't add the tracks of the disc, progress won't be shown - {error}")
+    tracks = {}
+    for track in job.tracks:
+        try:
+            tracks[int(track.track_number)] = track
+        except (TypeError, ValueError):
+            continue
+    return tracks
+
+
+def update_tracks(session, tracks):
+    """
+    Copy the progress in abcde's status file to the Track rows\n
+    :param str session: abcde session folder
+    :param dict tracks: track number to Track
+    :return: True if anything changed
+    """
+    try:
+        with open(os.path.join(session, "status"), "r") as reader:
+            lines = reader.read().splitlines()
+    except OSError:
+        return False
+    changed = False
+    for line in lines:
+        matched = STATUS_LINE.match(line.strip())
+        if not matched or int(matched.group(2)) not in tracks:
+            continue
+        track = tracks[int(matched.group(2))]
+        status = TRACK_STATUS[matched.group(1)]
+        if STATUS_ORDER.index(status) > STATUS_ORDER.index(track.status if track.status in STATUS_ORDER else None):
+            track.status = status
+            track.ripped = True
+            changed = True
+    return changed
+
+
+def run_abcde(job, cmd, logfile, tracks, session=None):
+    """
+    Run abcde, following its status file while it runs\n
+    :param job: Current job
+    :param list cmd: abcde command
+    :param str logfile: the job's logfile
+    :param dict tracks: track number to Track
+    :param str session: abcde session folder, None until the read pass has created it
+    :return: abcde's return code
+    """
+    logging.debug(f"Sending command: {cmd}")
+    started = time.time()
+    with open(os.path.join(job.config.LOGPATH, logfile), "a") as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        while proc.poll() is None:
+            time.sleep(STATUS_POLL)
+            session = session or find_session(started)[0]
+            if session and update_tracks(session, tracks):
+                utils.database_updater({}, job)
+    if session and update_tracks(session, tracks):
+        utils.database_updater({}, job)
+    return proc.returncode
+
+
+def fail(job, error):
+    """Mark the job as failed"""
+    logging.error(error)
+    utils.database_updater({'status': 'fail', 'errors': error}, job)
+
+
+def rip_music(job, logfile):
+    """
+    Rip music CD using abcde config\n
+    Reads every track first, ejects, then encodes in parallel. If the read pass didn't leave a
+    session to resume abcde is run once the old way\n
+    :param job: job object
+    :param logfile: location of logfile\n
+    :return: Bool on success or fail
+    """
+    if job.disctype != "music":
+        return False
+    logging.info("Disc identified as music")
+    tracks = prepare_tracks(job)
+
+    with utils.job_stage(job, "rip"):
+        started = time.time()
+        returncode = run_abcde(job, abcde_command(job, "-d", job.devpath, "-a", "cddb,read"), logfile, tracks)
+        session, disc_id = find_session(started)
+    if returncode != 0:
+        fail(job, f"Call to abcde failed with code: {returncode} while reading the disc")
+        return False
+    if session is None:
+        logging.info("Couldn't find the abcde session to resume, ripping and encoding in one go")
+        with utils.job_stage(job, "encode"):
+            returncode = run_abcde(job, abcde_command(job, "-d", job.devpath), logfile, tracks)
+    else:
+        logging.info(f"All tracks read to {session}, ejecting the disc before encoding")
+        job.eject()
+        utils.database_updater({}, job)
+        with utils.job_stage(job, "encode"):
+            returncode = run_abcde(job, abcde_command(job, "-C", disc_id, "-j", str(encoder_count())),
+                                   logfile, tracks, session)
+    if returncode != 0:
+        for track in tracks.values():
+            if track.status != "success":
+                track.status = "fail"
+        fail(job, f"Call to abcde failed with code: {returncode}")
+        return False
+    logging.info("abcde call successful")
+    return True
@@ -0,0 +1,355 @@
+"""
+Notification dispatcher - notifications are queued in the database and delivered by a worker thread
+
+Sending used to happen inside the ripper, so a slow webhook or an unreachable service held up the
+rip. Now notify() only adds a notification_queue row for every configured target (the bash
+script, each apprise service) and returns. A worker delivers them in the background:
+- the apprise object for each url is built once and reused
+- a failed delivery is tried again with a growing delay, only for the target that failed
+- with NOTIFY_DIGEST set, the messages of one job to a target are held for that many seconds and
+  sent as one message
+
+Rows are claimed before they're sent so the ripper and the UI can both run a worker. The ripper
+flushes what it queued before it exits, the UI picks up anything left behind.
+"""
+import datetime
+import logging
+import os
+import subprocess
+import threading
+import time
+
+import apprise
+
+import arm.config.config as cfg
+from arm.models.notification_queue import NotificationQueue
+from arm.ripper import apprise_bulk
+from arm.ui import app, db
+from arm.ui.metrics import registry as metrics
+
+# Seconds before the first retry, doubled for each failure up to MAX_BACKOFF
+RETRY_BACKOFF = 30
+MAX_BACKOFF = 3600
+# Deliveries tried before a notification is given up on
+MAX_ATTEMPTS = 8
+# A row claimed longer ago than this belongs to a worker that died, it's sent again
+STALE_CLAIM = 600
+# Seconds the worker sleeps when there's nothing due
+POLL_INTERVAL = 10
+# Seconds the bash script may run
+BASH_TIMEOUT = 120
+# Prefix of the targets that come from the apprise.yaml
+BULK_PREFIX = "APPRISE:"
+# Settings in arm.yaml that each add a target, and how they're turned into an apprise url
+SIMPLE_TARGETS = {
+    'PB_KEY': lambda config: 'pbul://' + str(config["PB_KEY"]),
+    'IFTTT_KEY': lambda config: 'ifttt://' + str(config["IFTTT_KEY"]) + "@" + str(config["IFTTT_EVENT"]),
+    'PO_USER_KEY': lambda config: 'pover://' + str(config["PO_USER_KEY"]) + "@" + str(config["PO_APP_KEY"]),
+    'JSON_URL': lambda config: str(config["JSON_URL"]).replace("http://", "json://").replace("https://", "jsons://"),
+}
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_thread = None
+# Rows queued by this process, flush() waits for them
+_queued = set()
+# url -> apprise.Apprise, built once per url
+_apprise_objects = {}
+# apprise.yaml path -> (mtime, targets)
+_bulk_targets = {}
+
+
+def digest_seconds():
+    """Seconds the messages of a job are held to be sent together, 0 sends each straight away"""
+    return max(0, int(cfg.arm_config.get('NOTIFY_DIGEST', 0) or 0))
+
+
+def bulk_targets():
+    """
+    The apprise.yaml targets, the file is only read again when it changes\n
+    :return: dict of target -> apprise url
+    """
+    apprise_cfg = cfg.arm_config.get("APPRISE", "")
+    if not apprise_cfg:
+        return {}
+    try:
+        mtime = os.path.getmtime(apprise_cfg)
+        with _lock:
+            cached = _bulk_targets.get(apprise_cfg)
+        if cached is None or cached[0] != mtime:
+            targets = {BULK_PREFIX + host: url for host, url in apprise_bulk.apprise_targets(apprise_cfg).items()}
+            with _lock:
+                _bulk_targets[apprise_cfg] = cached = (mtime, targets)
+        return cached[1]
+    except Exception as error:
+        logging.error(f"Failed reading apprise config {apprise_cfg}. {error}")
+        return {}
+
+
+def targets():
+    """
+    Everything a notification is sent to\n
+    :return: dict of target -> bash script path or apprise url
+    """
+    found = {}
+    if cfg.arm_config.get('BASH_SCRIPT', "") != "":
+        found['BASH_SCRIPT'] = cfg.arm_config['BASH_SCRIPT']
+    for name, url in SIMPLE_TARGETS.items():
+        if cfg.arm_config.get(name, "") != "":
+            found[name] = url(cfg.arm_config)
+    found.update(bulk_targets())
+    return found
+
+
+def channel(target):
+    """Channel the delivery is counted under in the metrics"""
+    if target == 'BASH_SCRIPT':
+        return "bash"
+    return "apprise_bulk" if target.startswith(BULK_PREFIX) else "apprise"
+
+
+def apprise_object(url):
+    """
+    The apprise object for a url, built the first time it's used\n
+    :return: apprise.Apprise or None if apprise doesn't understand the url
+    """
+    with _lock:
+        apobj = _apprise_objects.get(url)
+        if apobj is None:
+            apobj = apprise.Apprise()
+            if not apobj.add(url):
+                return None
+            _apprise_objects[url] = apobj
+    return apobj
+
+
+def deliver(target, address, title, body):
+    """
+    Send one notification to one target\n
+    :return: (bool sent, str error or None, bool worth trying again)
+    """
+    try:
+        with metrics.NOTIFY_LATENCY.time(errors=metrics.NOTIFY_ERRORS, channel=channel(target)):
+            if target == 'BASH_SCRIPT':
+                # bash notifications use subprocess instead of apprise.
+                result = subprocess.run(["/usr/bin/bash", address, title, body], timeout=BASH_TIMEOUT)
+                if result.returncode != 0:
+                    metrics.NOTIFY_ERRORS.inc(channel="bash")
+                    return False, f"bash script exited with {result.returncode}", True
+                return True, None, False
+            apobj = apprise_object(address)
+            if apobj is None:
+                return False, "not a valid apprise url", False
+            if not apobj.notify(body, title=title):
+                metrics.NOTIFY_ERRORS.inc(channel=channel(target))
+                return False, "apprise couldn't deliver it", True
+    except Exception as error:  # noqa: E722
+        return False, str(error), True
+    return True, None, False
+
+
+def enqueue(job, title, body):
+    """
+    Queue a notification for every target and wake the worker\n
+    :param job: Current Job or None
+    :param title: title for notification
+    :param body: body of the notification
+    :return: number of rows queued
+    """
+    job_id = job.job_id if job is not None else None
+    digest = digest_seconds()
+    next_attempt = None
+    if job_id is not None and digest:
+        next_attempt = datetime.datetime.now() + datetime.timedelta(seconds=digest)
+    queued = [NotificationQueue(job_id, target, title, body, next_attempt) for target in targets()]
+    if not queued:
+        return 0
+    try:
+        db.session.add_all(queued)
+        db.session.commit()
+    except Exception as error:
+        db.session.rollback()
+        logging.error(f"Couldn't queue notification {title} - {error}")
+        return 0
+    with _lock:
+        _queued.update(row.queue_id for row in queued)
+    start()
+    _wake.set()
+    return len(queued)
+
+
+def claim(rows):
+    """
+    Mark rows as being sent, rows another worker got to first are dropped\n
+    :return: list of the rows this worker claimed
+    """
+    now = datetime.datetime.now()
+    claimed = []
+    for row in rows:
+        updated = NotificationQueue.query.filter(NotificationQueue.queue_id == row.queue_id,
+                                                 NotificationQueue.status == "pending") \
+            .update({'status': "sending", 'claimed': now}, synchronize_session=False)
+        if updated:
+            claimed.append(row)
+    db.session.commit()
+    for row in claimed:
+        db.session.refresh(row)
+    return claimed
+
+
+def combine(rows):
+    """
+    One message out of several from the same job\n
+    :return: (title, body)
+    """
+    if len(rows) == 1:
+        return rows[0].title, rows[0].body
+    title = f"{rows[-1].title} ({len(rows)} updates)"
+    body = "\n\n".join(str(row.body) for row in rows)
+    return title, body
+
+
+def finish(rows, sent, error, retry):
+    """Record the result of sending rows, the caller commits"""
+    now = datetime.datetime.now()
+    for row in rows:
+        row.attempts = (row.attempts or 0) + 1
+        row.claimed = None
+        if sent:
+            row.status = "sent"
+            row.sent = now
+            row.last_error = None
+        elif retry and row.attempts < MAX_ATTEMPTS:
+            row.status = "pending"
+            row.last_error = error
+            row.next_attempt = now + datetime.timedelta(seconds=min(MAX_BACKOFF,
+                                                                    RETRY_BACKOFF * 2 ** (row.attempts - 1)))
+        else:
+            row.status = "failed"
+            row.last_error = error
+
+
+def digest_rows(job_id, target, now):
+    """
+    The messages of a job to a target that go in its digest\n
+    Each message is held for NOTIFY_DIGEST seconds from when it was queued, once the first is due
+    the ones queued after it are sent with it, retries still wait for their delay
+    """
+    return NotificationQueue.query.filter(NotificationQueue.status == "pending",
+                                          NotificationQueue.job_id == job_id,
+                                          NotificationQueue.target == target,
+                                          db.or_(NotificationQueue.next_attempt <= now,
+                                                 NotificationQueue.attempts == 0)) \
+        .order_by(NotificationQueue.queue_id).all()
+
+
+def deliver_due(everything=False):
+    """
+    Send the notifications that are due\n
+    :param bool everything: send notifications held for a digest now too, used when the ripper exits
+    :return: number of notifications that were sent
+    """
+    now = datetime.datetime.now()
+    # Claims left by a worker that stopped part way through
+    NotificationQueue.query.filter(NotificationQueue.status == "sending",
+                                   NotificationQueue.claimed < now - datetime.timedelta(seconds=STALE_CLAIM)) \
+        .update({'status': "pending", 'claimed': None}, synchronize_session=False)
+    db.session.commit()
+    due = NotificationQueue.query.filter(NotificationQueue.status == "pending")
+    if everything:
+        # Retries still wait for their delay
+        due = due.filter(db.or_(NotificationQueue.next_attempt <= now, NotificationQueue.attempts == 0))
+    else:
+        due = due.filter(NotificationQueue.next_attempt <= now)
+    due = due.order_by(NotificationQueue.queue_id).all()
+    if not due:
+        return 0
+    addresses = targets()
+    digest = digest_seconds()
+    # A job's messages to a target go together, each message without a job goes on its own
+    groups = {}
+    for row in due:
+        key = (row.job_id, row.target) if row.job_id is not None and digest else (row.queue_id,)
+        groups.setdefault(key, []).append(row)
+    if digest:
+        for key in groups:
+            if len(key) == 2:
+                groups[key] = digest_rows(*key, now)
+    sent_count = 0
+    for rows in groups.values():
+        rows = claim(rows)
+        if not rows:
+            continue
+        target = rows[0].target
+        if target not in addresses:
+            finish(rows, False, f"{target} is no longer set up", False)
+        else:
+            title, body = combine(rows)
+            sent, error, retry = deliver(target, addresses[target], title, body)
+            finish(rows, sent, error, retry)
+            if sent:
+                sent_count += len(rows)
+                logging.debug(f"Sent notification {title} to {target}")
+            else:
+                logging.error(f"Failed sending notification {title} to {target} - {error}")
+        db.session.commit()
+    return sent_count
+
+
+def worker():
+    """Worker thread - deliver what's due, then sleep until woken or POLL_INTERVAL has passed"""
+    while True:
+        _wake.wait(POLL_INTERVAL)
+        _wake.clear()
+        with app.app_context():
+            try:
+                deliver_due()
+            except Exception as error:
+                db.session.rollback()
+                logging.error(f"Notification worker failed - {error}", exc_info=True)
+            finally:
+                db.session.remove()
+
+
+def start():
+    """Start the worker thread if this process hasn't already"""
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=worker, name="notify_queue", daemon=True)
+            _thread.start()
+
+
+def unsent(queue_ids):
+    """
+    How many of the rows haven't been tried yet or are being sent right now\n
+    A row the worker thread is sending would be left claimed if the process exited, then sent
+    again by the UI once the claim is stale
+    """
+    return NotificationQueue.query.filter(NotificationQueue.queue_id.in_(queue_ids),
+                                          db.or_(NotificationQueue.status == "sending",
+                                                 db.and_(NotificationQueue.status == "pending",
+                                                         NotificationQueue.attempts == 0))).count()
+
+
+def flush(timeout):
+    """
+    Send everything that's queued now without waiting for digests, before the process exits\n
+    Returns once every notification this process queued has been tried, anything that still
+    can't be sent is left for the UI's worker to try again\n
+    :param timeout: seconds to keep trying
+    """
+    deadline = time.monotonic() + timeout
+    with _lock:
+        queue_ids = list(_queued)
+    with app.app_context():
+        while time.monotonic() < deadline:
+            try:
+                deliver_due(everything=True)
+                if not queue_ids or unsent(queue_ids) == 0:
+                    return
+            except Exception as error:
+                db.session.rollback()
+                logging.error(f"Failed flushing notifications - {error}")
+                return
+            time.sleep(1)
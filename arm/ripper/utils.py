@@ -6,16 +6,15 @@ import sys
 import logging
 import logging.handlers
 import fcntl
-import subprocess
 import shutil
 import time
 import random
 import re
+from contextlib import contextmanager
 from pathlib import Path, PurePath
 
 import bcrypt
 import requests
-import apprise
 import psutil
 
 from netifaces import interfaces, ifaddresses, AF_INET
@@ -23,17 +22,22 @@ from netifaces import interfaces, ifaddresses, AF_INET
 import arm.config.config as cfg
 from arm.ui import db  # needs to be imported before models
 from arm.models.job import Job
+from arm.models.job_stage import JobStage
 from arm.models.notifications import Notifications
 from arm.models.track import Track
 from arm.models.user import User
-from arm.ripper import apprise_bulk
+from arm.ripper import data_copier
+from arm.ripper import finalize
+from arm.ripper import notify_queue
+from arm.ui import http_client
+from arm.ui.metrics import registry as metrics
 
 NOTIFY_TITLE = "ARM notification"
 
 
 def notify(job, title: str, body: str):
     """
-    Send notifications with apprise\n
+    Send notifications with apprise, queued for the notification worker\n
     :param job: Current Job
     :param title: title for notification
     :param body: body of the notification
@@ -53,41 +57,8 @@ def notify(job, title: str, body: str):
     notification = Notifications(title, body)
     database_adder(notification)
 
-    bash_notify(cfg.arm_config, title, body)
-
-    # Sent to remote sites
-    # Create an Apprise instance
-    apobj = apprise.Apprise()
-    if cfg.arm_config["PB_KEY"] != "":
-        apobj.add('pbul://' + str(cfg.arm_config["PB_KEY"]))
-    if cfg.arm_config["IFTTT_KEY"] != "":
-        apobj.add('ifttt://' + str(cfg.arm_config["IFTTT_KEY"]) + "@" + str(cfg.arm_config["IFTTT_EVENT"]))
-    if cfg.arm_config["PO_USER_KEY"] != "":
-        apobj.add('pover://' + str(cfg.arm_config["PO_USER_KEY"]) + "@" + str(cfg.arm_config["PO_APP_KEY"]))
-    if cfg.arm_config["JSON_URL"] != "":
-        apobj.add(str(cfg.arm_config["JSON_URL"]).replace("http://", "json://").replace("https://", "jsons://"))
-    try:
-        apobj.notify(body, title=title)
-    except Exception as error:  # noqa: E722
-        logging.error(f"Failed sending notifications. error:{error}. Continuing processing...")
-
-    # Bulk send notifications, using the config set on the ripper config page
-    if cfg.arm_config["APPRISE"] != "":
-        try:
-            apprise_bulk.apprise_notify(cfg.arm_config["APPRISE"], title, body)
-            logging.debug(f"apprise-config: {cfg.arm_config['APPRISE']}")
-        except Exception as error:  # noqa: E722
-            logging.error(f"Failed sending apprise notifications. {error}")
-
-
-def bash_notify(cfg, title, body):
-    # bash notifications use subprocess instead of apprise.
-    if cfg['BASH_SCRIPT'] != "":
-        try:
-            subprocess.run(["/usr/bin/bash", cfg['BASH_SCRIPT'], title, body])
-            logging.debug("Sent bash notification successful")
-        except Exception as error:  # noqa: E722
-            logging.error(f"Failed sending notification via bash. Continuing  processing...{error}")
+    # The bash script and apprise services are sent to in the background so they can't hold up the rip
+    notify_queue.enqueue(job, title, body)
 
 
 def notify_entry(job):
@@ -183,13 +154,14 @@ def fix_job_title(job):
 
 
 #  ############## Start of post processing functions
-def move_files(base_path, filename, job, is_main_feature=False):
+def move_files(base_path, filename, job, is_main_feature=False, batch=None):
     """
     Run extra checks then move files from RAW_PATH or TRANSCODE_PATH to final media directory\n
     :param str base_path: Path to source directory\n
     :param str filename: name of file to be moved\n
     :param job: instance of Job class\n
     :param bool is_main_feature: if current is main feature move to main dir
+    :param list batch: from move_batch - the move is added to it and done when the batch ends
     :return str: Full movie path
     """
     video_title = fix_job_title(job)
@@ -205,20 +177,52 @@ def move_files(base_path, filename, job, is_main_feature=False):
     # For series there are no extras so always use the base path
     extras_path = os.path.join(movie_path, job.config.EXTRAS_SUB) if job.video_type != "series" else movie_path
     make_dir(movie_path)
+    permissions = finalize.MediaPermissions.from_config(cfg.arm_config)
+    finalize.apply_moved(movie_path, permissions)
 
     if is_main_feature:
-        movie_file = os.path.join(movie_path, video_title + "." + job.config.DEST_EXT)
-        logging.info(f"Track is the Main Title.  Moving '{os.path.join(base_path, filename)}' to {movie_file}")
-        move_files_main(os.path.join(base_path, filename), movie_file, movie_path)
+        new_file = os.path.join(movie_path, video_title + "." + job.config.DEST_EXT)
+        logging.info(f"Track is the Main Title.  Moving '{os.path.join(base_path, filename)}' to {new_file}")
     else:
         # Don't make the extra's path unless we need it
         make_dir(extras_path)
+        finalize.apply_moved(extras_path, permissions)
         logging.info(f"Moving '{os.path.join(base_path, filename)}' to {extras_path}")
         # This also handles series - But it doesn't use the extras folder
-        move_files_main(os.path.join(base_path, filename), os.path.join(extras_path, filename), extras_path)
+        new_file = os.path.join(extras_path, filename)
+    if batch is not None:
+        batch.append((os.path.join(base_path, filename), new_file))
+        return movie_path
+    with job_stage(job, "move", filename):
+        move_files_main(os.path.join(base_path, filename), new_file, os.path.dirname(new_file))
     return movie_path
 
 
+@contextmanager
+def move_batch(job, limit=0):
+    """
+    Collect the moves made with move_files(..., batch=batch) and run them together when the block ends\n
+    Usage: with move_batch(job) as batch: move_files(path, filename, job, True, batch)\n
+    Files are copied FINALIZE_WORKERS at a time, the progress is shown in the detail of the move stage
+    :param job: Current job
+    :param int limit: bytes per second for the copies, 0 for no limit
+    """
+    batch = []
+    yield batch
+    if not batch:
+        return
+    with job_stage(job, "move", f"{len(batch)} files") as move_stage:
+        def report(progress):
+            if move_stage is not None:
+                database_updater({'detail': progress.describe()}, move_stage)
+
+        failed = finalize.move_all(batch, int(cfg.arm_config.get('FINALIZE_WORKERS', 2)),
+                                   bool(cfg.arm_config.get('FINALIZE_VERIFY', False)), report,
+                                   finalize.MediaPermissions.from_config(cfg.arm_config), limit)
+    for old_file, new_file, error in failed:
+        logging.error(f"Unable to move '{old_file}' to '{os.path.dirname(new_file)}' - Error: {error}")
+
+
 def move_files_main(old_file, new_file, base_path):
     """
     The base function for moving files with logging\n
@@ -227,13 +231,11 @@ def move_files_main(old_file, new_file, base_path):
     :param str base_path: The base path of the new file - used for logging
     :return: None
     """
-    if not os.path.isfile(new_file):
-        try:
-            shutil.move(old_file, new_file)
-        except Exception as error:
-            logging.error(f"Unable to move '{old_file}' to '{base_path}' - Error: {error}")
-    else:
-        logging.info(f"File: {new_file} already exists.  Not moving.")
+    try:
+        finalize.move_file(old_file, new_file, bool(cfg.arm_config.get('FINALIZE_VERIFY', False)),
+                           permissions=finalize.MediaPermissions.from_config(cfg.arm_config))
+    except Exception as error:
+        logging.error(f"Unable to move '{old_file}' to '{base_path}' - Error: {error}")
 
 
 def move_movie_poster(final_directory, hb_out_path):
@@ -241,15 +243,9 @@ def move_movie_poster(final_directory, hb_out_path):
     ---------\n
     DEPRECIATED - Arm already builds the final path so moving is no longer needed"""
     src_poster = os.path.join(hb_out_path, "poster.png")
-    dst_poster = os.path.join(final_directory, "poster.png")
     if os.path.isfile(src_poster):
-        if not os.path.isfile(dst_poster):
-            try:
-                shutil.move(src_poster, dst_poster)
-            except Exception as poster_error:
-                logging.error(f"Unable to move poster.png to '{final_directory}' - Error: {poster_error}")
-        else:
-            logging.info("File: poster.png already exists.  Not moving.")
+        # Same as the media files, so it gets SET_MEDIA_PERMISSIONS/SET_MEDIA_OWNER too
+        move_files_main(src_poster, os.path.join(final_directory, "poster.png"), final_directory)
 
 
 def scan_emby():
@@ -259,12 +255,14 @@ def scan_emby():
         logging.info("Sending Emby library scan request")
         url = f"http://{cfg.arm_config['EMBY_SERVER']}:{cfg.arm_config['EMBY_PORT']}/Library/Refresh?api_key={cfg.arm_config['EMBY_API_KEY']}"  # noqa: E501
         try:
-            req = requests.post(url)
+            req = http_client.post("emby", url)
             if req.status_code > 299:
                 req.raise_for_status()
             logging.info("Emby Library Scan request successful")
-        except requests.exceptions.HTTPError:
-            logging.error(f"Emby Library Scan request failed with status code: {req.status_code}")
+        except requests.exceptions.HTTPError as error:
+            logging.error(f"Emby Library Scan request failed with status code: {error.response.status_code}")
+        except requests.exceptions.RequestException as error:
+            logging.error(f"Emby Library Scan request failed - {error}")
     else:
         logging.info("EMBY_REFRESH config parameter is false.  Skipping emby scan.")
 
@@ -367,42 +365,11 @@ def find_largest_file(files, mkv_out_path):
     return largest_file_name
 
 
-def rip_music(job, logfile):
-    """
-    Rip music CD using abcde config\n
-    :param job: job object
-    :param logfile: location of logfile\n
-    :return: Bool on success or fail
+def rip_data(job, rip_stage=None):
     """
-
-    abcfile = cfg.arm_config["ABCDE_CONFIG_FILE"]
-    if job.disctype == "music":
-        logging.info("Disc identified as music")
-        # If user has set a cfg.arm_config file with ARM use it
-        if os.path.isfile(abcfile):
-            cmd = f'abcde -d "{job.devpath}" -c {abcfile} >> "{os.path.join(job.config.LOGPATH, logfile)}" 2>&1'
-        else:
-            cmd = f'abcde -d "{job.devpath}" >> "{os.path.join(job.config.LOGPATH, logfile)}" 2>&1'
-
-        logging.debug(f"Sending command: {cmd}")
-
-        try:
-            # TODO check output and confirm all tracks ripped; find "Finished\.$"
-            subprocess.check_output(cmd, shell=True).decode("utf-8")
-            logging.info("abcde call successful")
-            return True
-        except subprocess.CalledProcessError as ab_error:
-            err = f"Call to abcde failed with code: {ab_error.returncode} ({ab_error.output})"
-            args = {'status': 'fail', 'errors': err}
-            database_updater(args, job)
-            logging.error(err)
-    return False
-
-
-def rip_data(job):
-    """
-    Rip data disc using dd on the command line\n
+    Rip data disc to an iso with the streaming data copier\n
     :param job: Current job
+    :param rip_stage: JobStage of the rip, its detail shows the copy progress on the job page
     :return: True/False for success/fail
     """
     success = False
@@ -426,22 +393,38 @@ def rip_data(job):
     final_path = os.path.join(final_path, final_file_name)
     incomplete_filename = os.path.join(raw_path, str(job.label) + ".part")
     make_dir(final_path)
+    finalize.apply_moved(final_path, finalize.MediaPermissions.from_config(cfg.arm_config))
     logging.info(f"Ripping data disc to: {incomplete_filename}")
-    # Added from pull 366
-    cmd = f'dd if="{job.devpath}" of="{incomplete_filename}" {cfg.arm_config["DATA_RIP_PARAMETERS"]} 2>> ' \
-          f'{os.path.join(job.config.LOGPATH, job.logfile)}'
-    logging.debug(f"Sending command: {cmd}")
+
+    def report(result):
+        logging.info(f"Copying data disc: {data_copier.describe(result)}")
+        if rip_stage is not None:
+            database_updater({'detail': data_copier.describe(result)}, rip_stage)
+
     try:
-        subprocess.check_output(cmd, shell=True).decode("utf-8")
+        result = data_copier.copy_disc(job.devpath, incomplete_filename,
+                                       int(cfg.arm_config.get('DATA_RIP_BUFFER_MB', 8)) * 1024 * 1024,
+                                       int(cfg.arm_config.get('DATA_RIP_RETRIES', 3)), report)
+        logging.info(f"Copied {result.copied} bytes in {result.seconds:.0f}s "
+                     f"({result.rate() / 1e6:.1f} MB/s) sha256: {result.sha256}")
+        if result.bad_sectors:
+            err = f"{len(result.bad_sectors)} unreadable sectors were written as zeros, " \
+                  f"first at byte {result.bad_sectors[0]}"
+            logging.warning(err)
+            database_updater({'errors': err}, job)
         full_final_file = os.path.join(final_path, f"{str(job.label)}.iso")
+        with open(incomplete_filename + ".sha256", "w") as checksum_file:
+            checksum_file.write(f"{result.sha256}  {str(job.label)}.iso\n")
         logging.info(f"Moving data-disc from '{incomplete_filename}' to '{full_final_file}'")
+        move_files_main(incomplete_filename + ".sha256", full_final_file + ".sha256", final_path)
         move_files_main(incomplete_filename, full_final_file, final_path)
         logging.info("Data rip call successful")
         success = True
-    except subprocess.CalledProcessError as dd_error:
-        err = f"Data rip failed with code: {dd_error.returncode}({dd_error.output})"
+    except OSError as copy_error:
+        err = f"Data rip failed: {copy_error}"
         logging.error(err)
-        os.unlink(incomplete_filename)
+        if os.path.isfile(incomplete_filename):
+            os.unlink(incomplete_filename)
         args = {'status': 'fail', 'errors': err}
         database_updater(args, job)
     try:
@@ -452,34 +435,6 @@ def rip_data(job):
     return success
 
 
-def set_permissions(directory_to_traverse):
-    """
-
-    :param directory_to_traverse: directory to fix permissions
-    :return: False if fails
-    """
-    if not cfg.arm_config['SET_MEDIA_PERMISSIONS']:
-        return False
-    try:
-        corrected_chmod_value = int(str(cfg.arm_config["CHMOD_VALUE"]), 8)
-        logging.info(f"Setting permissions to: {cfg.arm_config['CHMOD_VALUE']} on: {directory_to_traverse}")
-        os.chmod(directory_to_traverse, corrected_chmod_value)
-
-        for dirpath, l_directories, l_files in os.walk(directory_to_traverse):
-            for cur_dir in l_directories:
-                logging.debug(f"Setting path: {cur_dir} to permissions value: {cfg.arm_config['CHMOD_VALUE']}")
-                os.chmod(os.path.join(dirpath, cur_dir), corrected_chmod_value)
-
-            for cur_file in l_files:
-                logging.debug(f"Setting file: {cur_file} to permissions value: {cfg.arm_config['CHMOD_VALUE']}")
-                os.chmod(os.path.join(dirpath, cur_file), corrected_chmod_value)
-
-        logging.info("Permissions set successfully: True")
-    except Exception as error:
-        logging.error(f"Permissions setting failed as: {error}")
-    return True
-
-
 def try_add_default_user():
     """
     Added to fix missmatch from the armui and armripper\n
@@ -537,6 +492,38 @@ def put_track(job, t_no, seconds, aspect, fps, mainfeature, source, filename="")
     database_adder(job_track)
 
 
+@contextmanager
+def job_stage(job, stage, detail=None):
+    """
+    Record the start and end time of a job stage in the database\n
+    Usage: with job_stage(job, "transcode", "title 2"): ...\n
+    If the wrapped block raises (or exits) the stage is stored as failed and the error is re-raised\n
+    :param job: Current job - nothing is recorded if None
+    :param str stage: Name of the stage (identify, mkv_info, rip, transcode_wait, transcode, move, notify...)
+    :param str detail: Optional extra information, track number/filename
+    """
+    if job is None or job.job_id is None:
+        yield None
+        return
+    current_stage = JobStage(job.job_id, stage, detail)
+    database_adder(current_stage)
+    status = "success"
+    try:
+        yield current_stage
+    except BaseException:
+        status = "fail"
+        raise
+    finally:
+        stop_time = datetime.datetime.now()
+        args = {
+            'status': status,
+            'stop_time': stop_time,
+            'duration': (stop_time - current_stage.start_time).total_seconds()
+        }
+        database_updater(args, current_stage)
+        logging.debug(f"Stage {stage} {detail or ''} took {args['duration']:.1f}s")
+
+
 def arm_setup(arm_log):
     """
     Setup arm - Create all the directories we need for arm to run
@@ -590,9 +577,12 @@ def database_updater(args, job, wait_time=90):
 
     for i in range(wait_time):  # give up after the users wait period in seconds
         try:
-            db.session.commit()
+            with metrics.DB_COMMIT_LATENCY.time(caller="ripper"):
+                db.session.commit()
+            break
         except Exception as error:
             if "locked" in str(error):
+                metrics.DB_LOCK_RETRIES.inc(caller="ripper")
                 time.sleep(1)
                 logging.debug(f"database is locked - try {i}/{wait_time}")
             else:
@@ -613,10 +603,12 @@ def database_adder(obj_class):
         try:
             logging.debug(f"Trying to add {type(obj_class).__name__}")
             db.session.add(obj_class)
-            db.session.commit()
+            with metrics.DB_COMMIT_LATENCY.time(caller="ripper"):
+                db.session.commit()
             break
         except Exception as error:
             if "locked" in str(error):
+                metrics.DB_LOCK_RETRIES.inc(caller="ripper")
                 time.sleep(1)
                 logging.debug(f"database is locked - try {i}/90")
             else:
@@ -646,6 +638,20 @@ def clean_old_jobs():
             database_updater({'status': "fail"}, job)
 
 
+def active_logs():
+    """
+    Logs that jobs are still writing to, log maintenance leaves them alone\n
+    :return: list of paths
+    """
+    logpath = cfg.arm_config['LOGPATH']
+    logs = [os.path.join(logpath, "arm.log")]
+    for job in db.session.query(Job).filter(Job.status.notin_(['fail', 'success'])).all():
+        if job.logfile:
+            logs.append(os.path.join(logpath, job.logfile))
+        logs.append(os.path.join(logpath, "progress", f"{job.job_id}.log"))
+    return logs
+
+
 def check_ip():
     """
         Check if user has set an ip in the config file
@@ -718,6 +724,9 @@ def save_disc_poster(final_directory, job):
             logging.info("Converting PAL Poster Image")
             os.system(f'ffmpeg -i "{job.mountpoint}/JACKET_P/J00___6L.MP2" "{final_directory}/poster.png"')
         os.system(f"umount {job.devpath}")
+        if os.path.isfile(os.path.join(final_directory, "poster.png")):
+            finalize.apply_moved(os.path.join(final_directory, "poster.png"),
+                                 finalize.MediaPermissions.from_config(cfg.arm_config))
 
 
 def check_for_dupe_folder(have_dupes, hb_out_path, job):
@@ -760,53 +769,6 @@ def check_for_dupe_folder(have_dupes, hb_out_path, job):
     return hb_out_path
 
 
-def job_dupe_check(job):
-    """
-    function for checking the database to look for jobs that have completed
-    successfully with the same label
-    :param job: The job obj, so we can use the crc/title etc.
-    :return: True/False, dict/None
-    """
-    logging.debug(f"Trying to find jobs with matching Label={job.label}")
-    if job.label is None:
-        logging.info("Disc title 'None' not searched in database")
-        return False
-    else:
-        previous_rips = Job.query.filter_by(label=job.label, status="success")
-        results = {}
-        i = 0
-        for j in previous_rips:
-            # logging.debug(f"job obj= {j.get_d()}")
-            job_dict = j.get_d().items()
-            results[i] = {}
-            for key, value in iter(job_dict):
-                results[i][str(key)] = str(value)
-            i += 1
-
-    # logging.debug(f"previous rips = {results}")
-    if results:
-        logging.debug(f"we have {len(results)} jobs")
-        # Check if results too large (over 1), skip if too many
-        if len(results) == 1:
-            # This might need some tweaks to because of title/year manual
-            title = results[0]['title'] if results[0]['title'] else job.label
-            year = results[0]['year'] if results[0]['year'] != "" else ""
-            poster_url = results[0]['poster_url'] if results[0]['poster_url'] != "" else None
-            hasnicetitle = (str(results[0]['hasnicetitle']).lower() == 'true')
-            video_type = results[0]['video_type'] if results[0]['hasnicetitle'] != "" else "unknown"
-            active_rip = {
-                "title": title, "year": year, "poster_url": poster_url, "hasnicetitle": hasnicetitle,
-                "video_type": video_type}
-            database_updater(active_rip, job)
-            return True
-        else:
-            logging.debug(f"Skipping - There are too many results [{len(results)}]")
-            return False
-    else:
-        logging.info("We have no previous rips/jobs matching this label")
-        return False
-
-
 def check_for_wait(job):
     """
     Wait if we have waiting for user input updates\n\n
@@ -8,6 +8,7 @@ sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 import arm.config.config as cfg  # noqa E402
 from arm.ui import app  # noqa E402
 import arm.ui.routes  # noqa E402
+from arm.ripper import drive_state, notify_queue  # noqa E402
 
 
 def is_docker():
@@ -45,4 +46,8 @@ app.logger.info(f"Starting ARM-UI on interface address - {host}:{cfg.arm_config[
 # Higher thread count to accommodate slow blocking processes when the UI is polling the ripper during ripping
 if __name__ == '__main__':
     from waitress import serve
+    # Deliver notifications the rippers couldn't send before they exited
+    notify_queue.start()
+    # Keep the drive state up to date from udev events
+    drive_state.start()
     serve(app, host=host, port=cfg.arm_config['WEBSERVER_PORT'], threads=40)
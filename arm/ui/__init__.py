@@ -74,6 +74,8 @@ from arm.ui.history.history import route_history  # noqa: E402,F811
 from arm.ui.jobs.jobs import route_jobs  # noqa: E402,F811
 from arm.ui.sendmovies.sendmovies import route_sendmovies  # noqa: E402,F811
 from arm.ui.notifications.notifications import route_notifications  # noqa: E402,F811
+from arm.ui.metrics.metrics import route_metrics  # noqa: E402,F811
+from arm.ui.posters.posters import route_posters  # noqa: E402,F811
 app.register_blueprint(route_settings)
 app.register_blueprint(route_logs)
 app.register_blueprint(route_auth)
@@ -82,6 +84,8 @@ app.register_blueprint(route_history)
 app.register_blueprint(route_jobs)
 app.register_blueprint(route_sendmovies)
 app.register_blueprint(route_notifications)
+app.register_blueprint(route_metrics)
+app.register_blueprint(route_posters)
 
 # Remove GET/page loads from logging
 import logging  # noqa: E402,F811
@@ -0,0 +1,246 @@
+"""
+Background import of the movies in COMPLETED_PATH that ARM isn't tracking yet
+
+The folders are looked up on OMDb by a small pool of threads, the new jobs are inserted
+in batches and after every batch the progress is saved to a checkpoint file next to the
+database, so an import that was interrupted carries on where it stopped.
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import arm.config.config as cfg
+import arm.ui.utils as ui_utils
+from arm.models.job import Job
+from arm.ui import app, db
+from arm.ui.metadata import get_omdb_poster
+
+# Lookups sent to OMDb at once
+IMPORT_WORKERS = 4
+# Jobs inserted per commit, the checkpoint is saved after each batch
+BATCH_SIZE = 25
+# will match 'Movie (0000)'
+MOVIE_REGEX = r"([\w\ \'\.\-\&\,]*?) \((\d{2,4})\)"
+VIDEO_EXTENSIONS = (".mkv", ".avi", ".mp4")
+
+_lock = threading.Lock()
+_thread = None
+_progress = {}
+
+
+def checkpoint_path():
+    """The checkpoint is kept next to the database"""
+    return os.path.join(os.path.dirname(cfg.arm_config['DBFILE']), "import_movies.json")
+
+
+def load_checkpoint():
+    """
+    Read the checkpoint of the last import\n
+    :return: dict of the progress or None if there isn't one
+    """
+    try:
+        with open(checkpoint_path(), "r") as reader:
+            return json.load(reader)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(progress):
+    """Write the checkpoint, replacing the old one in one go so it's never half written"""
+    tmp_path = checkpoint_path() + ".tmp"
+    try:
+        with open(tmp_path, "w") as writer:
+            json.dump(progress, writer)
+        os.replace(tmp_path, checkpoint_path())
+    except OSError as error:
+        app.logger.error(f"Couldn't save the import checkpoint - {error}")
+
+
+def update_progress(**changes):
+    """Change the in memory progress, the ui reads it from other threads"""
+    with _lock:
+        _progress.update(changes)
+        _progress['updated'] = str(datetime.datetime.now())
+
+
+def get_progress():
+    """
+    Progress of the running or last import for the ui to poll\n
+    :return: dict - the list of finished folders is left out
+    """
+    with _lock:
+        progress = dict(_progress) if _progress else load_checkpoint() or {'state': "idle"}
+    progress.pop('done', None)
+    progress['success'] = True
+    return progress
+
+
+def find_movie_folders(my_path):
+    """
+    Find every folder in the ARM "Movie (year)" format\n
+    Folders that don't match are treated as a collection and searched one level down e.g\n
+    - Lord of the rings
+        - The Lord of the Rings The Fellowship of the Ring (2001)
+        - The Lord of the Rings The Two Towers (2002)\n
+    :param str my_path: COMPLETED_PATH
+    :return: list of (path, title, year) and a list of the folders that didn't match
+    """
+    folders = []
+    notfound = []
+    for movie in ui_utils.generate_file_list(my_path):
+        matched = re.match(MOVIE_REGEX, movie)
+        if matched:
+            folders.append((os.path.join(my_path, movie), matched.group(1), matched.group(2)))
+            continue
+        sub_path = os.path.join(my_path, movie)
+        for sub_movie in ui_utils.generate_file_list(sub_path):
+            sub_matched = re.match(MOVIE_REGEX, sub_movie)
+            if sub_matched:
+                folders.append((os.path.join(sub_path, sub_movie), sub_matched.group(1), sub_matched.group(2)))
+            else:
+                notfound.append(sub_movie)
+    return folders, notfound
+
+
+def lookup_movie(folder):
+    """
+    Get the poster and imdb id for a folder, run by the lookup pool\n
+    :param tuple folder: (path, title, year)
+    :return: (poster_url, imdb_id) - (None, None) if OMDb didn't know it or couldn't be reached
+    """
+    _, title, year = folder
+    with app.app_context():
+        try:
+            return get_omdb_poster(title, year)
+        except Exception as error:
+            app.logger.error(f"Import lookup for {title} ({year}) failed - {error}")
+            return None, None
+
+
+def movie_crc(folder):
+    """Fake crc64 from the "Movie (year)" name, used to spot folders that have already been imported"""
+    _, title, year = folder
+    return hashlib.md5(f"{title} ({year})".strip().encode()).hexdigest()
+
+
+def build_job_row(folder, poster_image, imdb_id):
+    """
+    Build the job for an imported folder\n
+    Inserted as a plain row, creating Job objects would run a udev lookup for each folder\n
+    :param tuple folder: (path, title, year)
+    :param poster_image: poster url or None
+    :param imdb_id: imdb id or None
+    :return: dict of job columns
+    """
+    path, title, year = folder
+    movie_files = [f for f in os.listdir(path)
+                   if os.path.isfile(os.path.join(path, f)) and f.endswith(VIDEO_EXTENSIONS)]
+    return {
+        'title': title,
+        'year': year,
+        'crc_id': movie_crc(folder),
+        'imdb_id': imdb_id,
+        'poster_url': poster_image,
+        'status': 'success' if len(movie_files) >= 1 else 'fail',
+        'video_type': 'movie',
+        'disctype': 'unknown',
+        'hasnicetitle': True,
+        'no_of_titles': len(movie_files),
+        'start_time': datetime.datetime.now(),
+        'logfile': "imported.log",
+        'ejected': True,
+        'updated': False,
+        'path': path,
+    }
+
+
+def insert_batch(rows, done):
+    """
+    Insert a batch of jobs and save the checkpoint\n
+    :param list rows: job column dicts
+    :param list done: paths finished in this batch, including the ones that were skipped
+    """
+    if rows:
+        try:
+            db.session.execute(db.insert(Job), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    with _lock:
+        _progress['done'].extend(done)
+        _progress['processed'] += len(done)
+        _progress['added'] += len(rows)
+        _progress['updated'] = str(datetime.datetime.now())
+        checkpoint = dict(_progress)
+    save_checkpoint(checkpoint)
+
+
+def run_import():
+    """
+    The import thread - find the folders, look them up and insert them in batches
+    """
+    with app.app_context():
+        try:
+            folders, notfound = find_movie_folders(cfg.arm_config['COMPLETED_PATH'])
+            with _lock:
+                finished = set(_progress['done'])
+            # Folders already in the database, whatever their status, or finished before an interruption are skipped
+            existing = {os.path.normpath(path) for (path,) in db.session.query(Job.path).filter(Job.path.isnot(None))}
+            todo = [folder for folder in folders if folder[0] not in finished]
+            skipped = [folder[0] for folder in todo if os.path.normpath(folder[0]) in existing]
+            todo = [folder for folder in todo if os.path.normpath(folder[0]) not in existing]
+            with _lock:
+                _progress['skipped'] += len(skipped)
+            update_progress(total=len(folders), notfound=notfound)
+            insert_batch([], skipped)
+            app.logger.info(f"Importing {len(todo)} movies from {cfg.arm_config['COMPLETED_PATH']}")
+
+            rows = []
+            done = []
+            with ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import") as executor:
+                for folder, (poster_image, imdb_id) in zip(todo, executor.map(lookup_movie, todo)):
+                    rows.append(build_job_row(folder, poster_image, imdb_id))
+                    done.append(folder[0])
+                    if len(done) >= BATCH_SIZE:
+                        insert_batch(rows, done)
+                        rows, done = [], []
+            insert_batch(rows, done)
+            update_progress(state="finished")
+            app.logger.info(f"Import finished - {_progress['added']} movies added")
+        except Exception as error:
+            db.session.rollback()
+            app.logger.error(f"Import of movies failed - {error}")
+            update_progress(state="failed", error=str(error))
+        with _lock:
+            save_checkpoint(dict(_progress))
+
+
+def start_import(restart=False):
+    """
+    Start importing in the background, an unfinished import is resumed from its checkpoint\n
+    :param bool restart: ignore the checkpoint and start again
+    :return: dict of the progress
+    """
+    global _thread, _progress
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            app.logger.debug("Import already running")
+        else:
+            checkpoint = None if restart else load_checkpoint()
+            # running means the ui stopped part way through
+            if checkpoint and checkpoint.get('state') in ("running", "failed"):
+                app.logger.info(f"Resuming import - {len(checkpoint['done'])} folders already done")
+                _progress = checkpoint
+            else:
+                _progress = {'state': "running", 'started': str(datetime.datetime.now()), 'total': 0,
+                             'processed': 0, 'added': 0, 'skipped': 0, 'notfound': [], 'done': []}
+            _progress['state'] = "running"
+            _progress.pop('error', None)
+            _thread = threading.Thread(target=run_import, name="import_movies", daemon=True)
+            _thread.start()
+    return get_progress()
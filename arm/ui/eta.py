@@ -0,0 +1,237 @@
+"""
+History based ETA predictor for A.R.M
+
+Fits the speed of each drive (seconds of content read per wall second) and of each
+HandBrake preset (seconds of content encoded per wall second) from the recorded stage
+timings of completed jobs, then uses them to estimate how long the running jobs will
+take to rip, to wait for a transcode slot and to transcode.
+"""
+import datetime
+import threading
+import time
+
+import arm.config.config as cfg
+from arm.models.config import Config
+from arm.models.job import Job
+from arm.models.job_stage import JobStage
+from arm.models.track import Track
+from arm.ui import app
+
+# How many of the most recent successful jobs are used to fit the rates
+HISTORY_JOBS = 50
+# Seconds fitted rates are reused for, the job list is polled every few seconds by every open page
+RATES_TTL = 60
+UNKNOWN = "Unknown"
+
+_rates_lock = threading.Lock()
+_rates = {'value': None, 'fitted': 0}
+
+
+def get_preset(job, config=None):
+    """
+    Get the HandBrake preset this job is (or was) transcoded with\n
+    :param job: the Job
+    :param config: the Config of the job, looked up from the job if not given
+    :return: str preset name or None
+    """
+    config = config if config is not None else job.config
+    if config is None:
+        return None
+    if job.disctype == "dvd":
+        return config.HB_PRESET_DVD
+    if job.disctype == "bluray":
+        return config.HB_PRESET_BD
+    return None
+
+
+def content_seconds(job, tracks, config):
+    """
+    Work out how many seconds of content will be ripped/transcoded for a job\n
+    Uses the same rules as the ripper - tracks outside MINLENGTH/MAXLENGTH are skipped
+    and only the longest track is used when MAINFEATURE is set\n
+    :param job: the Job
+    :param tracks: list of the jobs Track rows
+    :param config: the jobs Config
+    :return: float seconds
+    """
+    # MakeMKV and HandBrake can both add the same title, only count it once
+    unique_tracks = {}
+    for track in tracks:
+        if track.length is not None:
+            unique_tracks.setdefault(track.track_number, track)
+    lengths = [track.length for track in unique_tracks.values()]
+    if job.disctype == "music":
+        # abcde track lengths are stored in milliseconds
+        return sum(lengths) / 1000
+    if config is not None:
+        try:
+            lengths = [length for length in lengths
+                       if int(config.MINLENGTH) <= length <= int(config.MAXLENGTH)]
+        except (TypeError, ValueError):
+            app.logger.debug(f"Bad MINLENGTH/MAXLENGTH for job {job.job_id}, using all tracks")
+        if config.MAINFEATURE and lengths:
+            lengths = [max(lengths)]
+    return float(sum(lengths))
+
+
+def fit_rates(history=HISTORY_JOBS):
+    """
+    Fit the read throughput of each drive and the encode speed of each preset
+    from the last completed jobs\n
+    :param history: number of successful jobs to look back over
+    :return: dict with 'rip' {(devpath, disctype): rate} and 'transcode' {preset: rate}
+    where rate is seconds of content per wall second
+    """
+    jobs = Job.query.filter_by(status="success").order_by(Job.job_id.desc()).limit(history).all()
+    job_ids = [job.job_id for job in jobs]
+    rates = {'rip': {}, 'transcode': {}}
+    if not job_ids:
+        return rates
+
+    # Three queries for the whole history instead of three per job
+    tracks = {}
+    for track in Track.query.filter(Track.job_id.in_(job_ids)):
+        tracks.setdefault(track.job_id, []).append(track)
+    configs = {config.job_id: config for config in Config.query.filter(Config.job_id.in_(job_ids))}
+    durations = {}
+    stages = JobStage.query.filter(JobStage.job_id.in_(job_ids),
+                                   JobStage.stage.in_(["rip", "transcode"]),
+                                   JobStage.status == "success")
+    for stage in stages:
+        key = (stage.job_id, stage.stage)
+        durations[key] = durations.get(key, 0.0) + (stage.duration or 0.0)
+
+    totals = {'rip': {}, 'transcode': {}}
+    for job in jobs:
+        content = content_seconds(job, tracks.get(job.job_id, []), configs.get(job.job_id))
+        if content <= 0:
+            continue
+        fits = (('rip', (job.devpath, job.disctype)),
+                ('transcode', get_preset(job, configs.get(job.job_id))))
+        for stage, key in fits:
+            wall = durations.get((job.job_id, stage), 0.0)
+            if key is None or wall <= 0:
+                continue
+            content_total, wall_total = totals[stage].get(key, (0.0, 0.0))
+            totals[stage][key] = (content_total + content, wall_total + wall)
+
+    for stage, keys in totals.items():
+        for key, (content_total, wall_total) in keys.items():
+            rates[stage][key] = content_total / wall_total
+    # Drives that haven't ripped this type of disc yet fall back to the average for the disc type
+    by_type = {}
+    for (_, disctype), (content_total, wall_total) in totals['rip'].items():
+        type_content, type_wall = by_type.get(disctype, (0.0, 0.0))
+        by_type[disctype] = (type_content + content_total, type_wall + wall_total)
+    for disctype, (content_total, wall_total) in by_type.items():
+        rates['rip'][(None, disctype)] = content_total / wall_total
+    app.logger.debug(f"Fitted ETA rates: {rates}")
+    return rates
+
+
+def cached_rates():
+    """
+    The fitted rates, only fitted again every RATES_TTL seconds\n
+    A few more finished jobs barely change a fit over HISTORY_JOBS jobs\n
+    :return: dict from fit_rates()
+    """
+    with _rates_lock:
+        if _rates['value'] is not None and time.monotonic() - _rates['fitted'] < RATES_TTL:
+            return _rates['value']
+    rates = fit_rates()
+    with _rates_lock:
+        _rates['value'] = rates
+        _rates['fitted'] = time.monotonic()
+    return rates
+
+
+def stage_elapsed(stages, stage_name):
+    """
+    Seconds a job has spent in one stage so far (finished and running rows)\n
+    :param stages: list of the jobs JobStage rows
+    :param stage_name: the stage to total
+    :return: float seconds, None if the stage hasn't started
+    """
+    matching = [stage for stage in stages if stage.stage == stage_name]
+    if not matching:
+        return None
+    return sum(stage.elapsed() for stage in matching)
+
+
+def predict_jobs(jobs, rates=None):
+    """
+    Predict the remaining rip, transcode queue and transcode time for the active jobs\n
+    :param jobs: list of active jobs
+    :param rates: rates from fit_rates(), the cached fit if not given
+    :return: dict job_id: {'rip': seconds, 'wait': seconds, 'transcode': seconds}
+    values are None when there isn't enough history to say
+    """
+    rates = rates if rates is not None else cached_rates()
+    predictions = {}
+    for job in jobs:
+        stages = job.stages.all()
+        content = content_seconds(job, job.tracks.all(), job.config)
+        prediction = {'rip': None, 'wait': None, 'transcode': None}
+        rip_rate = rates['rip'].get((job.devpath, job.disctype), rates['rip'].get((None, job.disctype)))
+        rip_finished = any(stage.stage == "rip" and stage.status != "running" for stage in stages)
+        if job.status in ("ripping", "active") and not rip_finished and rip_rate and content > 0:
+            expected = content / rip_rate
+            elapsed = stage_elapsed(stages, "rip") or 0.0
+            progress = getattr(job, "progress_round", None)
+            if elapsed > expected and progress:
+                # Slower than usual, trust the current progress instead
+                expected = elapsed * 100 / float(progress)
+            prediction['rip'] = max(expected - elapsed, 0.0)
+        transcode_rate = rates['transcode'].get(get_preset(job))
+        skip_transcode = job.config is not None and job.config.SKIP_TRANSCODE
+        if transcode_rate and content > 0 and not skip_transcode:
+            expected = content / transcode_rate
+            elapsed = stage_elapsed(stages, "transcode") or 0.0
+            prediction['transcode'] = max(expected - elapsed, 0.0)
+        predictions[job.job_id] = prediction
+    predict_queue(jobs, predictions)
+    return predictions
+
+
+def predict_queue(jobs, predictions):
+    """
+    Fill in how long each job waiting for a transcode slot will wait\n
+    Simulates MAX_CONCURRENT_TRANSCODES slots, each freed when its transcode is predicted to finish\n
+    :param jobs: list of active jobs
+    :param predictions: dict from predict_jobs(), updated in place
+    :return: None
+    """
+    waiting = sorted((job for job in jobs if job.status == "waiting_transcode"),
+                     key=lambda job: job.start_time or datetime.datetime.now())
+    try:
+        slots = int(cfg.arm_config["MAX_CONCURRENT_TRANSCODES"])
+    except (KeyError, TypeError, ValueError):
+        slots = 0
+    if slots <= 0:
+        # No transcode limit - nothing waits
+        for job in waiting:
+            predictions[job.job_id]['wait'] = 0.0
+        return
+    slot_free = [predictions[job.job_id]['transcode'] for job in jobs if job.status == "transcoding"]
+    slot_free += [0.0] * (slots - len(slot_free))
+    for job in waiting:
+        if None in slot_free:
+            # A running transcode can't be predicted, so neither can anything behind it
+            break
+        slot_free.sort()
+        wait = slot_free[0]
+        predictions[job.job_id]['wait'] = wait
+        transcode = predictions[job.job_id]['transcode']
+        slot_free[0] = None if transcode is None else wait + transcode
+
+
+def format_eta(seconds):
+    """
+    Format seconds remaining the same way as calc_process_time\n
+    :param seconds: float seconds or None
+    :return: str "h:mm:ss - @HH:MM:SS" or Unknown
+    """
+    if seconds is None:
+        return UNKNOWN
+    finish_time = datetime.datetime.now() + datetime.timedelta(seconds=int(seconds))
+    return f"{datetime.timedelta(seconds=int(seconds))} - @{finish_time.strftime('%H:%M:%S')}"
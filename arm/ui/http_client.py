@@ -0,0 +1,182 @@
+"""
+Shared HTTP client for every outbound call A.R.M makes (metadata providers, ARM api, emby)
+
+One pooled requests session keeps connections to each host alive, every call gets a connect
+and read timeout and a couple of retries. Each provider has a circuit breaker so when a
+provider is down calls fail straight away instead of each one waiting for the timeout.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from arm.ui.metrics import registry as metrics
+
+# Seconds to wait for the connection / for the response
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 20
+# Retries on connection errors and 429/5xx, sleeping 0.5s, 1s between them
+RETRIES = 2
+RETRY_BACKOFF = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Connections kept open per host
+POOL_SIZE = 10
+# Failures in a row before the breaker opens, and how long it stays open
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 60
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a provider while its circuit breaker is open"""
+
+
+class ProviderError(requests.exceptions.HTTPError):
+    """Used to count a 5xx response against the circuit breaker"""
+
+
+class CircuitBreaker:
+    """
+    Counts failures in a row for one provider\n
+    closed - calls go through\n
+    open - calls fail fast until BREAKER_COOLDOWN has passed\n
+    half open - one trial call goes through, it closes the breaker on success or opens it again
+    """
+
+    def __init__(self, provider, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.provider = provider
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Check if a call may be made\n
+        :return: True if the breaker is closed or this call is the half open trial
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial_running:
+                return False
+            self.trial_running = True
+            return True
+
+    def success(self):
+        """A call worked, close the breaker"""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+        metrics.HTTP_CIRCUIT_OPEN.set(0, provider=self.provider)
+
+    def release(self):
+        """The call ended in a way that says nothing about the provider"""
+        with self._lock:
+            self.trial_running = False
+
+    def failure(self):
+        """A call failed, open the breaker once there have been too many in a row"""
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is None and self.failures < self.threshold:
+                return
+            self.opened_at = time.monotonic()
+        metrics.HTTP_CIRCUIT_OPEN.set(1, provider=self.provider)
+
+    def __repr__(self):
+        return f'<CircuitBreaker {self.provider} failures={self.failures} open={self.opened_at is not None}>'
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(provider):
+    """
+    Get the circuit breaker for a provider, creating it on first use\n
+    :param str provider: omdb/tmdb/arm/emby/musicbrainz
+    :return: CircuitBreaker
+    """
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
+
+
+def build_session():
+    """
+    Build the pooled session, retries only cover idempotent methods (requests doesn't retry POST)\n
+    :return: requests.Session
+    """
+    retry = Retry(total=RETRIES, connect=RETRIES, read=RETRIES, status=RETRIES, backoff_factor=RETRY_BACKOFF,
+                  status_forcelist=RETRY_STATUS, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+    new_session = requests.Session()
+    new_session.mount("https://", adapter)
+    new_session.mount("http://", adapter)
+    new_session.headers["User-Agent"] = "arm"
+    return new_session
+
+
+session = build_session()
+
+
+@contextmanager
+def guard(provider, errors=(requests.exceptions.RequestException,)):
+    """
+    Run a call behind the providers circuit breaker\n
+    Used directly for clients that make their own connections (musicbrainzngs)\n
+    :param str provider: name of the provider
+    :param errors: exceptions that count as the provider failing
+    :raises CircuitOpenError: if the breaker is open
+    """
+    breaker = breaker_for(provider)
+    if not breaker.allow():
+        metrics.HTTP_CIRCUIT_REJECTED.inc(provider=provider)
+        raise CircuitOpenError(f"{provider} has failed {breaker.failures} times in a row, "
+                               f"not trying again for {breaker.cooldown}s")
+    try:
+        yield
+    except errors:
+        breaker.failure()
+        raise
+    except BaseException:
+        # Not the providers fault, but the half open trial is over
+        breaker.release()
+        raise
+    breaker.success()
+
+
+def request(provider, method, url, **kwargs):
+    """
+    Send a request through the shared session\n
+    :param str provider: name of the provider, used for the circuit breaker
+    :param str method: GET/POST
+    :param str url: url to call
+    :param kwargs: passed on to requests, timeout defaults to (CONNECT_TIMEOUT, READ_TIMEOUT)
+    :return: requests.Response - 4xx responses are returned, not raised
+    :raises requests.exceptions.RequestException: on connection errors, timeouts and 5xx
+    """
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    with guard(provider):
+        response = session.request(method, url, **kwargs)
+        if response.status_code >= 500:
+            raise ProviderError(f"{provider} returned {response.status_code}", response=response)
+    return response
+
+
+def get(provider, url, **kwargs):
+    """GET a url, see request"""
+    return request(provider, "GET", url, **kwargs)
+
+
+def post(provider, url, **kwargs):
+    """POST to a url, see request"""
+    return request(provider, "POST", url, **kwargs)
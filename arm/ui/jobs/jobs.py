@@ -13,13 +13,15 @@ Covers
 """
 
 import json
+import requests
 from flask_login import LoginManager, login_required, current_user  # noqa: F401
 from flask import render_template, request, Blueprint, flash, redirect, url_for
 from werkzeug.routing import ValidationError
 
 import arm.ui.utils as ui_utils
-from arm.ui import app, db, constants, json_api
+from arm.ui import app, db, constants, json_api, metadata
 from arm.models.job import Job
+from arm.models.job_stage import JobStage
 from arm.models.notifications import Notifications
 import arm.config.config as cfg
 from arm.ui.forms import TitleSearchForm, ChangeParamsForm
@@ -41,11 +43,17 @@ def jobdetail():
     job_id = request.args.get('job_id')
     job = Job.query.get(job_id)
     tracks = job.tracks.all()
-    search_results = ui_utils.metadata_selector("get_details", job.title, job.year, job.imdb_id)
-    if search_results and 'Error' not in search_results:
-        job.plot = search_results['Plot'] if 'Plot' in search_results else "There was a problem getting the plot"
-        job.background = search_results['background_url'] if 'background_url' in search_results else None
-    return render_template('jobdetail.html', jobs=job, tracks=tracks, s=search_results)
+    stages = job.stages.order_by(JobStage.start_time).all()
+    stage_summary = ui_utils.job_stage_summary(job, stages)
+    # Saved details are used, if there aren't any yet they are fetched in the background
+    details = ui_utils.request_job_details(job)
+    search_results = {'Ratings': details.get_ratings() if details else []}
+    job.plot = details.plot if details else None
+    job.background = details.background_url if details else None
+    details_status = "pending" if details is None or details.lookup_key != ui_utils.job_details_key(job) \
+        else details.status
+    return render_template('jobdetail.html', jobs=job, tracks=tracks, s=search_results,
+                           stages=stages, stage_summary=stage_summary, details_status=details_status)
 
 
 @route_jobs.route('/titlesearch')
@@ -102,6 +110,15 @@ def gettitle():
     """
     imdb_id = request.args.get('imdbID').strip() if request.args.get('imdbID') else None
     job_id = request.args.get('job_id').strip() if request.args.get('job_id') else None
+    tmdb_id = request.args.get('tmdbID').strip() if request.args.get('tmdbID') else None
+    if not imdb_id and tmdb_id:
+        # tmdb search results are only resolved to an imdb id when one is picked
+        try:
+            imdb_id = metadata.tmdb_get_imdb(tmdb_id, request.args.get('type', "movie"))
+        except (requests.exceptions.RequestException, ValueError) as error:
+            app.logger.error(f"gettitle - failed to get imdb id for tmdb {tmdb_id} - {error}")
+            flash("Couldn't reach TMDb to look up the title, try again later", "danger")
+            return redirect(url_for('route_jobs.jobdetail', job_id=job_id) if job_id else url_for('home'))
     if imdb_id == "" or imdb_id is None:
         app.logger.debug("gettitle - no imdb supplied")
         flash("No imdb supplied", "danger")
@@ -245,6 +262,10 @@ def feed_json():
             'mode': mode,
             'config_id': request.args.get('config_id'),
             'notify_id': request.args.get('notify_id'),
+            'offset': request.args.get('offset'),
+            'limit': request.args.get('limit'),
+            'tail': request.args.get('tail'),
+            'days': request.args.get('days'),
             'notify_timeout': {'funct': json_api.get_notify_timeout, 'args': ('notify_timeout',)},
             'restart': {'funct': json_api.restart_ui, 'args': ()},
         }
@@ -252,15 +273,20 @@ def feed_json():
         valid_modes = {
             'delete': {'funct': json_api.delete_job, 'args': ('j_id', 'mode')},
             'abandon': {'funct': json_api.abandon_job, 'args': ('j_id',)},
-            'full': {'funct': json_api.generate_log, 'args': ('logpath', 'j_id')},
+            'full': {'funct': json_api.generate_log, 'args': ('logpath', 'j_id', 'offset', 'limit', 'tail')},
             'search': {'funct': json_api.search, 'args': ('searchq',)},
             'getfailed': {'funct': json_api.get_x_jobs, 'args': ('fail',)},
             'getsuccessful': {'funct': json_api.get_x_jobs, 'args': ('success',)},
             'fixperms': {'funct': ui_utils.fix_permissions, 'args': ('j_id',)},
             'joblist': {'funct': json_api.get_x_jobs, 'args': ('joblist',)},
             'send_item': {'funct': ui_utils.send_to_remote_db, 'args': ('j_id',)},
+            'job_details': {'funct': ui_utils.job_details_state, 'args': ('j_id',)},
+            'refresh_details': {'funct': ui_utils.refresh_job_details, 'args': ('j_id',)},
             'change_job_params': {'funct': json_api.change_job_params, 'args': ('config_id',)},
             'read_notification': {'funct': json_api.read_notification, 'args': ('notify_id',)},
+            'notify_clear_all': {'funct': json_api.notifications_bulk, 'args': ('mode', 'days')},
+            'notify_seen_all': {'funct': json_api.notifications_bulk, 'args': ('mode', 'days')},
+            'notify_delete_old': {'funct': json_api.notifications_bulk, 'args': ('mode', 'days')},
             'notify_timeout': {'funct': json_api.get_notify_timeout, 'args': ('notify_timeout',)}
         }
     else:
@@ -274,8 +300,13 @@ def feed_json():
     if mode in valid_modes:
         args = [valid_data[x] for x in valid_modes[mode]['args']]
         return_json = valid_modes[mode]['funct'](*args)
-    return_json['notes'] = json_api.get_notifications()
+    return_json['notes'], return_json['notes_cursor'] = json_api.get_notifications(request.args.get('since_id'))
 
+    # Logs are sent as they're read instead of being built into one string
+    if mode == 'full' and return_json.get('success'):
+        return app.response_class(response=json_api.stream_json(return_json, 'log'),
+                                  status=200,
+                                  mimetype=constants.JSON_TYPE)
     # return JSON data
     return app.response_class(response=json.dumps(return_json, indent=4, sort_keys=True),
                               status=200,
@@ -4,30 +4,56 @@ Also used to connect to both omdb and tmdb
 """
 import os
 import subprocess
+import json
 import re
 import html
-from pathlib import Path
 import datetime
 import psutil
 from flask import request
 
 import arm.config.config as cfg
 from arm.models.config import Config
+from arm.models.disc_fingerprint import DiscFingerprint
 from arm.models.job import Job
+from arm.models.job_metadata import JobMetadata
+from arm.models.job_remote_sync import JobRemoteSync
+from arm.models.job_stage import JobStage
+from arm.models.notification_queue import NotificationQueue
+from arm.models.io_allocation import IoAllocation
+from arm.models.space_reservation import SpaceReservation
 from arm.models.notifications import Notifications
 from arm.models.track import Track
 from arm.models.ui_settings import UISettings
-from arm.ui import app, db
+from arm.ripper import log_maintenance
+from arm.ui import app, db, eta
 from arm.ui.forms import ChangeParamsForm
+from arm.ui.notifications import bulk as notification_bulk
+from arm.ui.posters import cache as poster_cache
 from arm.ui.utils import job_id_validator, database_updater, authenticated_state
 from arm.ui.settings import DriveUtils as drive_utils # noqa E402
 
 
-def get_notifications():
-    """Get all current notifications"""
+def get_notifications(since_id=None):
+    """
+    Get all current notifications, or only the ones newer than since_id\n
+    :param since_id: the notes_cursor of the last response, so a poll only gets new notifications
+    :return: (list of notification dicts, cursor for the next poll)
+    """
     all_notification = Notifications.query.filter_by(seen=False)
-    notification = [a.get_d() for a in all_notification]
-    return notification
+    try:
+        since_id = int(since_id) if since_id not in (None, "") else None
+    except ValueError:
+        since_id = None
+    if since_id is not None:
+        all_notification = all_notification.filter(Notifications.id > since_id)
+    notification = [a.get_d() for a in all_notification.order_by(Notifications.id)]
+    if notification:
+        cursor = int(notification[-1]['id'])
+    elif since_id is not None:
+        cursor = since_id
+    else:
+        cursor = db.session.query(db.func.max(Notifications.id)).scalar() or 0
+    return notification, cursor
 
 
 def get_x_jobs(job_status):
@@ -46,11 +72,20 @@ def get_x_jobs(job_status):
         jobs = db.session.query(Job).filter(Job.status.notin_(['fail', 'success'])).all()
 
     job_results = {}
+    predictions = {}
+    if job_status not in ("success", "fail"):
+        predictions = eta.predict_jobs(jobs)
     i = 0
     for j in jobs:
         job_results[i] = {}
         job_log = os.path.join(cfg.arm_config['LOGPATH'], str(j.logfile))
         process_logfile(job_log, j, job_results[i])
+        if j.job_id in predictions:
+            apply_predictions(j, job_results[i], predictions[j.job_id])
+        if j.status == "waiting_space":
+            # Why the job is waiting, kept up to date by the ripper
+            wait_stage = j.stages.filter_by(stage="space_wait", status="running").first()
+            job_results[i]['space_wait'] = wait_stage.detail if wait_stage else ""
         try:
             job_results[i]['config'] = j.config.get_d()
         except AttributeError:
@@ -60,6 +95,7 @@ def get_x_jobs(job_status):
         for key, value in j.get_d().items():
             if key != "config":
                 job_results[i][str(key)] = str(value)
+        job_results[i]['poster_url'] = str(poster_cache.local_url(j.poster_url))
         i += 1
     if jobs:
         app.logger.debug("jobs  - we have " + str(len(job_results)) + " jobs")
@@ -84,18 +120,47 @@ def process_logfile(logfile, job, job_results):
         :return: should be dict for the json api
     """
     app.logger.debug(job.status)
-    if job.status == "ripping":
+    if process_stage_progress(job, "move", "Moving"):
+        app.logger.debug("using move progress")
+    elif job.status == "ripping":
         app.logger.debug("using mkv - " + logfile)
         job_results = process_makemkv_logfile(job, job_results)
     elif job.disctype == "music":
         app.logger.debug("using audio disc")
-        process_audio_logfile(job.logfile, job, job_results)
+        if not process_audio_tracks(job):
+            process_audio_logfile(job.logfile, job, job_results)
+    elif job.disctype == "data":
+        app.logger.debug("using data copy progress")
+        process_stage_progress(job, "rip", "Copying")
     else:
         app.logger.debug("using handbrake")
         job_results = process_handbrake_logfile(logfile, job, job_results)
     return job_results
 
 
+def apply_predictions(job, job_results, prediction):
+    """
+    Add the history based ETAs to the job results
+
+    The job ETA is replaced by the prediction for whatever the job is doing now,
+    HandBrake's own ETA is kept while it is transcoding as it knows best
+
+    :param job: the Job class
+    :param job_results: the {} of
+    :param prediction: dict of rip/wait/transcode seconds from eta.predict_jobs
+    :return: None
+    """
+    job_results['eta_rip'] = eta.format_eta(prediction['rip'])
+    job_results['eta_wait'] = eta.format_eta(prediction['wait'])
+    job_results['eta_transcode'] = eta.format_eta(prediction['transcode'])
+    if job.status in ("ripping", "active") and prediction['rip'] is not None:
+        job.eta = job_results['eta_rip']
+    elif job.status == "waiting_transcode" and prediction['wait'] is not None:
+        job.eta = job_results['eta_wait']
+    elif job.status == "transcoding" and not getattr(job, "eta", None) and prediction['transcode'] is not None:
+        job.eta = job_results['eta_transcode']
+
+
 def percentage(part, whole):
     """percent calculator"""
     percent = 100 * float(part) / float(whole)
@@ -170,6 +235,50 @@ def process_handbrake_logfile(logfile, job, job_results):
     return job_results
 
 
+def process_stage_progress(job, stage, action):
+    """
+    Show the progress the ripper keeps in the detail of a running stage - data disc copies
+    and moves to the completed path e.g. "42% - 1.9 of 4.4 GB at 18.3 MB/s, ETA 0:02:15"
+    :param job: current job, so we can update the stage
+    :param str stage: rip/move
+    :param str action: shown before the progress
+    :return: True if the stage is running and has progress
+    """
+    running = job.stages.filter_by(stage=stage, status="running").order_by(JobStage.stage_id.desc()).first()
+    if running is None or not running.detail:
+        return False
+    stage_status = re.search(r"^(\d+)% - (.*), ETA (\S+)$", running.detail)
+    if not stage_status:
+        return False
+    job.stage = f"{action} {stage_status.group(2)}"
+    job.progress = job.progress_round = int(stage_status.group(1))
+    job.eta = stage_status.group(3)
+    return True
+
+
+def process_audio_tracks(job):
+    """
+    Show the progress of an audio disc from its Track rows, the ripper copies abcde's status
+    into them - reading the disc counts for half and encoding for the other half
+    :param job: current job, so we can update the stage
+    :return: False if the tracks have no progress yet (older rips), the logfile is used instead
+    """
+    statuses = [track.status for track in job.tracks]
+    total = len(statuses)
+    read = sum(1 for status in statuses if status in ("ripped", "encoded", "success"))
+    done = statuses.count("success")
+    if total == 0 or read == 0:
+        return False
+    if read < total:
+        job.stage = f"Reading track {read + 1}/{total}"
+    else:
+        job.stage = f"Encoding {done}/{total}"
+    job.eta = calc_process_time(job.start_time, read + done, total * 2)
+    job.progress = round(percentage(read + done, total * 2))
+    job.progress_round = job.progress
+    return True
+
+
 def process_audio_logfile(logfile, job, job_results):
     """
     Process audio disc logs to show current ripping tracks
@@ -216,11 +325,11 @@ def read_log_line(log_file):
     """
     Try to catch if the logfile gets delete before the job is finished\n
     :param log_file:
-    :return:
+    :return: the last 20 lines, the log may have been compressed
     """
     try:
-        line = subprocess.check_output(['tail', '-n', '20', log_file]).splitlines()
-    except subprocess.CalledProcessError:
+        line = log_maintenance.tail_lines(log_file, 20)
+    except OSError:
         app.logger.debug("Error while reading logfile for ETA")
         line = ["", ""]
     return line
@@ -229,7 +338,7 @@ def read_log_line(log_file):
 def read_all_log_lines(log_file):
     """Try to catch if the logfile gets delete before the job is finished"""
     try:
-        with open(log_file, encoding="utf8", errors='ignore') as read_log_file:
+        with log_maintenance.open_log(log_file) as read_log_file:
             line = read_log_file.readlines()
     except FileNotFoundError:
         line = ""
@@ -317,6 +426,13 @@ def delete_job(job_id, mode):
                     app.logger.debug("No errors: job_id=" + str(post_value))
                     drive_utils.job_cleanup(job_id)
                     Track.query.filter_by(job_id=job_id).delete()
+                    JobStage.query.filter_by(job_id=job_id).delete()
+                    JobMetadata.query.filter_by(job_id=job_id).delete()
+                    JobRemoteSync.query.filter_by(job_id=job_id).delete()
+                    DiscFingerprint.query.filter_by(job_id=job_id).delete()
+                    NotificationQueue.query.filter_by(job_id=job_id).delete()
+                    IoAllocation.query.filter_by(job_id=job_id).delete()
+                    SpaceReservation.query.filter_by(job_id=job_id).delete()
                     Job.query.filter_by(job_id=job_id).delete()
                     Config.query.filter_by(job_id=job_id).delete()
                     notification = Notifications(f"Job: {job_id} was Deleted!",
@@ -335,12 +451,30 @@ def delete_job(job_id, mode):
     return json_return
 
 
-def generate_log(logpath, job_id):
+def log_window(value, name):
+    """
+    Read an offset/limit/tail argument of the log api\n
+    :return: int or None if it wasn't given
+    :raises ValueError: if it isn't a positive number
+    """
+    if value is None or value == "":
+        return None
+    number = int(value)
+    if number < 0:
+        raise ValueError(f"{name} can't be negative")
+    return number
+
+
+def generate_log(logpath, job_id, offset=None, limit=None, tail=None):
     """
     Generate log for json api and return it in a valid form\n
+    Only the part of the log asked for is read, and it's read as it's sent, see stream_json\n
     :param str logpath:
     :param str job_id:
-    :return:
+    :param offset: byte to start at, defaults to the start of the log
+    :param limit: most bytes to send, defaults to the rest of the log
+    :param tail: send the last tail lines instead of starting at offset
+    :return: dict, 'log' is an iterator of str chunks
     """
     try:
         job = Job.query.get(int(job_id))
@@ -352,28 +486,48 @@ def generate_log(logpath, job_id):
     if job is None or job.logfile is None or job.logfile == "":
         app.logger.debug(f"Cant find the job {job_id}")
         return {'success': False, 'job': job_id, 'log': 'Not found'}
-    # Assemble full path
-    fullpath = os.path.join(logpath, job.logfile)
-    # Check if the logfile exists
-    my_file = Path(fullpath)
-    if not my_file.is_file():
+    try:
+        offset = log_window(offset, "offset") or 0
+        limit = log_window(limit, "limit")
+        tail = log_window(tail, "tail")
+    except ValueError as error:
+        return {'success': False, 'job': job_id, 'log': f"Bad log range - {error}"}
+    # Assemble full path, the log may have been compressed
+    fullpath = log_maintenance.resolve(os.path.join(logpath, job.logfile))
+    try:
+        size = log_maintenance.log_size(fullpath)
+        if tail is not None:
+            offset = log_maintenance.tail_offset(fullpath, tail)
+        # The log can grow while it's sent, only what's there now is sent
+        end = size if limit is None else min(size, offset + limit)
+        offset = min(offset, end)
+        log = log_maintenance.read_range(fullpath, offset, end - offset)
+    except FileNotFoundError:
         # logfile doesnt exist throw out error template
         app.logger.debug("Couldn't find the logfile requested, Possibly deleted/moved")
         return {'success': False, 'job': job_id, 'log': 'File not found'}
-    try:
-        with open(fullpath) as full_log:
-            read_log = full_log.read()
-    except Exception:
-        try:
-            with open(fullpath, encoding="utf8", errors='ignore') as full_log:
-                read_log = full_log.read()
-        except Exception:
-            app.logger.debug("Cant read logfile. Possibly encoding issue")
-            return {'success': False, 'job': job_id, 'log': 'Cant read logfile'}
-    html_escaped_log = html.escape(read_log)
+    except OSError as error:
+        app.logger.debug(f"Cant read logfile - {error}")
+        return {'success': False, 'job': job_id, 'log': 'Cant read logfile'}
     title_year = str(job.title) + " (" + str(job.year) + ") - file: " + str(job.logfile)
-    return {'success': True, 'job': job_id, 'mode': 'logfile', 'log': html_escaped_log,
-            'escaped': True, 'job_title': title_year}
+    return {'success': True, 'job': job_id, 'mode': 'logfile', 'log': log,
+            'escaped': True, 'job_title': title_year, 'offset': offset, 'next_offset': end, 'size': size}
+
+
+def stream_json(return_json, key):
+    """
+    Send a json object whose value for key is an iterator of text, a chunk at a time\n
+    Each chunk is html escaped and json encoded as it's read, so a big log is never held in memory\n
+    :param dict return_json: the object to send
+    :param str key: key of the iterator
+    :return: iterator of str
+    """
+    chunks = return_json.pop(key)
+    head = json.dumps(return_json, sort_keys=True)
+    yield head[:-1] + (", " if return_json else "") + json.dumps(key) + ': "'
+    for chunk in chunks:
+        yield json.dumps(html.escape(chunk))[1:-1]
+    yield '"}'
 
 
 def abandon_job(job_id):
@@ -464,6 +618,33 @@ def read_notification(notify_id):
     return return_json
 
 
+def notifications_bulk(mode, days):
+    """
+    Json api version of the bulk notification changes, each is one statement\n
+    :param str mode: notify_clear_all/notify_seen_all/notify_delete_old
+    :param days: age in days for notify_delete_old
+    :return: dict with the number of notifications changed
+    """
+    return_json = {'success': False, 'mode': mode, 'count': 0}
+    try:
+        if mode == "notify_clear_all":
+            return_json['count'] = notification_bulk.clear_all()
+        elif mode == "notify_seen_all":
+            return_json['count'] = notification_bulk.mark_all_seen()
+        elif mode == "notify_delete_old":
+            days = int(days)
+            if days < 0:
+                raise ValueError("days can't be negative")
+            return_json['count'] = notification_bulk.delete_older_than(days)
+        return_json['success'] = True
+    except (TypeError, ValueError) as error:
+        return_json['error'] = f"Not a valid number of days - {error}"
+    except Exception as error:
+        app.logger.error(f"Bulk notification change failed - {error}")
+        return_json['error'] = str(error)
+    return return_json
+
+
 def get_notify_timeout(notify_timeout):
     """Return the notification timeout UI setting"""
 
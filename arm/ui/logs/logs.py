@@ -13,6 +13,7 @@ from flask import render_template, request, Blueprint, send_file, session
 from werkzeug.routing import ValidationError
 
 import arm.ui.utils as ui_utils
+from arm.ripper import log_maintenance
 from arm.ui import app
 import arm.config.config as cfg
 
@@ -73,6 +74,8 @@ def logreader():
     # Maybe search database and see if we can match the logname with a previous rip ?
     full_path = os.path.join(log_path, request.args.get('logfile'))
     ui_utils.validate_logfile(request.args.get('logfile'), mode, Path(full_path))
+    # Logs of finished jobs are compressed after a while
+    full_path = log_maintenance.resolve(full_path)
 
     # Only ARM logs
     if mode == "armcat":
@@ -81,7 +84,8 @@ def logreader():
     elif mode == "full":
         generate = ui_utils.generate_full_log(full_path)
     elif mode == "download":
-        return send_file(full_path, as_attachment=True)
+        # conditional answers Range requests with 206 Partial Content so downloads can resume
+        return send_file(full_path, as_attachment=True, conditional=True, max_age=0)
     else:
         # No mode - error out
         raise ValidationError
@@ -1,16 +1,162 @@
 """Main file for interacting with omdb and tmdb"""
+import datetime
+import hashlib
 import urllib
 import json
 import re
 import requests
 from flask.logging import default_handler  # noqa: F401
 
-from arm.ui import app
+from arm.models.metadata_cache import MetadataCache
+from arm.ui import app, db, http_client
+from arm.ui.metrics import registry as metrics
 import arm.config.config as cfg
 
 TMDB_YEAR_REGEX = r"-\d{0,2}-\d{0,2}"
 
 
+def normalise_query(url):
+    """
+    Turn a provider url into a cache key\n
+    The api key is dropped and the parameters are unquoted, lower-cased, whitespace collapsed
+    and sorted so the same search always gives the same key, the key is the sha256 of that so a
+    long query can't share its row with another\n
+    :param str url: full url of the api call
+    :return: str hex digest of path?params
+    """
+    parts = urllib.parse.urlsplit(url)
+    params = []
+    for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True):
+        if key.lower() in ("api_key", "apikey"):
+            continue
+        params.append((key, " ".join(value.casefold().split())))
+    normalised = f"{parts.path}?{urllib.parse.urlencode(sorted(params))}"
+    return hashlib.sha256(normalised.encode()).hexdigest()
+
+
+def response_found(body):
+    """
+    Check if a provider response had any results\n
+    :param str body: raw json response
+    :return: True if found, False if the provider had nothing, None if it's an error that shouldn't be cached
+    """
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return True
+    # OMDb
+    if data.get('Response') == "False":
+        return False if "not found" in str(data.get('Error', '')).lower() else None
+    # TMDb - 34 is "The resource you requested could not be found"
+    if 'status_code' in data:
+        return False if data['status_code'] == 34 else None
+    if data.get('total_results') == 0:
+        return False
+    if 'movie_results' in data and not data['movie_results'] and not data.get('tv_results'):
+        return False
+    # ARM crc64 api
+    if data.get('success') is False:
+        return False
+    return True
+
+
+def cache_lookup(provider, endpoint, query):
+    """
+    Find an unexpired cached response\n
+    :return: str response body or None
+    """
+    if int(cfg.arm_config.get('METADATA_CACHE_TTL', 0)) <= 0:
+        return None
+    try:
+        cached = MetadataCache.query.filter_by(provider=provider, endpoint=endpoint, query_key=query) \
+            .filter(MetadataCache.expires > datetime.datetime.now()).first()
+    except Exception as error:
+        app.logger.debug(f"Metadata cache lookup failed - {error}")
+        return None
+    if cached is None:
+        metrics.METADATA_CACHE.inc(provider=provider, result="miss")
+        return None
+    metrics.METADATA_CACHE.inc(provider=provider, result="hit")
+    app.logger.debug(f"Metadata cache hit - {provider} {endpoint} {query}")
+    return cached.response
+
+
+def cache_store(provider, endpoint, query, body):
+    """
+    Save a response, misses are kept for METADATA_CACHE_NEGATIVE_TTL and errors aren't kept at all\n
+    :param str body: raw response body
+    """
+    ttl = int(cfg.arm_config.get('METADATA_CACHE_TTL', 0))
+    found = response_found(body)
+    if ttl <= 0 or found is None:
+        return
+    if not found:
+        ttl = int(cfg.arm_config.get('METADATA_CACHE_NEGATIVE_TTL', 0))
+        if ttl <= 0:
+            return
+    table = MetadataCache.__table__
+    created = datetime.datetime.now()
+    values = {'response': body, 'found': found, 'created': created,
+              'expires': created + datetime.timedelta(hours=ttl)}
+    try:
+        # Own connection and transaction, so the caller's pending job changes are neither committed nor lost
+        with db.engine.begin() as connection:
+            updated = connection.execute(table.update().where(table.c.provider == provider,
+                                                              table.c.endpoint == endpoint,
+                                                              table.c.query_key == query).values(**values))
+            if updated.rowcount == 0:
+                connection.execute(table.insert().values(provider=provider, endpoint=endpoint,
+                                                         query_key=query, **values))
+    except Exception as error:
+        # Another process may have stored the same query, or the db is locked - not worth retrying
+        app.logger.debug(f"Metadata cache store failed - {error}")
+
+
+def provider_urlopen(provider, endpoint, url):
+    """
+    Read a url, using the metadata cache and recording the latency/errors against the provider\n
+    Unlike provider_get any http error status is raised\n
+    :param str provider: omdb/tmdb/arm
+    :param str endpoint: short name of the api call for the metrics and cache
+    :param str url: url to open
+    :return: bytes of the response body
+    """
+    query = normalise_query(url)
+    body = cache_lookup(provider, endpoint, query)
+    if body is not None:
+        return body.encode()
+    with metrics.METADATA_LATENCY.time(errors=metrics.METADATA_ERRORS, provider=provider, endpoint=endpoint):
+        response = http_client.get(provider, url)
+        response.raise_for_status()
+        raw = response.content
+    cache_store(provider, endpoint, query, raw.decode())
+    return raw
+
+
+def provider_get(provider, endpoint, url):
+    """
+    GET the url, using the metadata cache and recording the latency/errors against the provider\n
+    Not found isn't counted as an error, tmdb uses it for a movie id that is really a tv series\n
+    :param str provider: omdb/tmdb/arm
+    :param str endpoint: short name of the api call for the metrics and cache
+    :param str url: url to get
+    :return: str of the response body
+    """
+    query = normalise_query(url)
+    body = cache_lookup(provider, endpoint, query)
+    if body is not None:
+        return body
+    with metrics.METADATA_LATENCY.time(errors=metrics.METADATA_ERRORS, provider=provider, endpoint=endpoint):
+        response = http_client.get(provider, url)
+    if response.status_code >= 400 and response.status_code != 404:
+        metrics.METADATA_ERRORS.inc(provider=provider, endpoint=endpoint)
+    else:
+        cache_store(provider, endpoint, query, response.text)
+    return response.text
+
+
 def call_omdb_api(title=None, year=None, imdb_id=None, plot="short"):
     """
     Queries OMDbapi.org for title information and parses if it's a movie
@@ -40,13 +186,13 @@ def call_omdb_api(title=None, year=None, imdb_id=None, plot="short"):
         app.logger.debug("no params")
     # connect to omdb and add background key
     try:
-        title_info_json = urllib.request.urlopen(str_url).read()
+        title_info_json = provider_urlopen("omdb", "title" if imdb_id else "search", str_url)
         title_info = json.loads(title_info_json.decode())
         title_info['background_url'] = None
         app.logger.debug(f"omdb - {title_info}")
         if 'Error' in title_info or title_info['Response'] == "False":
             title_info = None
-    except urllib.error.HTTPError as error:
+    except requests.exceptions.RequestException as error:
         app.logger.error(f"omdb call failed with error - {error}")
     else:
         app.logger.debug("omdb - call was successful")
@@ -73,7 +219,7 @@ def get_omdb_poster(title=None, year=None, imdb_id=None, plot="short"):
         app.logger.debug("no params")
         return None, None
     try:
-        title_info_json = urllib.request.urlopen(requests.utils.requote_uri(str_url)).read()
+        title_info_json = provider_urlopen("omdb", "poster", requests.utils.requote_uri(str_url))
     except Exception as error:
         app.logger.debug(f"Failed to reach OMdb - {error}")
     else:
@@ -83,7 +229,7 @@ def get_omdb_poster(title=None, year=None, imdb_id=None, plot="short"):
             return title_info['Search'][0]['Poster'], title_info['Search'][0]['imdbID']
 
         try:
-            title_info_json2 = urllib.request.urlopen(requests.utils.requote_uri(str_url_2)).read()
+            title_info_json2 = provider_urlopen("omdb", "poster", requests.utils.requote_uri(str_url_2))
             title_info2 = json.loads(title_info_json2.decode())
             # app.logger.debug("omdb - " + str(title_info2))
             if 'Error' not in title_info2:
@@ -116,8 +262,8 @@ def get_tmdb_poster(search_query=None, year=None):
 
     # Search tmdb for tv series
     url = f"https://api.themoviedb.org/3/search/tv?api_key={tmdb_api_key}&query={search_query}"
-    response = requests.get(url)
-    search_results = json.loads(response.text)
+    response = provider_get("tmdb", "search_tv", url)
+    search_results = json.loads(response)
     # app.logger.debug(json.dumps(response.json(), indent=4, sort_keys=True))
     if search_results['total_results'] > 0:
         app.logger.debug(search_results['total_results'])
@@ -166,8 +312,8 @@ def tmdb_search(search_query=None, year=None):
     # Search for tv series
     app.logger.debug("tmdb_search - movie not found, trying tv series ")
     url = f"https://api.themoviedb.org/3/search/tv?api_key={tmdb_api_key}&query={search_query}"
-    response = requests.get(url)
-    search_results = json.loads(response.text)
+    response = provider_get("tmdb", "search_tv", url)
+    search_results = json.loads(response)
     if search_results['total_results'] > 0:
         app.logger.debug(search_results['total_results'])
         return tmdb_process_results(poster_base, return_results, search_results, "series")
@@ -179,7 +325,9 @@ def tmdb_search(search_query=None, year=None):
 
 def tmdb_process_results(poster_base, return_results, search_results, media_type="movie"):
     """
-    Process search result so that it follows omdb style of output
+    Process search result so that it follows omdb style of output\n
+    imdbID is left as None, it costs a request per result so only the results that are used
+    get resolved - see tmdb_resolve_imdb\n
     :param poster_base: Base path to the poster
     :param return_results: dict of results to be returned in omdb format
     :param search_results: results from tmdb
@@ -190,7 +338,8 @@ def tmdb_process_results(poster_base, return_results, search_results, media_type
         app.logger.debug(result)
         result['poster_path'] = result['poster_path'] if result['poster_path'] is not None else None
         result['release_date'] = '0000-00-00' if 'release_date' not in result else result['release_date']
-        result['imdbID'] = tmdb_get_imdb(result['id'])
+        result['tmdbID'] = result['id']
+        result['imdbID'] = None
         result['Year'] = re.sub(TMDB_YEAR_REGEX, "", result['first_air_date']) if 'first_air_date' in result else \
             re.sub(TMDB_YEAR_REGEX, "", result['release_date'])
         result['Title'] = result['title'] if 'title' in result else result['name']  # This isn't great
@@ -202,31 +351,39 @@ def tmdb_process_results(poster_base, return_results, search_results, media_type
     return return_results
 
 
-def tmdb_get_imdb(tmdb_id):
+def tmdb_get_imdb(tmdb_id, media_type="movie"):
     """
     Queries api.themoviedb.org for imdb_id by TMDB id\n
+    Only the external_ids are requested, the mapping is kept by the metadata cache\n
     :param tmdb_id: tmdb id of media
-    :return: str of imdb_id
+    :param media_type: movie or series, the other type is tried if the id isn't found
+    :return: str of imdb_id or None
     """
-    # https://api.themoviedb.org/3/movie/78?api_key=
-    # &append_to_response=alternative_titles,changes,credits,images,keywords,lists,releases,reviews,similar,videos
+    # https://api.themoviedb.org/3/movie/78/external_ids?api_key=
     tmdb_api_key = cfg.arm_config['TMDB_API_KEY']
-    url = f"https://api.themoviedb.org/3/movie/{tmdb_id}?api_key={tmdb_api_key}&" \
-          f"append_to_response=alternative_titles,credits,images,keywords,releases,reviews,similar,videos,external_ids"
-    url_tv = f"https://api.themoviedb.org/3/tv/{tmdb_id}/external_ids?api_key={tmdb_api_key}"
-    # Making a get request
-    response = requests.get(url)
-    search_results = json.loads(response.text)
-    # 'status_code' means id wasn't found
-    if 'status_code' in search_results:
-        # Try tv series
-        response = requests.get(url_tv)
-        tv_json = json.loads(response.text)
-        app.logger.debug(tv_json)
-        if 'status_code' not in tv_json:
-            return tv_json['imdb_id']
-        return None
-    return search_results['external_ids']['imdb_id']
+    paths = ["movie", "tv"] if media_type != "series" else ["tv", "movie"]
+    for path in paths:
+        url = f"https://api.themoviedb.org/3/{path}/{tmdb_id}/external_ids?api_key={tmdb_api_key}"
+        external_ids = json.loads(provider_get("tmdb", f"{path}_external_ids", url))
+        # 'status_code' means id wasn't found
+        if 'status_code' not in external_ids:
+            return external_ids.get('imdb_id') or None
+        app.logger.debug(f"tmdb {path} {tmdb_id} not found - {external_ids}")
+    return None
+
+
+def tmdb_resolve_imdb(result):
+    """
+    Fill in the imdbID of a tmdb result that doesn't have one yet\n
+    :param dict result: a result from tmdb_process_results, updated in place
+    :return: None
+    """
+    if result.get('imdbID') or not result.get('tmdbID'):
+        return
+    try:
+        result['imdbID'] = tmdb_get_imdb(result['tmdbID'], result.get('Type', "movie"))
+    except (requests.exceptions.RequestException, ValueError) as error:
+        app.logger.error(f"Failed to get imdb id for tmdb {result['tmdbID']} - {error}")
 
 
 def tmdb_find(imdb_id):
@@ -240,8 +397,8 @@ def tmdb_find(imdb_id):
     poster_size = "original"
     poster_base = f"https://image.tmdb.org/t/p/{poster_size}"
     # Making a get request
-    response = requests.get(url)
-    search_results = json.loads(response.text)
+    response = provider_get("tmdb", "find", url)
+    search_results = json.loads(response)
     # app.logger.debug(f"tmdb_find = {search_results}")
     if len(search_results['movie_results']) > 0:
         # We want to push out everything even if we don't use it right now, it may be used later.
@@ -286,7 +443,7 @@ def tmdb_fetch_results(search_query, year, tmdb_api_key):
     :param str search_query: search query from ARMui
     :param str year: the year of the movie/tv-show
     :param str tmdb_api_key: tmdb API key
-    :return: [search_results dict, poster_img string, requests Response]
+    :return: [search_results dict, poster_img string, response body string]
     """
     # https://api.themoviedb.org/3/movie/78?api_key= # base url
     # Additional
@@ -299,6 +456,6 @@ def tmdb_fetch_results(search_query, year, tmdb_api_key):
     # "w92", "w154", "w185", "w342", "w500", "w780", "original"
     poster_size = "original"
     poster_base = f"https://image.tmdb.org/t/p/{poster_size}"
-    response = requests.get(url)
-    return_json = json.loads(response.text)
+    response = provider_get("tmdb", "search_movie", url)
+    return_json = json.loads(response)
     return return_json, poster_base, response
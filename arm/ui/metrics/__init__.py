@@ -0,0 +1,3 @@
+"""
+ARM route blueprint for prometheus metrics
+"""
@@ -0,0 +1,129 @@
+"""
+ARM route blueprint for prometheus metrics
+Covers
+- metrics [GET]
+"""
+import datetime
+import threading
+import time
+
+from flask import Blueprint, Response, request, g
+from sqlalchemy import func
+
+from arm.ripper import io_scheduler
+from arm.ui import app, db, eta
+from arm.models.job import Job
+from arm.models.job_stage import JobStage
+from arm.models.system_drives import SystemDrives
+from arm.ui.metrics import registry as metrics, shared
+
+route_metrics = Blueprint('route_metrics', __name__)
+
+# Stages and jobs that finished before the ui started aren't counted, the same as
+# any other counter that resets when the process restarts
+_collect_lock = threading.Lock()
+_stage_watermark = datetime.datetime.now()
+_job_watermark = datetime.datetime.now()
+
+
+@route_metrics.before_app_request
+def start_request_timer():
+    """Remember when the request started"""
+    g.metrics_start = time.perf_counter()
+
+
+@route_metrics.after_app_request
+def observe_request(response):
+    """Record how long the request took against the route that served it"""
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, route=route,
+                                        method=request.method, status=response.status_code)
+    return response
+
+
+def collect_jobs():
+    """Fill the active job, transcode queue, drive and disk I/O gauges from the database"""
+    metrics.JOBS_ACTIVE.clear()
+    active = db.session.query(Job.status, Job.disctype, func.count(Job.job_id)) \
+        .filter(Job.status.notin_(["success", "fail"])) \
+        .group_by(Job.status, Job.disctype)
+    waiting = 0
+    for status, disctype, count in active:
+        metrics.JOBS_ACTIVE.set(count, status=status, disctype=disctype)
+        if status == "waiting_transcode":
+            waiting += count
+    metrics.TRANSCODE_QUEUE_DEPTH.set(waiting)
+
+    oldest = db.session.query(func.min(JobStage.start_time)) \
+        .filter(JobStage.stage == "transcode_wait", JobStage.status == "running").scalar()
+    oldest_wait = (datetime.datetime.now() - oldest).total_seconds() if oldest else 0.0
+    metrics.TRANSCODE_QUEUE_WAIT.set(oldest_wait)
+
+    metrics.DRIVE_BUSY.clear()
+    for drive in SystemDrives.query.all():
+        busy = drive.job_current is not None and drive.job_current.status not in ("success", "fail")
+        metrics.DRIVE_BUSY.set(1 if busy else 0, drive=drive.name, mount=drive.mount)
+
+    metrics.IO_ALLOCATIONS.clear()
+    metrics.IO_ALLOCATED_MBPS.clear()
+    for device in io_scheduler.snapshot():
+        metrics.IO_ALLOCATED_MBPS.set(device['used'], device=device['name'])
+        counts = {}
+        for allocation in device['allocations']:
+            key = (allocation.stage, allocation.status)
+            counts[key] = counts.get(key, 0) + 1
+        for (stage, status), count in counts.items():
+            metrics.IO_ALLOCATIONS.set(count, device=device['name'], stage=stage, status=status)
+
+
+def collect_stages():
+    """
+    Add the stages and jobs that finished since the last scrape to the histograms\n
+    The rip/transcode stages run in the ripper processes so they are picked up from the database
+    """
+    global _stage_watermark, _job_watermark
+
+    stages = JobStage.query.filter(JobStage.stop_time > _stage_watermark) \
+        .order_by(JobStage.stop_time).all()
+    for stage in stages:
+        metrics.STAGE_DURATION.observe(stage.duration or 0.0, stage=stage.stage, status=stage.status)
+        _stage_watermark = stage.stop_time
+
+    jobs = Job.query.filter(Job.stop_time > _job_watermark).order_by(Job.stop_time).all()
+    for job in jobs:
+        _job_watermark = job.stop_time
+        if job.status != "success":
+            continue
+        content = eta.content_seconds(job, job.tracks.all(), job.config)
+        if content <= 0:
+            continue
+        finished = job.stages.filter(JobStage.status == "success").all()
+        rip_time = sum(stage.duration or 0.0 for stage in finished if stage.stage == "rip")
+        transcode_time = sum(stage.duration or 0.0 for stage in finished if stage.stage == "transcode")
+        if rip_time > 0:
+            metrics.RIP_THROUGHPUT.observe(content / rip_time, drive=job.devpath, disctype=job.disctype)
+        if transcode_time > 0:
+            metrics.TRANSCODE_THROUGHPUT.observe(content / transcode_time, preset=eta.get_preset(job))
+
+
+@route_metrics.route('/metrics')
+def metrics_feed():
+    """
+    Prometheus text exposition of the ARM internals\n
+    Left open like any other exporter so prometheus can scrape without logging in
+    """
+    with _collect_lock:
+        try:
+            collect_jobs()
+            collect_stages()
+        except Exception as error:
+            app.logger.error(f"Failed to collect metrics from the database - {error}")
+            db.session.rollback()
+        try:
+            ripper_metrics = shared.collect()
+        except OSError as error:
+            app.logger.error(f"Failed to collect the metrics of the rippers - {error}")
+            ripper_metrics = {}
+    return Response(metrics.render_all(ripper_metrics), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,255 @@
+"""
+In-process metrics for A.R.M
+
+Counters, gauges and histograms are kept in memory and rendered in the prometheus
+text exposition format by the /metrics route, so a scrape never has to read logs.
+Every metric is thread safe as the ui is served by multiple waitress threads.
+The rippers are separate processes, their counters and histograms reach /metrics through
+the files written by shared.py.
+"""
+import copy
+import threading
+import time
+from contextlib import contextmanager
+
+# Buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STAGE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+# Seconds of content per wall second
+THROUGHPUT_BUCKETS = (0.25, 0.5, 1, 1.5, 2, 3, 4, 6, 8, 12, 16, 32)
+
+
+def escape_label(value):
+    """Escape a label value for the text exposition format"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(label_names, label_values, extra=None):
+    """
+    Build the {name="value"} part of a sample\n
+    :param label_names: tuple of label names
+    :param label_values: tuple of label values in the same order
+    :param extra: optional (name, value) appended to the labels (le for buckets)
+    :return: str
+    """
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    """Prometheus wants +Inf and plain numbers"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Base class for all metrics, holds one value per set of label values
+    """
+    metric_type = "untyped"
+    # Added up with the values of the rippers when rendered
+    shared = False
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def clear(self):
+        """Drop every labelled value - used by gauges filled at scrape time"""
+        with self._lock:
+            self._values = {}
+
+    def export(self):
+        """The values as a json friendly list of [label values, value]"""
+        with self._lock:
+            return [[list(key), copy.deepcopy(value)] for key, value in self._values.items()]
+
+    @staticmethod
+    def add_value(total, value):
+        """Add one exported value to another"""
+        return total + value
+
+    def add_values(self, values, exported):
+        """
+        Add exported values into a dict of values\n
+        :param dict values: label values: value, updated in place
+        :param exported: list of [label values, value] from export()
+        """
+        for key, value in exported:
+            key = tuple(key)
+            values[key] = self.add_value(values[key], value) if key in values else copy.deepcopy(value)
+
+    def values(self, shared=()):
+        """
+        The values of this process, plus the values other processes exported\n
+        :param shared: list of [label values, value]
+        :return: dict label values: value
+        """
+        with self._lock:
+            values = copy.deepcopy(self._values)
+        if self.shared:
+            self.add_values(values, shared)
+        return values
+
+    def samples(self, shared=()):
+        """Yields (suffix, label values, extra label, value) for every sample"""
+        for key, value in sorted(self.values(shared).items()):
+            yield "", key, None, value
+
+    def render(self, shared=()):
+        """
+        Render the metric in the text exposition format\n
+        :param shared: values exported by other processes
+        :return: list of lines
+        """
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.metric_type}"]
+        for suffix, key, extra, value in self.samples(shared):
+            lines.append(f"{self.name}{suffix}{format_labels(self.label_names, key, extra)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+    metric_type = "counter"
+    shared = True
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter for the given labels"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that can go up and down"""
+    metric_type = "gauge"
+
+    def set(self, value, **labels):
+        """Set the gauge for the given labels"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative buckets"""
+    metric_type = "histogram"
+    shared = True
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        """Add one observation for the given labels"""
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            item = self._values[key]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    item['buckets'][index] += 1
+            item['sum'] += value
+            item['count'] += 1
+
+    @contextmanager
+    def time(self, errors=None, **labels):
+        """
+        Time the wrapped block\n
+        :param errors: Counter to increase when the block raises
+        :param labels: labels for the histogram (and the error counter)
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            if errors is not None:
+                errors.inc(**labels)
+            raise
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def add_value(total, value):
+        if len(total['buckets']) != len(value['buckets']):
+            # Written with other buckets by an older version
+            return total
+        return {'buckets': [first + second for first, second in zip(total['buckets'], value['buckets'])],
+                'sum': total['sum'] + value['sum'], 'count': total['count'] + value['count']}
+
+    def samples(self, shared=()):
+        for key, item in sorted(self.values(shared).items()):
+            for bound, count in zip(self.buckets, item['buckets']):
+                yield "_bucket", key, ("le", format_value(bound)), count
+            yield "_sum", key, None, item['sum']
+            yield "_count", key, None, item['count']
+
+
+REGISTRY = []
+
+# ui
+REQUEST_LATENCY = Histogram("arm_ui_request_duration_seconds", "Time taken to serve ui requests",
+                            ("route", "method", "status"))
+# Database
+DB_COMMIT_LATENCY = Histogram("arm_db_commit_duration_seconds",
+                              "Time taken by database commits of the ui and the rippers", ("caller",))
+DB_LOCK_RETRIES = Counter("arm_db_lock_retries_total",
+                          "Commits of the ui and the rippers retried because the database was locked", ("caller",))
+# Metadata providers
+METADATA_LATENCY = Histogram("arm_metadata_request_duration_seconds",
+                             "Time taken by metadata api calls of the ui and the rippers", ("provider", "endpoint"))
+METADATA_ERRORS = Counter("arm_metadata_request_errors_total", "Metadata api calls that failed",
+                          ("provider", "endpoint"))
+METADATA_CACHE = Counter("arm_metadata_cache_requests_total", "Metadata cache lookups by result (hit/miss)",
+                         ("provider", "result"))
+HTTP_CIRCUIT_OPEN = Gauge("arm_http_circuit_open", "1 while calls to the provider from the ui are failing fast",
+                          ("provider",))
+HTTP_CIRCUIT_REJECTED = Counter("arm_http_circuit_rejected_total",
+                                "Calls not made because the circuit breaker was open", ("provider",))
+# Notifications
+NOTIFY_LATENCY = Histogram("arm_notification_delivery_duration_seconds",
+                           "Time taken to deliver notifications from the ui and the rippers", ("channel",))
+NOTIFY_ERRORS = Counter("arm_notification_delivery_errors_total",
+                        "Notifications from the ui and the rippers that failed to deliver", ("channel",))
+# Jobs - filled from the database when scraped
+JOBS_ACTIVE = Gauge("arm_jobs_active", "Jobs that haven't finished", ("status", "disctype"))
+TRANSCODE_QUEUE_DEPTH = Gauge("arm_transcode_queue_depth", "Jobs waiting for a transcode slot")
+TRANSCODE_QUEUE_WAIT = Gauge("arm_transcode_queue_oldest_wait_seconds",
+                             "How long the oldest job in the transcode queue has been waiting")
+DRIVE_BUSY = Gauge("arm_drive_busy", "1 if the drive has a job running", ("drive", "mount"))
+IO_ALLOCATIONS = Gauge("arm_io_allocations", "Rips, transcodes and moves using or waiting for a disk",
+                       ("device", "stage", "status"))
+IO_ALLOCATED_MBPS = Gauge("arm_io_allocated_mbps", "MB/s given out on a disk", ("device",))
+STAGE_DURATION = Histogram("arm_job_stage_duration_seconds", "Time taken by each finished job stage",
+                           ("stage", "status"), buckets=STAGE_BUCKETS)
+RIP_THROUGHPUT = Histogram("arm_rip_throughput_ratio", "Seconds of content ripped per wall second",
+                           ("drive", "disctype"), buckets=THROUGHPUT_BUCKETS)
+TRANSCODE_THROUGHPUT = Histogram("arm_transcode_throughput_ratio", "Seconds of content transcoded per wall second",
+                                 ("preset",), buckets=THROUGHPUT_BUCKETS)
+
+
+def render_all(shared=None):
+    """
+    Render every registered metric\n
+    :param shared: dict metric name: values exported by the rippers
+    :return: str in the text exposition format
+    """
+    shared = shared or {}
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(shared.get(metric.name, ())))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,129 @@
+"""
+Metrics shared by the ripper processes
+
+Every disc is ripped by its own process, so what a ripper records (database commits, metadata
+calls, notification deliveries) never reaches the registry of the ui. Each ripper writes its
+counters and histograms to <pid>-<start>.json in the metrics folder next to the database, every
+FLUSH_INTERVAL seconds and when it exits, and /metrics adds them to the values of the ui.
+The files of rippers that have exited are folded into archive.json so their counts keep adding
+up without the folder growing. Gauges aren't shared, they describe the process that sets them.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+import psutil
+
+import arm.config.config as cfg
+from arm.ui.metrics import registry
+
+# Seconds between the writes of a ripper
+FLUSH_INTERVAL = 15
+ARCHIVE = "archive.json"
+LOCK_FILE = ".lock"
+
+_started = int(time.time())
+_thread = None
+
+
+def store_dir():
+    """Folder the rippers write their metrics to"""
+    return os.path.join(os.path.dirname(cfg.arm_config['DBFILE']), "metrics")
+
+
+def read(path):
+    """
+    Read the metrics a process wrote\n
+    :return: dict metric name: list of [label values, value], empty when it can't be read
+    """
+    try:
+        with open(path) as metrics_file:
+            return json.load(metrics_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write(path, values):
+    """Replace a metrics file in one go, so it's never read half written"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as metrics_file:
+        json.dump(values, metrics_file)
+    os.replace(temp_path, path)
+
+
+def combine(*exported):
+    """
+    Add up the metrics written by several processes\n
+    :param exported: dicts metric name: list of [label values, value]
+    :return: dict in the same form
+    """
+    shared = {metric.name: metric for metric in registry.REGISTRY if metric.shared}
+    totals = {}
+    for values in exported:
+        for name, samples in values.items():
+            # Metrics that have been removed since are dropped
+            if name in shared:
+                shared[name].add_values(totals.setdefault(name, {}), samples)
+    return {name: [[list(key), value] for key, value in values.items()] for name, values in totals.items()}
+
+
+def flush():
+    """Write the counters and histograms of this process for the ui to add up"""
+    try:
+        os.makedirs(store_dir(), exist_ok=True)
+        write(os.path.join(store_dir(), f"{os.getpid()}-{_started}.json"),
+              {metric.name: metric.export() for metric in registry.REGISTRY if metric.shared})
+    except OSError as error:
+        logging.debug(f"Couldn't write the metrics of this process - {error}")
+
+
+def run():
+    """Write the metrics every FLUSH_INTERVAL seconds"""
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def start():
+    """Share the metrics of this process until it exits, called by the ripper"""
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=run, name="shared_metrics", daemon=True)
+        _thread.start()
+        atexit.register(flush)
+
+
+def collect():
+    """
+    The counters and histograms written by every ripper, for /metrics\n
+    :return: dict metric name: list of [label values, value]
+    """
+    folder = store_dir()
+    if not os.path.isdir(folder):
+        return {}
+    with open(os.path.join(folder, LOCK_FILE), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            running, exited = [], []
+            for entry in os.scandir(folder):
+                if not entry.name.endswith(".json") or entry.name == ARCHIVE:
+                    continue
+                try:
+                    pid = int(entry.name.split("-")[0])
+                except ValueError:
+                    continue
+                (running if psutil.pid_exists(pid) else exited).append(entry.path)
+            archive_path = os.path.join(folder, ARCHIVE)
+            archive = read(archive_path)
+            if exited:
+                archive = combine(archive, *[read(path) for path in exited])
+                write(archive_path, archive)
+                for path in exited:
+                    os.remove(path)
+            return combine(archive, *[read(path) for path in running])
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
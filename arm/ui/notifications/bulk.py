@@ -0,0 +1,91 @@
+"""
+Bulk notification changes, each one a single UPDATE/DELETE however many notifications it touches
+
+The retention policy keeps the notifications table bounded, notifications older than
+NOTIFY_RETENTION_DAYS are deleted and then the oldest ones past NOTIFY_MAX_COUNT.
+"""
+import datetime
+
+import arm.config.config as cfg
+from arm.models.notifications import Notifications
+from arm.ui import app, db
+from arm.ui.notifications import counter
+
+
+def commit():
+    """Commit the statement, the session is rolled back if it fails"""
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        # Bulk statements don't go through the session events that keep the count up to date
+        counter.invalidate()
+
+
+def clear_all():
+    """
+    Clear every notification that hasn't been cleared\n
+    :return: number of notifications cleared
+    """
+    cleared = Notifications.query.filter(Notifications.cleared.is_(False)) \
+        .update({'cleared': True, 'cleared_time': datetime.datetime.now()}, synchronize_session=False)
+    commit()
+    return cleared
+
+
+def mark_all_seen():
+    """
+    Mark every unseen notification as seen, so it's no longer shown as a popup\n
+    :return: number of notifications marked
+    """
+    seen = Notifications.query.filter(Notifications.seen.is_(False)) \
+        .update({'seen': True, 'dismiss_time': datetime.datetime.now()}, synchronize_session=False)
+    commit()
+    return seen
+
+
+def delete_older_than(days):
+    """
+    Delete the notifications triggered more than days ago\n
+    :param int days: age in days
+    :return: number of notifications deleted
+    """
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    deleted = Notifications.query.filter(Notifications.trigger_time < cutoff).delete(synchronize_session=False)
+    commit()
+    return deleted
+
+
+def keep_newest(count):
+    """
+    Delete all but the newest count notifications\n
+    :return: number of notifications deleted
+    """
+    # The id of the newest notification that doesn't fit, everything up to it goes
+    last_deleted = db.session.query(Notifications.id).order_by(Notifications.id.desc()) \
+        .offset(count).limit(1).scalar_subquery()
+    deleted = Notifications.query.filter(Notifications.id <= last_deleted).delete(synchronize_session=False)
+    commit()
+    return deleted
+
+
+def apply_retention():
+    """
+    Delete notifications past NOTIFY_RETENTION_DAYS and then past NOTIFY_MAX_COUNT, 0 turns each off\n
+    :return: number of notifications deleted
+    """
+    days = int(cfg.arm_config.get('NOTIFY_RETENTION_DAYS', 30) or 0)
+    max_count = int(cfg.arm_config.get('NOTIFY_MAX_COUNT', 1000) or 0)
+    deleted = 0
+    try:
+        if days > 0:
+            deleted += delete_older_than(days)
+        if max_count > 0:
+            deleted += keep_newest(max_count)
+    except Exception as error:
+        app.logger.error(f"Couldn't apply the notification retention - {error}")
+    if deleted:
+        app.logger.info(f"Deleted {deleted} old notifications")
+    return deleted
@@ -0,0 +1,45 @@
+"""
+Cached count of the uncleared notifications for the navbar
+
+Every page render shows the count, so it's kept here instead of being counted each time. It's
+thrown away whenever this process writes a notification. The ripper writes them from another
+process, so the count is also only trusted for COUNT_TTL seconds.
+"""
+import threading
+import time
+
+from sqlalchemy import event
+
+from arm.models.notifications import Notifications
+
+# Seconds the count is trusted, for notifications written by other processes
+COUNT_TTL = 10
+
+_lock = threading.Lock()
+_count = {'value': None, 'read': 0}
+
+
+def uncleared_count():
+    """
+    Number of notifications that haven't been cleared\n
+    :return: int
+    """
+    with _lock:
+        if _count['value'] is not None and time.monotonic() - _count['read'] < COUNT_TTL:
+            return _count['value']
+    value = Notifications.query.filter(Notifications.cleared.is_(False)).count()
+    with _lock:
+        _count['value'] = value
+        _count['read'] = time.monotonic()
+    return value
+
+
+def invalidate(*_args):
+    """Forget the count, called when notifications are written"""
+    with _lock:
+        _count['value'] = None
+
+
+# Notifications added, changed or deleted through the session, bulk changes call invalidate themselves
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(Notifications, _event, invalidate)
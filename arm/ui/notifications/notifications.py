@@ -4,14 +4,17 @@ Covers
 - arm_nav_notify [GET]
 - arm_notification [GET]
 - arm_notification_close [GET}
+- arm_notification_seen [GET]
+- arm_notification_delete [GET]
 """
 
 from flask_login import login_required  # noqa: F401
-from flask import render_template, Blueprint, redirect, flash, session
+from flask import render_template, Blueprint, redirect, flash, session, request
 from datetime import datetime
 
-import arm.ui.utils as ui_utils
+import arm.config.config as cfg
 from arm.ui import app
+from arm.ui.notifications import bulk, counter
 from arm.models.notifications import Notifications
 
 route_notifications = Blueprint('route_notifications', __name__,
@@ -22,10 +25,10 @@ route_notifications = Blueprint('route_notifications', __name__,
 @app.context_processor
 def arm_nav_notify():
     """
-    inject the unread notification count to all pages for the navbar count
+    inject the unread notification count to all pages for the navbar count, it's cached
     """
     try:
-        notify_count = Notifications.query.filter_by(cleared='0').count()
+        notify_count = counter.uncleared_count()
         app.logger.debug(notify_count)
 
     except Exception:
@@ -43,9 +46,6 @@ def arm_notification():
     notifications_new = Notifications.query.filter_by(cleared='0').order_by(Notifications.id.desc()).all()
 
     if len(notifications_new) != 0:
-        if len(notifications_new) > 100:
-            flash(f'Please note clearing {len(notifications_new)} Notifications will take some time', 'warning')
-
         # get the current time for each notification and then save back into notification
         for notification in notifications_new:
             notification.diff_time = datetime.now().replace(microsecond=0) - notification.trigger_time
@@ -55,28 +55,50 @@ def arm_notification():
     session["page_title"] = "Notifications"
 
     return render_template('notificationview.html',
-                           notifications_new=notifications_new)
+                           notifications_new=notifications_new,
+                           retention_days=int(cfg.arm_config.get('NOTIFY_RETENTION_DAYS', 30) or 30))
 
 
 @route_notifications.route('/notificationclose')
 @login_required
 def arm_notification_close():
     """
-    function to close all open notifications
+    function to close all open notifications, in one update
     """
-    notifications = Notifications.query.filter_by(cleared='0').all()
+    cleared = bulk.clear_all()
 
-    if len(notifications) != 0:
-        # get the current time for each notification and then save back into notification
-        for notification in notifications:
-            args = {
-                'cleared': True,
-                'cleared_time': datetime.now()
-            }
-            ui_utils.database_updater(args, notification)
-
-        flash(f'Cleared {len(notifications)} Notifications', 'success')
+    if cleared:
+        flash(f'Cleared {cleared} Notifications', 'success')
     else:
         flash('No notifications to clear', 'error')
 
     return redirect("/notificationview")
+
+
+@route_notifications.route('/notificationseen')
+@login_required
+def arm_notification_seen():
+    """
+    function to mark all notifications as seen so they stop popping up, in one update
+    """
+    seen = bulk.mark_all_seen()
+    flash(f'Marked {seen} Notifications as seen', 'success')
+    return redirect("/notificationview")
+
+
+@route_notifications.route('/notificationdelete')
+@login_required
+def arm_notification_delete():
+    """
+    function to delete notifications older than ?days= days, in one delete
+    """
+    try:
+        days = int(request.args.get('days', ''))
+        if days < 0:
+            raise ValueError
+    except ValueError:
+        flash('Days must be a positive number', 'error')
+        return redirect("/notificationview")
+    deleted = bulk.delete_older_than(days)
+    flash(f'Deleted {deleted} Notifications older than {days} days', 'success')
+    return redirect("/notificationview")
@@ -0,0 +1 @@
+"""Local cache of the poster and cover art images"""
@@ -0,0 +1,241 @@
+"""
+Local cache of the poster and cover art images
+
+Jobs only keep the remote url of their poster (TMDb/OMDb posters, coverartarchive cd art),
+so without the cache every page load makes the browser fetch the full size image from the
+provider. The first time a url is shown it's downloaded once in the background, resized to a
+thumbnail and a detail image and kept under the hash of its content. Until then the page
+still shows the remote url.
+
+Only used when the "save_remote_images" ui setting is on.
+"""
+import datetime
+import hashlib
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+import arm.config.config as cfg
+import arm.ui.utils as ui_utils
+from arm.models.poster_cache import PosterCache
+from arm.models.ui_settings import UISettings
+from arm.ui import app, db, http_client
+
+# Downloads run at once
+DOWNLOAD_WORKERS = 2
+# Images bigger than this aren't cached
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+# Width of each variant, "original" is the downloaded image as it is
+VARIANTS = {"thumb": 240, "detail": 500}
+# Seconds before a url that failed to download is tried again
+RETRY_FAILED = 3600
+# Seconds the save_remote_images setting is trusted before reading it again
+SETTING_TTL = 30
+# TMDb serves every poster size from the same path, no need to download the original
+TMDB_ORIGINAL = re.compile(r"^(https?://image\.tmdb\.org/t/p/)original/")
+TMDB_SIZE = "w780"
+EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="posters")
+# url -> (content hash or None, time of the last attempt), loaded from poster_cache on first use
+_cached = None
+_pending = set()
+_setting = {'enabled': False, 'read': 0}
+
+
+def cache_dir():
+    """The images are kept next to the database"""
+    return os.path.join(os.path.dirname(cfg.arm_config['DBFILE']), "posters")
+
+
+def image_dir(content_hash):
+    """Images are split into folders by the first 2 characters of their hash"""
+    return os.path.join(cache_dir(), content_hash[:2])
+
+
+def url_hash(url):
+    """Key of the url in poster_cache"""
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def enabled():
+    """
+    Check the save_remote_images setting, it's only read from the database every SETTING_TTL seconds\n
+    :return: bool
+    """
+    now = time.monotonic()
+    if now - _setting['read'] > SETTING_TTL:
+        try:
+            armui_cfg = UISettings.query.get(1)
+            _setting['enabled'] = bool(armui_cfg and armui_cfg.save_remote_images)
+        except Exception as error:
+            app.logger.debug(f"Couldn't read save_remote_images - {error}")
+            _setting['enabled'] = False
+        _setting['read'] = now
+    return _setting['enabled']
+
+
+def reset_setting():
+    """The settings page changed the ui settings, read them again on the next check"""
+    _setting['read'] = 0
+
+
+def load_cache():
+    """Read what has been cached so far, only done once"""
+    global _cached
+    with _lock:
+        if _cached is not None:
+            return
+    cached = {}
+    for entry in PosterCache.query.all():
+        attempt = entry.created.timestamp() if entry.created else 0
+        cached[entry.url] = (entry.content_hash if entry.status == "cached" else None, attempt)
+    with _lock:
+        if _cached is None:
+            _cached = cached
+
+
+def download_url(url):
+    """The url to download, TMDb posters are fetched at TMDB_SIZE instead of the original"""
+    return TMDB_ORIGINAL.sub(rf"\g<1>{TMDB_SIZE}/", url)
+
+
+def download(url):
+    """
+    Download an image\n
+    :param str url: image url
+    :return: (bytes, extension)
+    :raises ValueError: if it isn't an image or it's too big
+    :raises requests.exceptions.RequestException: if it couldn't be downloaded
+    """
+    # Each image host gets its own circuit breaker
+    response = http_client.get(urlparse(url).netloc, download_url(url), stream=True)
+    with response:
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type not in EXTENSIONS:
+            raise ValueError(f"not an image - {content_type}")
+        content = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            content += chunk
+            if len(content) > MAX_IMAGE_BYTES:
+                raise ValueError(f"image is bigger than {MAX_IMAGE_BYTES} bytes")
+    return bytes(content), EXTENSIONS[content_type]
+
+
+def resize(source, width, destination):
+    """
+    Resize an image with ffmpeg, which ARM already needs for the disc posters\n
+    Images narrower than width are only converted\n
+    :return: True if the variant was made
+    """
+    tmp_path = destination + ".tmp.jpg"
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", "-i", source,
+           "-vf", f"scale='min({width},iw)':-2", "-frames:v", "1", "-q:v", "3", tmp_path]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, timeout=60)
+        os.replace(tmp_path, destination)
+        return True
+    except (OSError, subprocess.SubprocessError) as error:
+        app.logger.debug(f"Couldn't resize {source} - {error}")
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def store(content, extension):
+    """
+    Save an image and its variants under the hash of its content\n
+    :return: str content hash
+    """
+    content_hash = hashlib.sha256(content).hexdigest()
+    folder = image_dir(content_hash)
+    os.makedirs(folder, exist_ok=True)
+    original = os.path.join(folder, content_hash + extension)
+    if not os.path.isfile(original):
+        tmp_path = original + ".tmp"
+        with open(tmp_path, "wb") as writer:
+            writer.write(content)
+        os.replace(tmp_path, original)
+    for variant, width in VARIANTS.items():
+        destination = os.path.join(folder, f"{content_hash}_{variant}.jpg")
+        if not os.path.isfile(destination):
+            resize(original, width, destination)
+    return content_hash
+
+
+def fetch(url):
+    """
+    Download and store one url, run by the download pool\n
+    :param str url: image url
+    """
+    content_hash = None
+    try:
+        content, extension = download(url)
+        content_hash = store(content, extension)
+        app.logger.debug(f"Cached poster {url} as {content_hash}")
+    except (requests.exceptions.RequestException, ValueError, OSError) as error:
+        app.logger.info(f"Couldn't cache poster {url} - {error}")
+
+    with app.app_context():
+        try:
+            entry = PosterCache.query.filter_by(url_hash=url_hash(url)).first()
+            if entry is None:
+                entry = PosterCache(url_hash(url), url, content_hash, "")
+                db.session.add(entry)
+            entry.content_hash = content_hash
+            entry.status = "cached" if content_hash else "failed"
+            entry.created = datetime.datetime.now()
+            ui_utils.database_updater({}, None)
+        except Exception as error:
+            app.logger.error(f"Couldn't save the poster cache entry for {url} - {error}")
+    with _lock:
+        _cached[url] = (content_hash, time.time())
+        _pending.discard(url)
+
+
+def local_url(url, variant="thumb"):
+    """
+    The url to show for a poster\n
+    :param str url: remote poster url
+    :param str variant: thumb/detail/original
+    :return: the cached image url, or the remote url while it's being downloaded
+    """
+    if not url or not str(url).startswith(("http://", "https://")) or not enabled():
+        return url
+    load_cache()
+    with _lock:
+        content_hash, attempt = _cached.get(url, (None, 0))
+        if content_hash:
+            return f"/posters/{content_hash}/{variant}"
+        if url in _pending or time.time() - attempt < RETRY_FAILED:
+            return url
+        _pending.add(url)
+    _executor.submit(fetch, url)
+    return url
+
+
+def image_path(content_hash, variant):
+    """
+    Find the file for a cached image, falls back to the original when a variant couldn't be made\n
+    :return: str path or None
+    """
+    if not re.fullmatch(r"[0-9a-f]{64}", content_hash):
+        return None
+    folder = image_dir(content_hash)
+    if variant in VARIANTS:
+        path = os.path.join(folder, f"{content_hash}_{variant}.jpg")
+        if os.path.isfile(path):
+            return path
+    for extension in EXTENSIONS.values():
+        path = os.path.join(folder, content_hash + extension)
+        if os.path.isfile(path):
+            return path
+    return None
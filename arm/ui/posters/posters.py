@@ -0,0 +1,39 @@
+"""
+ARM route blueprint for the cached posters
+Covers
+- posters/<content_hash>/<variant> [GET]
+- poster jinja filter
+"""
+from flask import Blueprint, abort, send_file
+
+from arm.ui.posters import cache
+
+route_posters = Blueprint('route_posters', __name__)
+
+# The path holds the hash of the image, so it can never change
+CACHE_MAX_AGE = 31536000
+
+
+@route_posters.app_template_filter('poster')
+def poster_filter(url, variant="thumb"):
+    """
+    Jinja filter for poster urls e.g. {{ job.poster_url|poster('detail') }}\n
+    :return: the cached image or the remote url until it's been downloaded
+    """
+    return cache.local_url(url, variant)
+
+
+@route_posters.route('/posters/<content_hash>/<variant>')
+def poster(content_hash, variant):
+    """
+    Serve a cached poster\n
+    :param content_hash: sha256 of the image
+    :param variant: thumb/detail/original
+    """
+    path = cache.image_path(content_hash, variant)
+    if path is None:
+        abort(404)
+    response = send_file(path, max_age=CACHE_MAX_AGE, conditional=True, etag=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
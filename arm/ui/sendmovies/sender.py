@@ -0,0 +1,133 @@
+"""
+Background sender for the send_movies page
+
+Pages through the identified dvd jobs, sends them to the ARM remote crc64 database with a
+small pool of threads and records every result in job_remote_sync. Jobs that were already
+accepted are skipped unless their details have changed since.
+"""
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import arm.ui.utils as ui_utils
+from arm.models.job import Job
+from arm.models.job_remote_sync import JobRemoteSync
+from arm.ui import app, db
+
+# Jobs sent to the api at once
+SEND_WORKERS = 4
+# Jobs read from the database at a time
+PAGE_SIZE = 100
+# Failures kept for the page to show
+MAX_ERRORS = 50
+
+_lock = threading.Lock()
+_thread = None
+_progress = {'state': "idle"}
+
+
+def get_progress():
+    """
+    Progress of the running or last send for the page to poll\n
+    :return: dict
+    """
+    with _lock:
+        progress = dict(_progress)
+        progress['errors'] = list(_progress.get('errors', []))
+    progress['success'] = True
+    return progress
+
+
+def send_jobs_query():
+    """The jobs the send_movies page sends"""
+    return Job.query.filter_by(hasnicetitle=True, disctype="dvd")
+
+
+def send_page(executor, jobs):
+    """
+    Send one page of jobs and save the results\n
+    :param executor: the upload pool
+    :param list jobs: Job objs
+    """
+    synced = {sync.job_id: sync for sync in
+              JobRemoteSync.query.filter(JobRemoteSync.job_id.in_([job.job_id for job in jobs]))}
+    to_send = []
+    skipped = 0
+    for job in jobs:
+        params = ui_utils.remote_db_params(job)
+        sync = synced.get(job.job_id)
+        if sync is not None and sync.status == "success" and sync.sent_key == ui_utils.remote_db_key(params):
+            skipped += 1
+        else:
+            to_send.append((job, params))
+
+    results = executor.map(lambda item: ui_utils.remote_db_upload(item[1]), to_send)
+    errors = []
+    sent = 0
+    try:
+        for (job, params), (success, error) in zip(to_send, results):
+            ui_utils.record_remote_sync(job.job_id, params, success, error)
+            if success:
+                sent += 1
+            else:
+                errors.append({'job_id': job.job_id, 'title': job.title, 'error': error})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    with _lock:
+        _progress['processed'] += len(jobs)
+        _progress['sent'] += sent
+        _progress['skipped'] += skipped
+        _progress['failed'] += len(errors)
+        _progress['errors'] = (_progress['errors'] + errors)[-MAX_ERRORS:]
+        _progress['updated'] = str(datetime.datetime.now())
+
+
+def run_send():
+    """
+    The sender thread - reads the jobs a page at a time by job_id so memory use stays flat
+    """
+    with app.app_context():
+        try:
+            total = send_jobs_query().count()
+            with _lock:
+                _progress['total'] = total
+            last_id = 0
+            with ThreadPoolExecutor(max_workers=SEND_WORKERS, thread_name_prefix="send_movies") as executor:
+                while True:
+                    jobs = send_jobs_query().filter(Job.job_id > last_id) \
+                        .order_by(Job.job_id).limit(PAGE_SIZE).all()
+                    if not jobs:
+                        break
+                    send_page(executor, jobs)
+                    last_id = jobs[-1].job_id
+                    # Nothing from this page is needed again
+                    db.session.expunge_all()
+            state = "finished"
+        except Exception as error:
+            db.session.rollback()
+            app.logger.error(f"Sending jobs to the ARM api failed - {error}")
+            state = "failed"
+        with _lock:
+            _progress['state'] = state
+            _progress['updated'] = str(datetime.datetime.now())
+        app.logger.info(f"Sending jobs to the ARM api {state} - {_progress['sent']} sent, "
+                        f"{_progress['skipped']} already sent, {_progress['failed']} failed")
+
+
+def start_send():
+    """
+    Start sending the jobs in the background, does nothing if a send is already running\n
+    :return: dict of the progress
+    """
+    global _thread, _progress
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            now = str(datetime.datetime.now())
+            _progress = {'state': "running", 'started': now, 'updated': now, 'total': 0, 'processed': 0,
+                         'sent': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+            _thread = threading.Thread(target=run_send, name="send_movies", daemon=True)
+            _thread.start()
+    return get_progress()
@@ -2,13 +2,15 @@
 ARM route blueprint for send_movies page
 Covers
 - send_movies [GET]
+- send_movies/progress [JSON]
 """
+import json
 
 from flask_login import LoginManager, login_required  # noqa: F401
 from flask import render_template, request, Blueprint, session
 
-from arm.ui import db
-from arm.models.job import Job
+from arm.ui import app, constants
+from arm.ui.sendmovies import sender
 
 route_sendmovies = Blueprint('route_sendmovies', __name__,
                              template_folder='templates',
@@ -20,15 +22,24 @@ route_sendmovies = Blueprint('route_sendmovies', __name__,
 def send_movies():
     """
     function for sending all dvd crc64 ids to off-site api
-    This isn't very optimised and can be slow and causes a huge number of requests
+    The jobs are sent in the background, the page polls send_movies/progress
     """
+    session["page_title"] = "Send Movies/Series"
     if request.args.get('s') is None:
-        session["page_title"] = "Send Movies/Series"
         return render_template('send_movies_form.html')
 
-    job_list = db.session.query(Job).filter_by(hasnicetitle=True, disctype="dvd").all()
-    return_job_list = [job.job_id for job in job_list]
+    progress = sender.start_send()
+    return render_template('send_movies.html', progress=progress)
 
-    session["page_title"] = "Send Movies/Series"
 
-    return render_template('send_movies.html', job_list=return_job_list)
+@route_sendmovies.route('/send_movies/progress')
+@login_required
+def send_movies_progress():
+    """
+    Progress of the running or last send\n
+    :return: Outputs json - state (idle/running/finished/failed), total, processed, sent,
+             skipped (already sent), failed and the latest errors
+    """
+    return app.response_class(response=json.dumps(sender.get_progress(), indent=4, sort_keys=True),
+                              status=200,
+                              mimetype=constants.JSON_TYPE)
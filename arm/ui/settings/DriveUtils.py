@@ -10,11 +10,10 @@ Ripper Utils
 - update_drive_job
 """
 
-import pyudev
-import re
 import logging
 from sqlalchemy import desc
 
+from arm.ripper import drive_state
 from arm.ui import app, db
 from arm.models.job import Job
 from arm.models.system_drives import SystemDrives
@@ -22,17 +21,9 @@ from arm.models.system_drives import SystemDrives
 
 def drives_search():
     """
-    Search the system for any drives
+    Search the system for any drives, read from the drive state when it's kept up to date by udev events
     """
-    udev_drives = []
-
-    context = pyudev.Context()
-
-    for device in context.list_devices(subsystem='block'):
-        regex_output = re.search(r'(/dev/sr\d{1,2})', device.device_node)
-        if regex_output:
-            app.logger.debug(f"regex output: {regex_output.group()}")
-            udev_drives.append(regex_output.group())
+    udev_drives = sorted(drive_state.drives())
 
     if len(udev_drives) > 0:
         app.logger.info(f"System disk scan, found {len(udev_drives)} drives for ARM")
@@ -33,6 +33,8 @@ from arm.models.system_info import SystemInfo
 from arm.models.ui_settings import UISettings
 import arm.config.config as cfg
 from arm.ui.settings import DriveUtils
+from arm.ripper import disk_space, drive_state, io_scheduler
+from arm.ui.posters import cache as poster_cache
 from arm.ui.forms import SettingsForm, UiSettingsForm, AbcdeForm, SystemInfoDrives
 from arm.ui.settings.ServerUtil import ServerUtil
 import arm.ripper.utils as ripper_utils
@@ -98,6 +100,9 @@ def settings():
 
     # System Drives (CD/DVD/Blueray drives)
     drives = DriveUtils.drives_check_status()
+    drive_states = drive_state.drives()
+    io_devices = io_scheduler.snapshot()
+    space_devices = disk_space.snapshot()
     form_drive = SystemInfoDrives(request.form)
 
     # Load up the comments.json, so we can comment the arm.yaml
@@ -119,6 +124,9 @@ def settings():
                            arm_path=arm_path,
                            media_path=media_path,
                            drives=drives,
+                           drive_states=drive_states,
+                           io_devices=io_devices,
+                           space_devices=space_devices,
                            form_drive=form_drive)
 
 
@@ -209,6 +217,7 @@ def save_ui_settings():
         arm_ui_cfg.database_limit = format(form.database_limit.data)
         arm_ui_cfg.notify_refresh = format(form.notify_refresh.data)
         db.session.commit()
+        poster_cache.reset_setting()
         success = True
     # Masking the jinja update, otherwise an error is thrown
     # sqlalchemy.orm.exc.DetachedInstanceError: Instance <UISettings at 0x7f294c109fd0>
@@ -114,10 +114,31 @@ function buildMiddleSection(job) {
     x += `<div id="jobId${job.job_id}_devpath"><strong>Device: </strong>${job.devpath}</div>`;
     x += `<div><strong>Status: </strong><img id="jobId${job.job_id}_status" 
                                src="static/img/${job.status}.png" height="20px" alt="${job.status}" title="${job.status}"></div>`;
+    x += `<div id="jobId${job.job_id}_eta_queue">${queueCheck(job)}</div>`;
     x += `<div id="jobId${job.job_id}_progress_section">${transcodingCheck(job)}</div></div></div>`;
     return x;
 }
 
+/**
+ * Shows the predicted time left in the transcode queue and for the transcode
+ * while a job is ripping or waiting for a transcode slot
+ * @param job current job object
+ * @returns {string} html for the queue ETAs, empty when the job isn't waiting
+ */
+function queueCheck(job) {
+    let x = "";
+    if (job.status === "waiting_transcode") {
+        x += `<div><strong>Queue ETA: </strong>${job.eta_wait}</div>`;
+    }
+    if (job.status === "waiting_space" && job.space_wait !== undefined) {
+        x += `<div><strong>Waiting for disk space: </strong>${job.space_wait}</div>`;
+    }
+    if ((job.status === "waiting_transcode" || job.status === "ripping") && job.eta_transcode !== undefined) {
+        x += `<div><strong>Transcode ETA: </strong>${job.eta_transcode}</div>`;
+    }
+    return x;
+}
+
 function buildRightSection(job, idsplit, authenticated) {
     let x;
     // idsplit[1] should only be undefined on the /database page
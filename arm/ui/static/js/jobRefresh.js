@@ -10,6 +10,8 @@ let activeJob = null;
 let actionType = null;
 var activeServers = [];
 var activeJobs = [];
+// Id of the newest notification each server has sent, so polls only get new notifications
+var notifyCursors = {};
 
 $(document).ready(function () {
     pushChildServers();
@@ -143,7 +145,7 @@ function updateJobItem(oldJob, job) {
         cardHeader[0].innerText = `${job.title} (${job.year})`;
     }
     // Update card poster image
-    if (job.poster_url !== posterUrl[0].src && job.poster_url !== "None" && job.poster_url !== "N/A") {
+    if (job.poster_url !== posterUrl.attr("src") && job.poster_url !== "None" && job.poster_url !== "N/A") {
         posterUrl[0].src = job.poster_url;
     }
     // Update job status image
@@ -157,6 +159,10 @@ function updateJobItem(oldJob, job) {
     updateContents($(`#jobId${job.job_id}_devpath`), job, "Device", job.devpath);
     updateContents($(`#jobId${job.job_id}_video_type`), job, "Type", job.video_type);
     updateProgress(job, oldJob);
+    const etaQueue = $(`#jobId${job.job_id}_eta_queue`);
+    if (etaQueue.length && etaQueue[0].innerHTML !== queueCheck(job)) {
+        etaQueue[0].innerHTML = queueCheck(job);
+    }
     updateContents($(`#jobId${job.job_id}_RIPMETHOD`), job, "Rip Method", job.config.RIPMETHOD);
     updateContents($(`#jobId${job.job_id}_MAINFEATURE`), job, "Main Feature", job.config.MAINFEATURE);
     updateContents($(`#jobId${job.job_id}_MINLENGTH`), job, "Min Length", job.config.MINLENGTH);
@@ -255,7 +261,10 @@ function refreshJobsSuccess(data, serverIndex, serverUrl, serverCount) {
     return serverCount;
 }
 
-function checkNotifications(data) {
+function checkNotifications(data, serverUrl) {
+    if (typeof data.notes_cursor !== "undefined") {
+        notifyCursors[serverUrl] = data.notes_cursor;
+    }
     $.each(data.notes, function (notifyIndex, note) {
         if ($(`#toast${note.id}`).length) {
             // Exists.
@@ -274,7 +283,8 @@ function refreshJobs() {
     let serverCount = activeServers.length;
     $.each(activeServers, function (serverIndex, serverUrl) {
         $.ajax({
-            url: serverUrl + "/json?mode=joblist",
+            url: serverUrl + "/json?mode=joblist" +
+                (serverUrl in notifyCursors ? "&since_id=" + notifyCursors[serverUrl] : ""),
             type: "get",
             timeout: 2000,
             error: function () {
@@ -286,7 +296,7 @@ function refreshJobs() {
             complete: function (data) {
                 refreshJobsComplete();
                 if(typeof data !== 'undefined' && data.responseJSON) {
-                    checkNotifications(data.responseJSON);
+                    checkNotifications(data.responseJSON, serverUrl);
                 }
             }
         });
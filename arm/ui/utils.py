@@ -1,13 +1,13 @@
 """
 Main catch all page for functions for the A.R.M ui
 """
-import hashlib
 import os
 import shutil
 import json
 import platform
 import subprocess
 import re
+import threading
 from datetime import datetime
 from pathlib import Path
 
@@ -24,15 +24,21 @@ from arm.config.config_utils import arm_yaml_test_bool
 from arm.config import config_utils
 from arm.models.alembic_version import AlembicVersion
 from arm.models.job import Job
+from arm.models.job_metadata import JobMetadata
+from arm.models.job_remote_sync import JobRemoteSync
 from arm.models.system_info import SystemInfo
 from arm.models.ui_settings import UISettings
 from arm.models.user import User
-from arm.ui import app, db
+from arm.ripper import finalize, log_maintenance
+from arm.ui import app, db, http_client
 from arm.ui.metadata import tmdb_search, get_tmdb_poster, tmdb_find, call_omdb_api
 from arm.ui.settings import DriveUtils
+from arm.ui.metrics import registry as metrics
 
 # Path definitions
 path_migrations = "arm/migrations"
+# This allows easy updates to the API url
+REMOTE_DB_URL = "https://1337server.pythonanywhere.com/api/v1/"
 
 
 def database_updater(args, job, wait_time=90):
@@ -51,9 +57,12 @@ def database_updater(args, job, wait_time=90):
         app.logger.debug(f"Setting {key}: {value}")
     for i in range(wait_time):  # give up after the users wait period in seconds
         try:
-            db.session.commit()
+            with metrics.DB_COMMIT_LATENCY.time(caller="ui"):
+                db.session.commit()
+            break
         except Exception as error:
             if "locked" in str(error):
+                metrics.DB_LOCK_RETRIES.inc(caller="ui")
                 sleep(1)
                 app.logger.debug(f"database is locked - trying in 1 second {i}/{wait_time} - {error}")
             else:
@@ -308,7 +317,8 @@ def get_info(directory):
     """
     file_list = []
     for i in os.listdir(directory):
-        if os.path.isfile(os.path.join(directory, i)):
+        # Hidden files are ARM's own e.g. the log maintenance lock
+        if os.path.isfile(os.path.join(directory, i)) and not i.startswith("."):
             file_stats = os.stat(os.path.join(directory, i))
             file_size = os.path.getsize(os.path.join(directory, i))
             file_size = round((file_size / 1024), 1)
@@ -362,23 +372,20 @@ def generate_comments():
 
 def generate_full_log(full_path):
     """
-    Gets/tails all lines from log file
+    Gets/tails all lines from log file\n
+    Compressed logs are from finished jobs, they are read once and not followed
     :param full_path: full path to job logfile
     :return: None
     """
-    try:
-        with open(full_path) as read_log_file:
-            while True:
-                yield read_log_file.read()
-                sleep(1)
-    except Exception:
-        try:
-            with open(full_path, encoding="utf8", errors='ignore') as read_log_file:
-                while True:
-                    yield read_log_file.read()
-                    sleep(1)
-        except FileNotFoundError as error:
-            raise FileNotFoundError("Not found with utf8 encoding") from error
+    full_path = log_maintenance.resolve(full_path)
+    with log_maintenance.open_log(full_path) as read_log_file:
+        while True:
+            # A chunk at a time, the whole of a big log is never held in memory
+            for chunk in iter(lambda: read_log_file.read(log_maintenance.TAIL_BLOCK), ""):
+                yield chunk
+            if full_path.endswith(log_maintenance.GZ_SUFFIX):
+                return
+            sleep(1)
 
 
 def generate_arm_cat(full_path):
@@ -387,7 +394,8 @@ def generate_arm_cat(full_path):
     :param full_path: full path to job logfile
     :return: None
     """
-    read_log_file = open(full_path)
+    full_path = log_maintenance.resolve(full_path)
+    read_log_file = log_maintenance.open_log(full_path)
     while True:
         new = read_log_file.readline()
         if new:
@@ -395,6 +403,9 @@ def generate_arm_cat(full_path):
                 yield new
             else:
                 sleep(1)
+        elif full_path.endswith(log_maintenance.GZ_SUFFIX):
+            read_log_file.close()
+            return
 
 
 def setup_database():
@@ -510,6 +521,105 @@ def metadata_selector(func, query="", year="", imdb_id=""):
     return return_function
 
 
+# Seconds before a failed details fetch is tried again when the job is viewed
+DETAILS_RETRY = 600
+# Jobs that have a details fetch running in the background
+_details_running = set()
+_details_lock = threading.Lock()
+
+
+def job_details_key(job):
+    """
+    The values the job details are looked up with, when any of them change the details are stale\n
+    :param job: Job obj
+    :return: str
+    """
+    return f"{job.title}|{job.year}|{job.imdb_id}"[:300]
+
+
+def fetch_job_details(job_id):
+    """
+    Fetch the plot/background/ratings for a job and save them in job_metadata\n
+    Runs in a background thread started by request_job_details\n
+    :param int job_id: job to fetch the details for
+    """
+    try:
+        with app.app_context():
+            job = Job.query.get(job_id)
+            if job is None:
+                return
+            details = job.details or JobMetadata(job.job_id, job_details_key(job))
+            db.session.add(details)
+            try:
+                search_results = metadata_selector("get_details", job.title, job.year, job.imdb_id)
+            except Exception as error:
+                app.logger.error(f"Failed to get the details for job {job_id} - {error}")
+                details.failed(job_details_key(job))
+            else:
+                details.store(job_details_key(job), search_results)
+            database_updater({}, job)
+    except Exception as error:
+        app.logger.error(f"Failed to save the details for job {job_id} - {error}")
+    finally:
+        with _details_lock:
+            _details_running.discard(job_id)
+
+
+def request_job_details(job, refresh=False):
+    """
+    Get the saved details for a job, starting a background fetch if there aren't any yet,
+    the title/year/imdb has changed since they were fetched, the last fetch failed more than
+    DETAILS_RETRY seconds ago, or a refresh was asked for\n
+    :param job: Job obj
+    :param bool refresh: fetch the details again even if they are up-to-date
+    :return: JobMetadata or None if nothing has been saved yet
+    """
+    details = job.details
+    if not refresh and details is not None and details.lookup_key == job_details_key(job):
+        if details.status != "failed" or details.updated is None or \
+                (datetime.now() - details.updated).total_seconds() < DETAILS_RETRY:
+            return details
+    with _details_lock:
+        if job.job_id in _details_running:
+            return details
+        _details_running.add(job.job_id)
+    app.logger.debug(f"Fetching details for job {job.job_id} in the background")
+    threading.Thread(target=fetch_job_details, args=(job.job_id,), name=f"details-{job.job_id}",
+                     daemon=True).start()
+    return details
+
+
+def job_details_state(job_id):
+    """
+    Json api version of the job details\n
+    :param job_id: job id
+    :return: dict with status (pending/found/notfound/failed), plot, background_url and ratings
+    """
+    job = Job.query.get(job_id) if job_id_validator(job_id) else None
+    if job is None:
+        return {'success': False, 'error': "Job not found"}
+    details = job.details
+    running = job.job_id in _details_running
+    if details is None:
+        return {'success': True, 'status': "pending" if running else "missing"}
+    return {'success': True, 'status': "pending" if running else details.status,
+            'plot': details.plot, 'background_url': details.background_url,
+            'ratings': details.get_ratings(), 'updated': str(details.updated)}
+
+
+def refresh_job_details(job_id):
+    """
+    Json api version - fetch the details for a job again in the background\n
+    :param job_id: job id
+    :return: dict
+    """
+    job = Job.query.get(job_id) if job_id_validator(job_id) else None
+    if job is None:
+        return {'success': False, 'error': "Job not found"}
+    request_job_details(job, refresh=True)
+    return {'success': True, 'status': "pending"}
+
+
 def fix_permissions(j_id):
     """
     Json api version
@@ -517,12 +627,6 @@ def fix_permissions(j_id):
     ARM can sometimes have issues with changing the file owner, we can use the fact ARMui is run
     as a service to fix permissions.
     """
-
-    # Use set_media_owner to keep complexity low
-    def set_media_owner(dirpath, cur_dir, uid, gid):
-        if job.config.SET_MEDIA_OWNER:
-            os.chown(os.path.join(dirpath, cur_dir), uid, gid)
-
     # Validate job is valid
     job_id_validator(j_id)
     job = Job.query.get(j_id)
@@ -540,39 +644,77 @@ def fix_permissions(j_id):
         directory_to_traverse = job.path
     # Build return json dict
     return_json = {"success": False, "mode": "fixperms", "folder": str(directory_to_traverse), "path": str(job.path)}
-    # Set defaults as fail-safe
-    uid = 1000
-    gid = 1000
     try:
-        corrected_chmod_value = int(str(job.config.CHMOD_VALUE), 8)
-        app.logger.info(f"Setting permissions to: {job.config.CHMOD_VALUE} on: {directory_to_traverse}")
-        os.chmod(directory_to_traverse, corrected_chmod_value)
-        # If set media owner in arm.yaml was true set them as users
-        if job.config.SET_MEDIA_OWNER and job.config.CHOWN_USER and job.config.CHOWN_GROUP:
-            import pwd
-            import grp
-            uid = pwd.getpwnam(job.config.CHOWN_USER).pw_uid
-            gid = grp.getgrnam(job.config.CHOWN_GROUP).gr_gid
-            os.chown(directory_to_traverse, uid, gid)
-        # walk through each folder and file in the final directory
-        for dirpath, l_directories, l_files in os.walk(directory_to_traverse):
-            # Set permissions on each directory
-            for cur_dir in l_directories:
-                app.logger.debug(f"Setting path: {cur_dir} to permissions value: {job.config.CHMOD_VALUE}")
-                os.chmod(os.path.join(dirpath, cur_dir), corrected_chmod_value)
-                set_media_owner(dirpath, cur_dir, uid, gid)
-            # Set permissions on each file
-            for cur_file in l_files:
-                app.logger.debug(f"Setting file: {cur_file} to permissions value: {job.config.CHMOD_VALUE}")
-                os.chmod(os.path.join(dirpath, cur_file), corrected_chmod_value)
-                set_media_owner(dirpath, cur_file, uid, gid)
-        return_json["success"] = True
+        # The mode is always set here, the owner only if set media owner in arm.yaml was true
+        permissions = finalize.MediaPermissions.from_config(job.config)
+        permissions.mode = int(str(job.config.CHMOD_VALUE), 8)
+        app.logger.info(f"Setting permissions to: {permissions} on: {directory_to_traverse}")
+        done, failed = finalize.apply_tree(str(directory_to_traverse), permissions)
+        app.logger.info(f"Permissions set on {done} paths, {len(failed)} failed")
+        if failed:
+            for path, error in failed[:10]:
+                app.logger.error(f"Permissions setting failed on {path} as: {error}")
+            return_json["Error"] = f"Permissions setting failed on {len(failed)} paths, first {failed[0][0]}: " \
+                                   f"{failed[0][1]}"
+        else:
+            return_json["success"] = True
     except Exception as error:
         app.logger.error(f"Permissions setting failed as: {error}")
         return_json["Error"] = str(f"Permissions setting failed as: {error}")
     return return_json
 
 
+def remote_db_params(job):
+    """
+    The job values sent to the arm remote crc64 database\n
+    :param job: Job obj
+    :return: dict of query parameters
+    """
+    return {'crc64': job.crc_id, 't': job.title, 'y': job.year, 'imdb': job.imdb_id,
+            'hnt': job.hasnicetitle, 'l': job.label, 'vt': job.video_type}
+
+
+def remote_db_key(params):
+    """Key of the values sent for a job, the job is only sent again if it changes"""
+    return "|".join(str(params[key]) for key in sorted(params))[:600]
+
+
+def remote_db_upload(params):
+    """
+    Send one job to the arm remote crc64 database\n
+    Safe to call from worker threads, it doesn't touch the database\n
+    :param dict params: from remote_db_params
+    :return: (bool success, str error or None)
+    """
+    api_key = cfg.arm_config['ARM_API_KEY']
+    try:
+        response = http_client.get("arm", REMOTE_DB_URL, params={'mode': "p", 'api_key': api_key, **params})
+        req = json.loads(response.text)
+    except (requests.exceptions.RequestException, ValueError) as error:
+        return False, str(error).replace(api_key, "<api_key>") if api_key else str(error)
+    app.logger.debug("req= " + str(req))
+    if not isinstance(req, dict):
+        return False, "Unexpected reply"
+    if req.get('success'):
+        return True, None
+    return False, req.get('Error', "Unknown error")
+
+
+def record_remote_sync(job_id, params, success, error):
+    """
+    Save the result of sending a job to the arm remote crc64 database, the caller commits\n
+    :param int job_id: job that was sent
+    :param dict params: the values that were sent
+    :param bool success: if the api accepted the job
+    :param error: why it failed
+    """
+    sync = JobRemoteSync.query.get(job_id)
+    if sync is None:
+        sync = JobRemoteSync(job_id)
+        db.session.add(sync)
+    sync.record(remote_db_key(params), success, error)
+
+
 def send_to_remote_db(job_id):
     """
     Send a local db job to the arm remote crc64 database
@@ -581,25 +723,19 @@ def send_to_remote_db(job_id):
     """
     job = Job.query.get(job_id)
     return_dict = {}
-    api_key = cfg.arm_config['ARM_API_KEY']
-
-    # This allows easy updates to the API url
-    base_url = "https://1337server.pythonanywhere.com"
-    url = f"{base_url}/api/v1/?mode=p&api_key={api_key}&crc64={job.crc_id}&t={job.title}" \
-          f"&y={job.year}&imdb={job.imdb_id}" \
-          f"&hnt={job.hasnicetitle}&l={job.label}&vt={job.video_type}"
-    app.logger.debug(url.replace(api_key, "<api_key>"))
-    response = requests.get(url)
-    req = json.loads(response.text)
-    app.logger.debug("req= " + str(req))
+    params = remote_db_params(job)
     job_dict = job.get_d().items()
     return_dict['config'] = job.config.get_d()
     for key, value in iter(job_dict):
         return_dict[str(key)] = str(value)
-    if req['success']:
+    success, error = remote_db_upload(params)
+    record_remote_sync(job.job_id, params, success, error)
+    database_updater({}, job)
+    if success:
         return_dict['status'] = "success"
     else:
-        return_dict['error'] = req['Error']
+        app.logger.error(f"Failed to send job {job_id} to the ARM api - {error}")
+        return_dict['error'] = error
         return_dict['status'] = "fail"
     return return_dict
 
@@ -613,8 +749,8 @@ def find_folder_in_log(job_log, default_directory):
     :param default_directory: full path to the final directory prebuilt
     :return: full path to the final directory prebuilt or found in log
     """
-    with open(job_log, 'r') as reader:
-        for line in reader.readlines():
+    with log_maintenance.open_log(job_log) as reader:
+        for line in reader:
             failed_perms_found = re.search("Operation not permitted: '([0-9a-zA-Z()/ -]*?)'", str(line))
             if failed_perms_found:
                 return failed_perms_found.group(1)
@@ -738,12 +874,12 @@ def validate_logfile(logfile, mode, my_file):
     :param my_file: full base path using Path()
     :return: None
     :raise ValidationError: if logfile has "/" or "../" in it or "mode" is None
-    :raise FileNotFoundError: if logfile cant be found in arm log folder
+    :raise FileNotFoundError: if logfile cant be found in arm log folder, compressed or not
     """
     app.logger.debug(f"Logfile: {logfile}")
     if logfile is None or "../" in logfile or mode is None or logfile.find("/") != -1:
         raise ValidationError("logfile doesnt pass sanity checks")
-    if not my_file.is_file():
+    if not os.path.isfile(log_maintenance.resolve(my_file)):
         # logfile doesnt exist throw out error template
         raise FileNotFoundError("File not found")
 
@@ -761,6 +897,29 @@ def job_id_validator(job_id):
     return valid
 
 
+def job_stage_summary(job, stages):
+    """
+    Total up the recorded stages of a job so the slow parts stand out\n
+    :param job: job the stages belong to
+    :param stages: list of JobStage rows ordered by start_time
+    :return: list of dicts (stage, count, total seconds, percent of the job) in the order the stages first ran
+    """
+    summary = {}
+    for stage in stages:
+        if stage.stage not in summary:
+            summary[stage.stage] = {'stage': stage.stage, 'count': 0, 'total': 0.0, 'percent': 0.0}
+        summary[stage.stage]['count'] += 1
+        summary[stage.stage]['total'] += stage.elapsed()
+    job_seconds = 0.0
+    if job.start_time:
+        job_seconds = ((job.stop_time or datetime.now()) - job.start_time).total_seconds()
+    for item in summary.values():
+        item['total'] = round(item['total'], 1)
+        if job_seconds > 0:
+            item['percent'] = round(item['total'] / job_seconds * 100, 1)
+    return list(summary.values())
+
+
 def generate_file_list(my_path):
     """
     Generate a list of files from given path\n
@@ -773,69 +932,6 @@ def generate_file_list(my_path):
     return movie_dirs
 
 
-def import_movie_add(poster_image, imdb_id, movie_group, my_path):
-    """
-    Search the movie directory, make sure we have movie files and then import it into the db\n
-    :param poster_image:
-    :param imdb_id:
-    :param movie_group:
-    :param my_path:
-    :return:
-    """
-    app.logger.debug(f"Poster image: {poster_image}, IMDB: {imdb_id}, "
-                     f"Movie_group: {movie_group.group(0)}, Path: {my_path}")
-    # only used to add a non-unique crc64
-    movie = movie_group.group(0)
-    # Fake crc64 number
-    hash_object = hashlib.md5(f"{movie}".strip().encode())
-    # Check if we already have this in the db exit if we do
-    dupe_found, _ = job_dupe_check(hash_object.hexdigest())
-    if dupe_found:
-        app.logger.debug("We found dupes breaking loop")
-        return None
-    app.logger.debug(f"List dir = {os.listdir(my_path)}")
-
-    # Build file list with common video extension types
-    movie_files = [f for f in os.listdir(my_path)
-                   if os.path.isfile(os.path.join(my_path, f))
-                   and f.endswith((".mkv", ".avi", ".mp4", ".avi"))]
-    app.logger.debug(f"movie files = {movie_files}")
-
-    # This dict will be returned to the big list, so we can display to the user
-    movie_dict = {
-        'title': movie_group.group(1),
-        'year': movie_group.group(2),
-        'crc_id': hash_object.hexdigest(),
-        'imdb_id': imdb_id,
-        'poster': poster_image,
-        'status': 'success' if len(movie_files) >= 1 else 'fail',
-        'video_type': 'movie',
-        'disctype': 'unknown',
-        'hasnicetitle': True,
-        'no_of_titles': len(movie_files)
-    }
-    app.logger.debug(movie_dict)
-    # Create the new job and use the found values
-    new_movie = Job("/dev/sr0")
-    new_movie.title = movie_dict['title']
-    new_movie.year = movie_dict['year']
-    new_movie.crc_id = hash_object.hexdigest()
-    new_movie.imdb_id = imdb_id
-    new_movie.status = movie_dict['status']
-    new_movie.video_type = movie_dict['video_type']
-    new_movie.disctype = movie_dict['disctype']
-    new_movie.hasnicetitle = movie_dict['hasnicetitle']
-    new_movie.no_of_titles = movie_dict['no_of_titles']
-    new_movie.poster_url = movie_dict['poster']
-    new_movie.start_time = datetime.now()
-    new_movie.logfile = "imported.log"
-    new_movie.ejected = True
-    new_movie.path = my_path
-    app.logger.debug(new_movie)
-    db.session.add(new_movie)
-    return movie_dict
-
-
 def get_git_revision_hash() -> str:
     """Get full hash of current git commit"""
     git_hash: str = 'unknown'
@@ -0,0 +1,52 @@
+import sys
+import unittest
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, '/opt/arm')
+from arm.ripper import arm_ripper  # noqa E402
+
+
+class TestArmRipper(unittest.TestCase):
+
+    def setUp(self):
+        self.order = []
+        self.job = MagicMock(video_type="movie", hasnicetitle=True)
+        self.job.config.SKIP_TRANSCODE = False
+        self.job.config.MAINFEATURE = False
+
+    def step(self, name):
+        """A context manager that records when it's entered and left"""
+        @contextmanager
+        def recorded(*args, **kwargs):
+            self.order.append(f"{name} start")
+            yield 0
+            self.order.append(f"{name} end")
+        return recorded
+
+    """
+    ************************************************************
+    Test - start_transcode
+    test_start_transcode_order - check the queue wait comes before the transcode's disk space and I/O share
+    ************************************************************
+    """
+    def test_start_transcode_order(self):
+        """
+        CHECK "start_transcode" waits for MAX_CONCURRENT_TRANSCODES before reserving space and the I/O share
+        """
+        with patch.object(arm_ripper, "rip_with_mkv", return_value=False), \
+                patch.object(arm_ripper.utils, "database_updater"), \
+                patch.object(arm_ripper.disk_space, "reserve", self.step("space")), \
+                patch.object(arm_ripper.io_scheduler, "allocation_for", self.step("io")), \
+                patch.object(arm_ripper.handbrake, "wait_for_transcode_slot",
+                             side_effect=lambda job: self.order.append("queue")), \
+                patch.object(arm_ripper.handbrake, "handbrake_all",
+                             side_effect=lambda *args: self.order.append("handbrake")):
+            self.assertTrue(arm_ripper.start_transcode(self.job, "job.log", "/dev/sr0", "/transcode", False))
+
+        self.assertEqual(self.order[:3], ["queue", "space start", "io start"])
+        self.assertEqual(self.order[self.order.index("io start") + 1], "handbrake")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, '/opt/arm')
+from arm.ripper import data_copier  # noqa E402
+
+SECTOR = data_copier.SECTOR_SIZE
+
+
+class TestDataCopier(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.source = os.path.join(self.folder, "disc")
+        self.destination = os.path.join(self.folder, "disc.iso")
+        # 40 sectors that are all different and a short one at the end
+        self.data = os.urandom(40 * SECTOR + 100)
+        with open(self.source, "wb") as disc:
+            disc.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def image(self):
+        with open(self.destination, "rb") as image:
+            return image.read()
+
+    def bad_pread(self, bad_offset):
+        """os.pread that can never read the sector at bad_offset"""
+        pread = os.pread
+
+        def read(fd, size, offset):
+            if offset <= bad_offset < offset + size:
+                raise OSError(5, "Input/output error")
+            return pread(fd, size, offset)
+        return read
+
+    """
+    ************************************************************
+    Test - copy_disc
+    test_copy_disc_pass - check for normal behaviour
+    test_copy_disc_bad_sector - check unreadable sectors are zero-filled and reported
+    test_copy_disc_write_error - check a failed write is raised
+    test_copy_disc_progress - check progress is reported
+    test_align - check buffer sizes are whole sectors
+    ************************************************************
+    """
+    def test_copy_disc_pass(self):
+        """
+        CHECK "copy_disc" copies the whole disc in chunks and hashes what it wrote
+        """
+        result = data_copier.copy_disc(self.source, self.destination, 3 * SECTOR + 1)
+
+        self.assertEqual(self.image(), self.data)
+        self.assertEqual((result.copied, result.size), (len(self.data), len(self.data)))
+        self.assertEqual(result.sha256, hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(result.bad_sectors, [])
+
+    def test_copy_disc_bad_sector(self):
+        """
+        CHECK "copy_disc" writes zeros for a sector that can't be read and keeps the rest of the chunk
+        data check:
+            sector 5 of a 16 sector chunk is read retries + 1 times then zero-filled
+        """
+        expected = self.data[:5 * SECTOR] + b"\0" * SECTOR + self.data[6 * SECTOR:]
+        with patch.object(data_copier.os, "pread", side_effect=self.bad_pread(5 * SECTOR)) as pread:
+            result = data_copier.copy_disc(self.source, self.destination, 16 * SECTOR, retries=2)
+
+        self.assertEqual(self.image(), expected)
+        self.assertEqual(result.bad_sectors, [5 * SECTOR])
+        self.assertEqual(result.sha256, hashlib.sha256(expected).hexdigest())
+        self.assertEqual(sum(1 for call in pread.call_args_list if call[0][1:] == (SECTOR, 5 * SECTOR)), 3)
+
+    def test_copy_disc_write_error(self):
+        """
+        CHECK "copy_disc" stops and raises the writer's error
+        """
+        with patch.object(data_copier.os, "pwrite", side_effect=OSError(28, "No space left on device")):
+            with self.assertRaises(OSError):
+                data_copier.copy_disc(self.source, self.destination, 4 * SECTOR)
+
+    def test_copy_disc_progress(self):
+        """
+        CHECK "copy_disc" calls progress with the result so far
+        """
+        seen = []
+        with patch.object(data_copier, "PROGRESS_INTERVAL", 0):
+            data_copier.copy_disc(self.source, self.destination, 10 * SECTOR,
+                                  progress=lambda result: seen.append(result.copied))
+
+        self.assertEqual(seen, [10 * SECTOR, 20 * SECTOR, 30 * SECTOR, 40 * SECTOR, len(self.data)])
+
+    def test_align(self):
+        """
+        CHECK "align" rounds down to whole sectors, never below one sector
+        """
+        self.assertEqual(data_copier.align(3 * SECTOR + 100), 3 * SECTOR)
+        self.assertEqual(data_copier.align(100), SECTOR)
+
+    """
+    ************************************************************
+    Test - describe
+    test_describe - check the progress line
+    ************************************************************
+    """
+    def test_describe(self):
+        """
+        CHECK "describe" shows the percentage, size, speed and time left
+        """
+        result = data_copier.CopyResult()
+        result.size = 4_000_000_000
+        result.copied = 1_000_000_000
+        result.seconds = 50
+        self.assertEqual(data_copier.describe(result), "25% - 1.0 of 4.0 GB at 20.0 MB/s, ETA 0:02:30")
+
+
+if __name__ == '__main__':
+    unittest.main()
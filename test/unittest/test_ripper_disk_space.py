@@ -0,0 +1,224 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+sys.path.insert(0, '/opt/arm')
+import arm.config.config as cfg  # noqa E402
+from arm.models.config import Config  # noqa E402
+from arm.models.job import Job  # noqa E402
+from arm.models.space_reservation import SpaceReservation  # noqa E402
+from arm.models.track import Track  # noqa E402
+from arm.ripper import disk_space  # noqa E402
+from arm.ui import db  # noqa E402
+
+GB = disk_space.GB
+DEVICE = "999:1"
+
+
+class TestDiskSpace(unittest.TestCase):
+
+    def setUp(self):
+        # An empty database in memory
+        test_app = Flask("arm_test")
+        test_app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite://"
+        db.init_app(test_app)
+        self.context = test_app.app_context()
+        self.context.push()
+        db.create_all()
+        self.folder = tempfile.mkdtemp()
+        patcher = patch.dict(cfg.arm_config, {'DISK_SPACE_MARGIN_GB': 5})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def job(self, disctype="dvd", lengths=(), status="active", pid=None):
+        """A job for a disc with tracks of the given lengths, 600 to 4000 seconds are ripped"""
+        with patch.object(Job, "parse_udev"), patch.object(Job, "get_pid"):
+            job = Job("/dev/sr0")
+        job.disctype = disctype
+        job.status = status
+        job.pid = pid
+        db.session.add(job)
+        db.session.commit()
+        db.session.add(Config({'MINLENGTH': "600", 'MAXLENGTH': "4000", 'MAINFEATURE': False,
+                               'HB_PRESET_DVD': "Fast 480p30", 'HB_PRESET_BD': "Fast 1080p30"}, job.job_id))
+        for number, length in enumerate(lengths):
+            db.session.add(Track(job.job_id, str(number), length, "16:9", 25, False, "MakeMKV", "", ""))
+        db.session.commit()
+        return job
+
+    def reservation(self, job, estimate, status="waiting", stage="rip", device=DEVICE, used=None):
+        """A saved reservation writing to a folder that doesn't exist yet"""
+        reservation = SpaceReservation(job.job_id, stage, job.disctype, device,
+                                       os.path.join(self.folder, f"job{job.job_id}"), 3600, estimate)
+        reservation.status = status
+        reservation.used = used
+        db.session.add(reservation)
+        db.session.commit()
+        return reservation
+
+    def write_file(self, name, size):
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as writer:
+            writer.write(b"x" * size)
+        return path
+
+    """
+    ************************************************************
+    Test - estimate
+    test_estimate_finalize_rename - check moves on one filesystem need nothing
+    test_estimate_finalize_copy - check moves between filesystems need the source size
+    test_estimate_rip_default - check the default rate for the content that's ripped
+    test_estimate_rip_disc_size - check the rip isn't bigger than the disc
+    test_estimate_rip_history - check the rate earlier rips wrote at
+    test_estimate_transcode_source - check the source size when the tracks aren't known
+    ************************************************************
+    """
+    def test_estimate_finalize_rename(self):
+        """
+        CHECK "estimate" of a finalize on the same filesystem is 0
+        """
+        self.write_file("title.mkv", 3000)
+        self.assertEqual(disk_space.estimate(self.job(), "finalize", os.path.join(self.folder, "done"), self.folder),
+                         (0, 0.0, "move"))
+
+    def test_estimate_finalize_copy(self):
+        """
+        CHECK "estimate" of a finalize to another filesystem is what it copies
+        """
+        self.write_file("title.mkv", 3000)
+        self.write_file("extra.mkv", 1000)
+        devices = {self.folder: ("999:1", "/"), "/media/completed": ("999:2", "/media")}
+        with patch.object(disk_space.io_scheduler, "device_of", side_effect=devices.get):
+            self.assertEqual(disk_space.estimate(self.job(), "finalize", "/media/completed", self.folder),
+                             (4000, 0.0, "move"))
+
+    def test_estimate_rip_default(self):
+        """
+        CHECK "estimate" of a rip without history uses DEFAULT_RATES for the tracks that are ripped
+        data check:
+            3600 s between MINLENGTH and MAXLENGTH, 100 s and 5000 s left out
+        """
+        job = self.job(lengths=(3600, 100, 5000))
+        with patch.object(disk_space, "disc_size", return_value=0):
+            needed, content, basis = disk_space.estimate(job, "rip", self.folder, job.devpath)
+
+        self.assertEqual((content, basis), (3600.0, "dvd"))
+        self.assertEqual(needed, 3600 * disk_space.DEFAULT_RATES['rip']['dvd'])
+
+    def test_estimate_rip_disc_size(self):
+        """
+        CHECK "estimate" of a rip is at most the size of the disc, or the disc without tracks
+        """
+        job = self.job(lengths=(3600,))
+        with patch.object(disk_space, "disc_size", return_value=4 * GB):
+            self.assertEqual(disk_space.estimate(job, "rip", self.folder, job.devpath)[0], 4 * GB)
+            self.assertEqual(disk_space.estimate(self.job(), "rip", self.folder, job.devpath)[0], 4 * GB)
+
+    def test_estimate_rip_history(self):
+        """
+        CHECK "estimate" of a rip uses the rate of the rips released before
+        data check:
+            earlier dvd rips: 4000 bytes for 1 s and 2000 bytes for 3 s, 1500 bytes/s
+        """
+        earlier = self.job(lengths=(1,))
+        self.reservation(earlier, 0, "released", used=4000).content = 1
+        self.reservation(earlier, 0, "released", used=2000).content = 3
+        self.reservation(earlier, 0, "released", stage="transcode", used=999999).content = 1
+        db.session.commit()
+        job = self.job(lengths=(3600,))
+        with patch.object(disk_space, "disc_size", return_value=0):
+            self.assertEqual(disk_space.estimate(job, "rip", self.folder, job.devpath)[0], 3600 * 1500)
+
+    def test_estimate_transcode_source(self):
+        """
+        CHECK "estimate" of a transcode before the tracks are scanned is the size of the source
+        """
+        self.write_file("title.mkv", 3000)
+        self.assertEqual(disk_space.estimate(self.job(), "transcode", "/media/completed", self.folder),
+                         (3000, 0.0, "Fast 480p30"))
+
+    """
+    ************************************************************
+    Test - blocked_by
+    test_blocked_by_pass - check for normal behaviour
+    test_blocked_by_queued - check jobs wait in the order they asked
+    test_blocked_by_reserved - check what other jobs still have to write
+    ************************************************************
+    """
+    def test_blocked_by_pass(self):
+        """
+        CHECK "blocked_by" lets in a reservation that fits in the free space less the margin
+        data check:
+            100 GB free, 5 GB margin: 95 GB fits
+        """
+        reservation = self.reservation(self.job(), 95 * GB)
+        with patch.object(disk_space, "free_bytes", return_value=100 * GB):
+            self.assertIsNone(disk_space.blocked_by(reservation))
+
+    def test_blocked_by_queued(self):
+        """
+        CHECK "blocked_by" keeps a reservation behind an earlier waiting one on its filesystem
+        """
+        earlier = self.reservation(self.job(), 10 * GB)
+        self.reservation(self.job(), 10 * GB, device="999:2")
+        reservation = self.reservation(self.job(), 10 * GB)
+        with patch.object(disk_space, "free_bytes", return_value=100 * GB):
+            self.assertEqual(disk_space.blocked_by(reservation), f"queued behind job {earlier.job_id}")
+            self.assertIsNone(disk_space.blocked_by(earlier))
+
+    def test_blocked_by_reserved(self):
+        """
+        CHECK "blocked_by" counts what held reservations haven't written yet
+        data check:
+            held 60 GB with 10 GB written: 50 GB reserved, 100 GB free: 45 GB fits, 46 GB doesn't
+            a finished stage (used set) and released rows aren't counted
+        """
+        held = self.reservation(self.job(), 60 * GB, "held")
+        os.makedirs(held.path)
+        with open(os.path.join(held.path, "title.mkv"), "wb") as writer:
+            writer.truncate(10 * GB)
+        self.reservation(self.job(), 60 * GB, "held", used=60 * GB)
+        self.reservation(self.job(), 60 * GB, "released")
+        with patch.object(disk_space, "free_bytes", return_value=100 * GB):
+            self.assertIsNone(disk_space.blocked_by(self.reservation(self.job(), 45 * GB, "held")))
+            reservation = self.reservation(self.job(), 46 * GB)
+            self.assertEqual(disk_space.blocked_by(reservation),
+                             f"needs 46.0 GB in {reservation.path}, 0.0 GB left after 95.0 GB reserved "
+                             f"by other jobs and a 5 GB margin")
+
+    """
+    ************************************************************
+    Test - clear_stale
+    test_clear_stale - check reservations of ended jobs and stopped rippers are released
+    ************************************************************
+    """
+    def test_clear_stale(self):
+        """
+        CHECK "clear_stale" releases the reservations of finished jobs and of jobs whose ripper has gone
+        data check:
+            running ripper: kept, stopped ripper: released, finished job: released
+        """
+        running = self.reservation(self.job(pid=100), GB, "held")
+        stopped = self.reservation(self.job(pid=200), GB, "held")
+        finished = self.reservation(self.job(status="success", pid=100), GB, "held")
+        with patch.object(disk_space.psutil, "pid_exists", side_effect=lambda pid: pid == 100):
+            disk_space.clear_stale()
+        db.session.commit()
+
+        self.assertEqual([running.status, stopped.status, finished.status], ["held", "released", "released"])
+        self.assertIsNotNone(stopped.released)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import sys
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.insert(0, '/opt/arm')
+from arm.ripper import drive_state  # noqa E402
+
+DRIVE = "/dev/sr0"
+
+
+class TestDriveState(unittest.TestCase):
+
+    def setUp(self):
+        # The drive's CDROM_DRIVE_STATUS, changed by the tests
+        self.status = [drive_state.CDS_DRIVE_NOT_READY]
+        for patcher in (patch.object(drive_state, "_drives", {}),
+                        patch.object(drive_state, "_observer", None),
+                        patch.object(drive_state, "get_context"),
+                        patch.object(drive_state, "tray_status", side_effect=lambda devpath: self.status[0])):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def device(self, devpath=DRIVE, media=True):
+        """A udev device for a dvd drive"""
+        properties = {"ID_CDROM": "1", "ID_CDROM_DVD": "1"}
+        if media:
+            properties.update({"ID_CDROM_MEDIA": "1", "ID_CDROM_MEDIA_DVD": "1", "ID_FS_LABEL": "SERENITY"})
+        return SimpleNamespace(device_node=devpath, properties=properties, action="change")
+
+    def monitor(self):
+        """Make the drive table look like it's kept up to date by udev events"""
+        drive_state.update(self.device())
+        return patch.object(drive_state, "start", return_value=True), \
+            patch.object(drive_state, "running", return_value=True)
+
+    """
+    ************************************************************
+    Test - update
+    test_update_pass - check for normal behaviour
+    test_update_other - check devices that aren't optical drives are left out
+    ************************************************************
+    """
+    def test_update_pass(self):
+        """
+        CHECK "update" records the tray, media and label of the drive
+        """
+        self.status[0] = drive_state.CDS_DISC_OK
+        drive_state.update(self.device())
+        drive = drive_state._drives[DRIVE]
+
+        self.assertEqual((drive['tray'], drive['media'], drive['label'], drive['ready']),
+                         ("ready", "dvd", "SERENITY", True))
+        self.assertEqual(drive['drive_type'], "CD/DVD")
+
+    def test_update_other(self):
+        """
+        CHECK "update" ignores block devices that aren't /dev/srN
+        """
+        drive_state.update(self.device("/dev/sda1"))
+        self.assertEqual(drive_state._drives, {})
+
+    """
+    ************************************************************
+    Test - wait_for_media
+    test_wait_for_media_pass - check for normal behaviour
+    test_wait_for_media_event - check a udev event wakes the waiter
+    test_wait_for_media_recheck - check the drive is checked when no event comes
+    test_wait_for_media_timeout - check it gives up after timeout
+    test_wait_for_media_missing - check a drive that doesn't exist
+    ************************************************************
+    """
+    def test_wait_for_media_pass(self):
+        """
+        CHECK "wait_for_media" returns straight away when the disc is ready
+        """
+        self.status[0] = drive_state.CDS_DISC_OK
+        start, running = self.monitor()
+        with start, running:
+            self.assertTrue(drive_state.wait_for_media(DRIVE, 5))
+
+    def test_wait_for_media_event(self):
+        """
+        CHECK "wait_for_media" wakes on the event for the disc being ready, without waiting for a recheck
+        """
+        start, running = self.monitor()
+
+        def disc_ready():
+            time.sleep(0.1)
+            self.status[0] = drive_state.CDS_DISC_OK
+            drive_state.update(self.device())
+        event = threading.Thread(target=disc_ready)
+        with start, running, patch.object(drive_state, "READY_RECHECK", 30), \
+                patch.object(drive_state.pyudev.Devices, "from_device_file") as from_device_file:
+            event.start()
+            started = time.monotonic()
+            self.assertTrue(drive_state.wait_for_media(DRIVE, 10))
+            event.join()
+
+        self.assertLess(time.monotonic() - started, 5)
+        from_device_file.assert_not_called()
+
+    def test_wait_for_media_recheck(self):
+        """
+        CHECK "wait_for_media" without a monitor checks the drive every READY_RECHECK seconds
+        data check:
+            the drive is ready on the third check
+        """
+        checks = []
+
+        def from_device_file(context, devpath):
+            checks.append(devpath)
+            if len(checks) >= 3:
+                self.status[0] = drive_state.CDS_DISC_OK
+            return self.device(devpath)
+        with patch.object(drive_state, "start", return_value=False), \
+                patch.object(drive_state, "READY_RECHECK", 0.01), \
+                patch.object(drive_state.pyudev.Devices, "from_device_file", side_effect=from_device_file):
+            self.assertTrue(drive_state.wait_for_media(DRIVE, 5))
+
+        self.assertEqual(len(checks), 3)
+
+    def test_wait_for_media_timeout(self):
+        """
+        CHECK "wait_for_media" returns False when the disc isn't ready in time
+        """
+        start, running = self.monitor()
+        with start, running, patch.object(drive_state, "READY_RECHECK", 0.01), \
+                patch.object(drive_state.pyudev.Devices, "from_device_file",
+                             side_effect=lambda context, devpath: self.device(devpath)):
+            self.assertFalse(drive_state.wait_for_media(DRIVE, 0.1))
+
+    def test_wait_for_media_missing(self):
+        """
+        CHECK "wait_for_media" returns False for a drive udev doesn't know
+        """
+        with patch.object(drive_state, "start", return_value=False), \
+                patch.object(drive_state, "READY_RECHECK", 0.01), \
+                patch.object(drive_state.pyudev.Devices, "from_device_file", side_effect=ValueError("no device")):
+            self.assertFalse(drive_state.wait_for_media(DRIVE, 0.1))
+
+
+if __name__ == '__main__':
+    unittest.main()
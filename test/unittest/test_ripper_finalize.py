@@ -0,0 +1,237 @@
+import errno
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, '/opt/arm')
+from arm.ripper import finalize  # noqa E402
+
+
+class TestFinalize(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.src = os.path.join(self.folder, "src.mkv")
+        self.dst = os.path.join(self.folder, "dst.mkv")
+        with open(self.src, "wb") as writer:
+            writer.write(os.urandom(4096))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def read(self, path):
+        with open(path, "rb") as reader:
+            return reader.read()
+
+    """
+    ************************************************************
+    Test - copy_file
+    test_copy_file_pass - check for normal behaviour
+    test_copy_file_verify_pass - check the verified copy
+    test_copy_file_fail - check a failed copy is cleaned up
+    test_copy_file_verify_mismatch - check a copy that doesn't match
+    ************************************************************
+    """
+    def test_copy_file_pass(self):
+        """
+        CHECK "copy_file" copies the data and the times, and leaves no temporary file
+        """
+        os.utime(self.src, (1000000000, 1000000000))
+        finalize.copy_file(self.src, self.dst)
+
+        self.assertEqual(self.read(self.dst), self.read(self.src))
+        self.assertEqual(os.stat(self.dst).st_mtime, 1000000000)
+        self.assertFalse(os.path.exists(self.dst + finalize.TMP_SUFFIX))
+
+    def test_copy_file_verify_pass(self):
+        """
+        CHECK "copy_file" with verify copies through the hash
+        """
+        progress = finalize.Progress()
+        finalize.copy_file(self.src, self.dst, verify=True, progress=progress)
+
+        self.assertEqual(self.read(self.dst), self.read(self.src))
+        self.assertEqual(progress.copied, 4096)
+
+    def test_copy_file_fail(self):
+        """
+        CHECK "copy_file" removes the temporary file and raises when the copy fails
+        """
+        def broken_copy(in_fd, out_fd, size, progress):
+            os.write(out_fd, b"part")
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+        with patch.object(finalize, "zero_copy", broken_copy):
+            with self.assertRaises(OSError):
+                finalize.copy_file(self.src, self.dst)
+
+        self.assertFalse(os.path.exists(self.dst))
+        self.assertFalse(os.path.exists(self.dst + finalize.TMP_SUFFIX))
+        self.assertTrue(os.path.exists(self.src))
+
+    def test_copy_file_verify_mismatch(self):
+        """
+        CHECK "copy_file" raises EIO when the copy doesn't match the source, nothing is left behind
+        """
+        with patch.object(finalize, "file_sha256", return_value="0" * 64):
+            with self.assertRaises(OSError) as raised:
+                finalize.copy_file(self.src, self.dst, verify=True)
+
+        self.assertEqual(raised.exception.errno, errno.EIO)
+        self.assertFalse(os.path.exists(self.dst))
+        self.assertFalse(os.path.exists(self.dst + finalize.TMP_SUFFIX))
+
+    """
+    ************************************************************
+    Test - move_file
+    test_move_file_rename - check for normal behaviour
+    test_move_file_exists - check an existing file isn't replaced
+    test_move_file_copy - check a move between filesystems
+    ************************************************************
+    """
+    def test_move_file_rename(self):
+        """
+        CHECK "move_file" renames on the same filesystem
+        """
+        data = self.read(self.src)
+        self.assertTrue(finalize.move_file(self.src, self.dst))
+
+        self.assertEqual(self.read(self.dst), data)
+        self.assertFalse(os.path.exists(self.src))
+
+    def test_move_file_exists(self):
+        """
+        CHECK "move_file" leaves both files alone when the destination exists
+        """
+        with open(self.dst, "wb") as writer:
+            writer.write(b"old")
+        self.assertFalse(finalize.move_file(self.src, self.dst))
+
+        self.assertEqual(self.read(self.dst), b"old")
+        self.assertTrue(os.path.exists(self.src))
+
+    def test_move_file_copy(self):
+        """
+        CHECK "move_file" copies then removes the source when it can't rename
+        """
+        data = self.read(self.src)
+        with patch.object(finalize, "same_device", return_value=False):
+            self.assertTrue(finalize.move_file(self.src, self.dst, verify=True))
+
+        self.assertEqual(self.read(self.dst), data)
+        self.assertFalse(os.path.exists(self.src))
+
+    """
+    ************************************************************
+    Test - move_all
+    test_move_all_pass - check for normal behaviour
+    test_move_all_fail - check failures are returned, the other files still move
+    test_move_all_throttled - check copies are held to the limit
+    test_move_all_skipped - check existing destinations aren't counted as moved
+    test_move_all_duplicate - check two moves to one destination
+    ************************************************************
+    """
+    def test_move_all_pass(self):
+        """
+        CHECK "move_all" moves every file and counts them
+        """
+        moves = []
+        for number in range(5):
+            src = os.path.join(self.folder, f"{number}.mkv")
+            with open(src, "wb") as writer:
+                writer.write(b"x" * 100)
+            moves.append((src, os.path.join(self.folder, f"{number}.done")))
+        with patch.object(finalize, "same_device", return_value=False):
+            failed = finalize.move_all(moves, workers=3)
+
+        self.assertEqual(failed, [])
+        for src, dst in moves:
+            self.assertFalse(os.path.exists(src))
+            self.assertEqual(self.read(dst), b"x" * 100)
+
+    def test_move_all_fail(self):
+        """
+        CHECK "move_all" returns the moves that failed
+        data check:
+            missing source: in the failed list
+        """
+        missing = os.path.join(self.folder, "missing.mkv")
+        moves = [(missing, os.path.join(self.folder, "missing.done")), (self.src, self.dst)]
+        failed = finalize.move_all(moves)
+
+        self.assertEqual([(src, dst) for src, dst, _ in failed], [moves[0]])
+        self.assertIsInstance(failed[0][2], OSError)
+        self.assertTrue(os.path.exists(self.dst))
+
+    def test_move_all_throttled(self):
+        """
+        CHECK "move_all" with a limit copies a second's worth at a time and sleeps to keep to it
+        data check:
+            4096 bytes at 1024 bytes/s: 4 copies, held back to 4 seconds in total
+        """
+        sent = []
+        real_add = finalize.Progress.add
+
+        def add(progress, count, throttle=True):
+            sent.append(count)
+            real_add(progress, count, throttle)
+
+        with patch.object(finalize, "same_device", return_value=False), \
+                patch.object(finalize.Progress, "add", add), \
+                patch.object(finalize.time, "sleep") as sleep:
+            failed = finalize.move_all([(self.src, self.dst)], limit=1024)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(sent, [1024] * 4)
+        self.assertAlmostEqual(sleep.call_args_list[-1][0][0], 4, delta=0.5)
+
+    def test_move_all_skipped(self):
+        """
+        CHECK "move_all" leaves a file whose destination exists and doesn't count it as moved
+        """
+        with open(self.dst, "wb") as writer:
+            writer.write(b"old")
+        with self.assertLogs(level="INFO") as logs:
+            failed = finalize.move_all([(self.src, self.dst)])
+
+        self.assertEqual(failed, [])
+        self.assertTrue(os.path.exists(self.src))
+        self.assertEqual(self.read(self.dst), b"old")
+        self.assertIn("Moved 0 of 1 files, 1 skipped", logs.output[-1])
+
+    def test_move_all_duplicate(self):
+        """
+        CHECK "move_all" moves only the first of two files going to the same destination
+        data check:
+            the second source is left where it was, the destination holds the first
+        """
+        second = os.path.join(self.folder, "second.mkv")
+        with open(second, "wb") as writer:
+            writer.write(b"second")
+        data = self.read(self.src)
+        with patch.object(finalize, "same_device", return_value=False), self.assertLogs(level="INFO") as logs:
+            failed = finalize.move_all([(self.src, self.dst), (second, os.path.join(self.folder, ".", "dst.mkv"))],
+                                       workers=2)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(self.read(self.dst), data)
+        self.assertEqual(self.read(second), b"second")
+        self.assertIn("Moved 1 of 2 files, 1 skipped", logs.output[-1])
+
+    def test_progress_rename_not_throttled(self):
+        """
+        CHECK "Progress.add" doesn't hold back renames
+        """
+        progress = finalize.Progress(limit=1024)
+        with patch.object(finalize.time, "sleep") as sleep:
+            progress.add(4096, throttle=False)
+
+        sleep.assert_not_called()
+        self.assertEqual(progress.copied, 4096)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from flask import Flask
+
+sys.path.insert(0, '/opt/arm')
+from arm.models.disc_fingerprint import DiscFingerprint  # noqa E402
+from arm.models.job import Job  # noqa E402
+from arm.ripper import fingerprint  # noqa E402
+from arm.ui import db  # noqa E402
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        # An empty database in memory
+        test_app = Flask("arm_test")
+        test_app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite://"
+        db.init_app(test_app)
+        self.context = test_app.app_context()
+        self.context.push()
+        db.create_all()
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def job(self, title=None, status="success", label="SERENITY", fingerprints=()):
+        """A saved job with (kind, value) fingerprints"""
+        with patch.object(Job, "parse_udev"), patch.object(Job, "get_pid"):
+            job = Job("/dev/sr0")
+        job.title = title
+        job.status = status
+        job.label = label
+        job.disctype = "dvd"
+        db.session.add(job)
+        db.session.commit()
+        for kind, value in fingerprints:
+            db.session.add(DiscFingerprint(job.job_id, kind, value))
+        db.session.commit()
+        return job
+
+    def write_file(self, name, size):
+        path = os.path.join(self.folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as writer:
+            writer.write(b"x" * size)
+
+    """
+    ************************************************************
+    Test - find_previous
+    test_find_previous_pass - check for normal behaviour
+    test_find_previous_specific - check the most specific fingerprint wins
+    test_find_previous_success - check only successful jobs are matched
+    test_find_previous_none - check a disc without fingerprints
+    ************************************************************
+    """
+    def test_find_previous_pass(self):
+        """
+        CHECK "find_previous" finds the latest successful job with a matching fingerprint
+        """
+        self.job("Serenity", fingerprints=[("crc64", "abc")])
+        latest = self.job("Serenity (2005)", fingerprints=[("crc64", "abc")])
+        self.job("Alien", fingerprints=[("crc64", "def")])
+        current = self.job(status="active", fingerprints=[("crc64", "abc")])
+
+        self.assertEqual(fingerprint.find_previous(current), (latest, "crc64"))
+
+    def test_find_previous_specific(self):
+        """
+        CHECK "find_previous" prefers a crc64 match over a newer layout match
+        """
+        by_crc = self.job("Serenity", fingerprints=[("crc64", "abc")])
+        self.job("Serenity copy", fingerprints=[("layout", "123")])
+        current = self.job(status="active")
+
+        self.assertEqual(fingerprint.find_previous(current, [("layout", "123"), ("crc64", "abc")]),
+                         (by_crc, "crc64"))
+
+    def test_find_previous_success(self):
+        """
+        CHECK "find_previous" leaves out failed jobs and the current job
+        """
+        self.job("Serenity", status="fail", fingerprints=[("crc64", "abc")])
+        current = self.job(status="active", fingerprints=[("crc64", "abc")])
+
+        self.assertEqual(fingerprint.find_previous(current), (None, None))
+
+    def test_find_previous_none(self):
+        """
+        CHECK "find_previous" doesn't match anything without fingerprints
+        """
+        self.job("Serenity", fingerprints=[("crc64", "abc")])
+        self.assertEqual(fingerprint.find_previous(self.job(status="active")), (None, None))
+
+    """
+    ************************************************************
+    Test - record
+    test_record - check fingerprints are saved once
+    ************************************************************
+    """
+    def test_record(self):
+        """
+        CHECK "record" adds the fingerprints the job doesn't have yet
+        """
+        job = self.job(status="active", fingerprints=[("crc64", "abc")])
+        fingerprint.record(job, [("crc64", "abc"), ("layout", "123")])
+
+        self.assertEqual(sorted((row.kind, row.value) for row in job.fingerprints),
+                         [("crc64", "abc"), ("layout", "123")])
+
+    """
+    ************************************************************
+    Test - job_dupe_check
+    test_job_dupe_check_pass - check for normal behaviour
+    test_job_dupe_check_label - check discs without fingerprints are matched by label
+    test_job_dupe_check_label_ambiguous - check a label used by several jobs isn't matched
+    ************************************************************
+    """
+    def test_job_dupe_check_pass(self):
+        """
+        CHECK "job_dupe_check" gives the job the title of the job that ripped the disc before
+        """
+        self.job("Serenity", fingerprints=[("crc64", "abc")])
+        current = self.job(status="active", fingerprints=[("crc64", "abc")])
+
+        self.assertTrue(fingerprint.job_dupe_check(current))
+        self.assertEqual(current.title, "Serenity")
+
+    def test_job_dupe_check_label(self):
+        """
+        CHECK "job_dupe_check" matches by label when the disc has no fingerprints, but not when it has
+        """
+        self.job("Serenity")
+        fingerprinted = self.job(status="active", fingerprints=[("crc64", "zzz")])
+        self.assertFalse(fingerprint.job_dupe_check(fingerprinted))
+
+        current = self.job(status="active")
+        self.assertTrue(fingerprint.job_dupe_check(current))
+        self.assertEqual(current.title, "Serenity")
+
+    def test_job_dupe_check_label_ambiguous(self):
+        """
+        CHECK "job_dupe_check" doesn't guess between several jobs with the label
+        """
+        self.job("Serenity")
+        self.job("Firefly")
+        self.assertFalse(fingerprint.job_dupe_check(self.job(status="active")))
+
+    """
+    ************************************************************
+    Test - layout_hash
+    test_layout_hash_pass - check for normal behaviour
+    test_layout_hash_empty - check a disc without video files
+    test_bluray_hash - check the blu-ray content hash
+    ************************************************************
+    """
+    def test_layout_hash_pass(self):
+        """
+        CHECK "layout_hash" is the same for the same label and files, different otherwise
+        """
+        self.write_file("VIDEO_TS/VTS_01_1.VOB", 1000)
+        self.write_file("VIDEO_TS/VTS_01_0.IFO", 100)
+        disc = SimpleNamespace(mountpoint=self.folder, label="SERENITY", disctype="dvd")
+        first = fingerprint.layout_hash(disc)
+
+        self.assertEqual(fingerprint.layout_hash(disc), first)
+        self.assertNotEqual(fingerprint.layout_hash(SimpleNamespace(mountpoint=self.folder, label="ALIEN",
+                                                                    disctype="dvd")), first)
+        self.write_file("VIDEO_TS/VTS_01_1.VOB", 1001)
+        self.assertNotEqual(fingerprint.layout_hash(disc), first)
+
+    def test_layout_hash_empty(self):
+        """
+        CHECK "layout_hash" of a disc without video files is None
+        """
+        self.assertIsNone(fingerprint.layout_hash(SimpleNamespace(mountpoint=self.folder, label="CD",
+                                                                  disctype="data")))
+
+    def test_bluray_hash(self):
+        """
+        CHECK "bluray_hash" changes with the playlists, and is None when the files can't be read
+        """
+        self.assertIsNone(fingerprint.bluray_hash(self.folder))
+        self.write_file("BDMV/index.bdmv", 10)
+        self.write_file("BDMV/MovieObject.bdmv", 10)
+        self.write_file("BDMV/PLAYLIST/00000.mpls", 10)
+        first = fingerprint.bluray_hash(self.folder)
+        self.write_file("BDMV/PLAYLIST/00001.mpls", 10)
+
+        self.assertIsNotNone(first)
+        self.assertNotEqual(fingerprint.bluray_hash(self.folder), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, '/opt/arm')
+import arm.config.config as cfg  # noqa E402
+from arm.models.io_allocation import IoAllocation  # noqa E402
+from arm.ripper import io_scheduler  # noqa E402
+
+# Not real block devices, so device_name gives them back as they are
+DISK = "999:1"
+OTHER_DISK = "999:2"
+
+
+class TestIoScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.next_id = 0
+        patcher = patch.dict(cfg.arm_config, {'IO_RIP_PER_DEVICE': 0, 'IO_RIP_MBPS': 0,
+                                              'IO_TRANSCODE_PER_DEVICE': 0, 'IO_TRANSCODE_MBPS': 0,
+                                              'IO_DEVICE_MBPS': 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def allocation(self, stage, status="waiting", devices=(DISK,), mbps=0):
+        """An allocation that isn't saved, numbered in the order it was asked for"""
+        self.next_id += 1
+        allocation = IoAllocation(self.next_id, stage, list(devices), [], [], mbps, os.getpid())
+        allocation.allocation_id = self.next_id
+        allocation.status = status
+        return allocation
+
+    """
+    ************************************************************
+    Test - blocked_by
+    test_blocked_by_pass - check for normal behaviour
+    test_blocked_by_queued - check waiting allocations go in order
+    test_blocked_by_per_device - check the number of a stage on one disk
+    test_blocked_by_budget - check the MB/s of a disk
+    test_blocked_by_budget_alone - check a stage bigger than the budget
+    ************************************************************
+    """
+    def test_blocked_by_pass(self):
+        """
+        CHECK "blocked_by" lets everything start when no limits are set
+        """
+        others = [self.allocation("rip", "active", mbps=100) for _ in range(3)]
+        self.assertIsNone(io_scheduler.blocked_by(self.allocation("rip", mbps=100), others))
+
+    def test_blocked_by_queued(self):
+        """
+        CHECK "blocked_by" keeps an allocation behind an earlier one of the same stage on its disk
+        data check:
+            earlier rip on the disk: queued, earlier transcode or a rip on another disk: not queued
+        """
+        earlier = self.allocation("rip")
+        other_stage = self.allocation("transcode")
+        other_disk = self.allocation("rip", devices=(OTHER_DISK,))
+        waiting = self.allocation("rip")
+
+        self.assertEqual(io_scheduler.blocked_by(waiting, [earlier, other_stage, other_disk]),
+                         f"queued behind another rip on {DISK}")
+        self.assertIsNone(io_scheduler.blocked_by(waiting, [other_stage, other_disk]))
+        self.assertIsNone(io_scheduler.blocked_by(earlier, [other_stage, other_disk, waiting]))
+
+    def test_blocked_by_per_device(self):
+        """
+        CHECK "blocked_by" holds to IO_<stage>_PER_DEVICE on each disk
+        data check:
+            limit 2, 2 active on the disk: blocked, 1 active: can start
+        """
+        with patch.dict(cfg.arm_config, {'IO_RIP_PER_DEVICE': 2}):
+            first = self.allocation("rip", "active")
+            second = self.allocation("rip", "active", devices=(OTHER_DISK, DISK))
+            transcode = self.allocation("transcode", "active")
+            waiting = self.allocation("rip")
+
+            self.assertEqual(io_scheduler.blocked_by(waiting, [first, second, transcode]),
+                             f"2 rip already running on {DISK}")
+            self.assertIsNone(io_scheduler.blocked_by(waiting, [first, transcode]))
+
+    def test_blocked_by_budget(self):
+        """
+        CHECK "blocked_by" holds to IO_DEVICE_MBPS for the stages on a disk together
+        data check:
+            budget 100, 60 in use: 40 fits, 50 doesn't
+        """
+        with patch.dict(cfg.arm_config, {'IO_DEVICE_MBPS': 100}):
+            active = [self.allocation("transcode", "active", mbps=60),
+                      self.allocation("rip", "active", devices=(OTHER_DISK,), mbps=80)]
+
+            self.assertIsNone(io_scheduler.blocked_by(self.allocation("rip", mbps=40), active))
+            self.assertEqual(io_scheduler.blocked_by(self.allocation("rip", mbps=50), active),
+                             f"60 of 100 MB/s in use on {DISK}")
+
+    def test_blocked_by_budget_alone(self):
+        """
+        CHECK "blocked_by" starts a stage bigger than the budget once the disk is free
+        """
+        with patch.dict(cfg.arm_config, {'IO_DEVICE_MBPS': 100}):
+            self.assertIsNone(io_scheduler.blocked_by(self.allocation("rip", mbps=500), []))
+            self.assertIsNotNone(io_scheduler.blocked_by(self.allocation("rip", mbps=500),
+                                                         [self.allocation("transcode", "active", mbps=1)]))
+
+    """
+    ************************************************************
+    Test - allocation_for
+    test_allocation_for_pass - check for normal behaviour
+    test_allocation_for_request_fail - check the stage runs when the allocation can't be added
+    test_allocation_for_acquire_fail - check the stage runs when the allocation can't be started
+    ************************************************************
+    """
+    def test_allocation_for_pass(self):
+        """
+        CHECK "allocation_for" gives the stage its MB/s and releases it when the block ends, or raises
+        """
+        allocation = self.allocation("rip", mbps=20)
+        with patch.object(io_scheduler, "request", return_value=allocation), \
+                patch.object(io_scheduler, "acquire") as acquire, \
+                patch.object(io_scheduler, "release") as release:
+            with io_scheduler.allocation_for(None, "rip", writes=["/home/arm/media/raw"]) as rate:
+                self.assertEqual(rate, 20 * io_scheduler.MB)
+                release.assert_not_called()
+            with self.assertRaises(ValueError):
+                with io_scheduler.allocation_for(None, "rip", writes=["/home/arm/media/raw"]):
+                    raise ValueError("makemkv failed")
+
+        self.assertEqual(acquire.call_count, 2)
+        self.assertEqual(release.call_count, 2)
+
+    def test_allocation_for_request_fail(self):
+        """
+        CHECK "allocation_for" runs the stage without a limit when the allocation can't be added
+        """
+        with patch.object(io_scheduler, "request", side_effect=RuntimeError("database is locked")), \
+                patch.object(io_scheduler, "release") as release:
+            with io_scheduler.allocation_for(None, "rip", writes=["/home/arm/media/raw"]) as rate:
+                self.assertEqual(rate, 0)
+
+        release.assert_not_called()
+
+    def test_allocation_for_acquire_fail(self):
+        """
+        CHECK "allocation_for" releases the allocation and runs the stage when it can't be started
+        """
+        allocation = self.allocation("rip", mbps=20)
+        with patch.object(io_scheduler, "request", return_value=allocation), \
+                patch.object(io_scheduler, "acquire", side_effect=OSError("can't open the lock file")), \
+                patch.object(io_scheduler, "release") as release:
+            with io_scheduler.allocation_for(None, "rip", writes=["/home/arm/media/raw"]) as rate:
+                self.assertEqual(rate, 0)
+                release.assert_called_once_with(allocation)
+
+        release.assert_called_once_with(allocation)
+
+    """
+    ************************************************************
+    Test - device_of
+    test_device_of_missing - check a path that doesn't exist yet
+    ************************************************************
+    """
+    def test_device_of_missing(self):
+        """
+        CHECK "device_of" gives the filesystem a path will be created on
+        """
+        here = os.path.dirname(os.path.abspath(__file__))
+        self.assertEqual(io_scheduler.device_of(os.path.join(here, "not", "there", "yet.mkv")),
+                         io_scheduler.device_of(here))
+        self.assertIsNone(io_scheduler.device_of(""))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, '/opt/arm')
+from arm.ripper import log_maintenance  # noqa E402
+
+LOG = b"line one\nline two\nline three\n"
+
+
+class TestLogMaintenance(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write_log(self, name, data=LOG, age=0):
+        """Write a log last changed age seconds ago"""
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as writer:
+            writer.write(data)
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+        return path
+
+    def gzip_log(self, name, data=LOG):
+        """Write a log that has already been compressed, the path is the one the job knows"""
+        path = os.path.join(self.folder, name)
+        with gzip.open(path + log_maintenance.GZ_SUFFIX, "wb") as writer:
+            writer.write(data)
+        return path
+
+    """
+    ************************************************************
+    Test - compress
+    test_compress_pass - check for normal behaviour
+    test_compress_changed - check a log written to while compressing is left
+    ************************************************************
+    """
+    def test_compress_pass(self):
+        """
+        CHECK "compress" replaces the log with a .gz that keeps its contents and times
+        """
+        path = self.write_log("job.log", age=3600)
+        mtime = os.stat(path).st_mtime_ns
+        self.assertTrue(log_maintenance.compress(path))
+
+        self.assertFalse(os.path.exists(path))
+        with gzip.open(path + ".gz", "rb") as reader:
+            self.assertEqual(reader.read(), LOG)
+        self.assertEqual(os.stat(path + ".gz").st_mtime_ns, mtime)
+
+    def test_compress_changed(self):
+        """
+        CHECK "compress" leaves a log that was written to while it was compressed
+        """
+        path = self.write_log("job.log", age=3600)
+        real_copy = shutil.copyfileobj
+
+        def copy_then_write(reader, writer, length):
+            real_copy(reader, writer, length)
+            with open(path, "ab") as log:
+                log.write(b"more\n")
+
+        with patch.object(log_maintenance.shutil, "copyfileobj", copy_then_write):
+            self.assertFalse(log_maintenance.compress(path))
+
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(os.listdir(self.folder), ["job.log"])
+
+    """
+    ************************************************************
+    Test - maintain
+    test_maintain_compress - check finished logs are compressed, running ones aren't
+    test_maintain_loglife - check logs older than LOGLIFE are deleted
+    test_maintain_budget - check the oldest logs are deleted to fit the size budget
+    ************************************************************
+    """
+    def test_maintain_compress(self):
+        """
+        CHECK "maintain" compresses idle logs, leaves recent and active logs, removes leftovers
+        """
+        idle = self.write_log("idle.log", age=3600)
+        recent = self.write_log("recent.log")
+        active = self.write_log("active.log", age=3600)
+        leftover = self.write_log("old.log.gz" + log_maintenance.TMP_SUFFIX, age=3600)
+        summary = log_maintenance.maintain(self.folder, 0, 0, [active])
+
+        self.assertEqual(summary['compressed'], 1)
+        self.assertTrue(os.path.exists(idle + ".gz"))
+        self.assertTrue(os.path.exists(recent))
+        self.assertTrue(os.path.exists(active))
+        self.assertFalse(os.path.exists(leftover))
+
+    def test_maintain_loglife(self):
+        """
+        CHECK "maintain" deletes logs older than loglife days
+        """
+        old = self.write_log("old.log", age=10 * 86400)
+        new = self.write_log("new.log")
+        summary = log_maintenance.maintain(self.folder, 7, 0)
+
+        self.assertEqual(summary['deleted'], 1)
+        self.assertFalse(os.path.exists(old + ".gz"))
+        self.assertTrue(os.path.exists(new))
+
+    def test_maintain_budget(self):
+        """
+        CHECK "maintain" deletes the oldest logs until the rest fit in max_bytes
+        data check:
+            3 logs of 1000 bytes, 2500 byte budget: only the oldest is deleted
+        """
+        oldest = self.write_log("1.log", b"x" * 1000, age=300)
+        middle = self.write_log("2.log", b"x" * 1000, age=200)
+        newest = self.write_log("3.log", b"x" * 1000, age=100)
+        summary = log_maintenance.maintain(self.folder, 0, 2500)
+
+        self.assertEqual(summary['deleted'], 1)
+        self.assertEqual(summary['size'], 2000)
+        self.assertFalse(os.path.exists(oldest))
+        self.assertTrue(os.path.exists(middle))
+        self.assertTrue(os.path.exists(newest))
+
+    """
+    ************************************************************
+    Test - tail_offset
+    test_tail_offset_pass - check for normal behaviour, plain and compressed
+    test_tail_offset_bounds_high - check more lines than the log has
+    test_tail_offset_bounds_low - check no lines
+    ************************************************************
+    """
+    def test_tail_offset_pass(self):
+        """
+        CHECK "tail_offset" finds where the last lines start
+        data check:
+            last line: 18, last two lines: 9
+        """
+        plain = self.write_log("plain.log")
+        packed = self.gzip_log("packed.log")
+        for path in (plain, packed):
+            self.assertEqual(log_maintenance.tail_offset(path, 1), 18)
+            self.assertEqual(log_maintenance.tail_offset(path, 2), 9)
+
+    def test_tail_offset_bounds_high(self):
+        """
+        CHECK "tail_offset" starts at the beginning when the log is shorter
+        """
+        plain = self.write_log("plain.log")
+        packed = self.gzip_log("packed.log")
+        for path in (plain, packed):
+            self.assertEqual(log_maintenance.tail_offset(path, 100), 0)
+
+    def test_tail_offset_bounds_low(self):
+        """
+        CHECK "tail_offset" of no lines is the end of the log
+        """
+        plain = self.write_log("plain.log")
+        packed = self.gzip_log("packed.log")
+        for path in (plain, packed):
+            self.assertEqual(log_maintenance.tail_offset(path, 0), len(LOG))
+
+    """
+    ************************************************************
+    Test - read_range
+    test_read_range_pass - check for normal behaviour, plain and compressed
+    test_read_range_multibyte - check characters cut by the range are dropped
+    test_read_range_missing - check a missing log
+    ************************************************************
+    """
+    def test_read_range_pass(self):
+        """
+        CHECK "read_range" reads from offset for limit bytes, in chunks
+        """
+        plain = self.write_log("plain.log")
+        packed = self.gzip_log("packed.log")
+        for path in (plain, packed):
+            self.assertEqual("".join(log_maintenance.read_range(path, 9, 8, chunk=3)), "line two")
+            self.assertEqual("".join(log_maintenance.read_range(path, 18)), "line three\n")
+
+    def test_read_range_multibyte(self):
+        """
+        CHECK "read_range" drops a multibyte character cut by the range
+        data check:
+            "é" is 2 bytes, starting in the middle of it skips it
+        """
+        path = self.write_log("plain.log", "aéb".encode())
+        self.assertEqual("".join(log_maintenance.read_range(path, 2)), "b")
+        self.assertEqual("".join(log_maintenance.read_range(path, 0, 2)), "a")
+
+    def test_read_range_missing(self):
+        """
+        CHECK "read_range" raises FileNotFoundError when neither the log nor its .gz exist
+        """
+        with self.assertRaises(FileNotFoundError):
+            log_maintenance.read_range(os.path.join(self.folder, "missing.log"))
+
+
+if __name__ == '__main__':
+    unittest.main()
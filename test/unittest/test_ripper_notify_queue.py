@@ -0,0 +1,235 @@
+import datetime
+import sys
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+sys.path.insert(0, '/opt/arm')
+import arm.config.config as cfg  # noqa E402
+from arm.models.notification_queue import NotificationQueue  # noqa E402
+from arm.ripper import notify_queue  # noqa E402
+from arm.ui import db  # noqa E402
+
+TARGETS = {'BASH_SCRIPT': "/opt/arm/notify.sh", 'JSON_URL': "json://localhost"}
+
+
+class TestNotifyQueue(unittest.TestCase):
+
+    def setUp(self):
+        # An empty database in memory, the worker of the real app is never started
+        test_app = Flask("arm_test")
+        test_app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite://"
+        db.init_app(test_app)
+        self.context = test_app.app_context()
+        self.context.push()
+        db.create_all()
+        self.now = datetime.datetime.now()
+        for patcher in (patch.object(notify_queue, "targets", return_value=TARGETS),
+                        patch.dict(cfg.arm_config, {'NOTIFY_DIGEST': 0})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def queue(self, *rows):
+        """Add (job_id, target, title) rows that are due now"""
+        queued = [NotificationQueue(job_id, target, title, f"{title} body") for job_id, target, title in rows]
+        db.session.add_all(queued)
+        db.session.commit()
+        return queued
+
+    """
+    ************************************************************
+    Test - finish
+    test_finish_sent - check for normal behaviour
+    test_finish_retry - check the delay doubles and is capped
+    test_finish_attempts - check rows are given up on after MAX_ATTEMPTS
+    test_finish_no_retry - check failures not worth trying again
+    ************************************************************
+    """
+    def test_finish_sent(self):
+        """
+        CHECK "finish" marks sent rows and clears the last error
+        """
+        row = NotificationQueue(1, 'BASH_SCRIPT', "title", "body")
+        row.last_error = "earlier failure"
+        notify_queue.finish([row], True, None, False)
+
+        self.assertEqual(row.status, "sent")
+        self.assertEqual(row.attempts, 1)
+        self.assertIsNone(row.last_error)
+        self.assertIsNotNone(row.sent)
+
+    def test_finish_retry(self):
+        """
+        CHECK "finish" puts failed rows back with a growing delay
+        data check:
+            attempt 1: RETRY_BACKOFF, attempt 3: 4 * RETRY_BACKOFF, attempt 15: MAX_BACKOFF
+        """
+        for attempts, delay in ((0, notify_queue.RETRY_BACKOFF),
+                                (2, notify_queue.RETRY_BACKOFF * 4),
+                                (14, notify_queue.MAX_BACKOFF)):
+            row = NotificationQueue(1, 'BASH_SCRIPT', "title", "body")
+            row.attempts = attempts
+            before = datetime.datetime.now()
+            with patch.object(notify_queue, "MAX_ATTEMPTS", 20):
+                notify_queue.finish([row], False, "timed out", True)
+
+            self.assertEqual(row.status, "pending")
+            self.assertEqual(row.last_error, "timed out")
+            self.assertAlmostEqual((row.next_attempt - before).total_seconds(), delay, delta=1)
+
+    def test_finish_attempts(self):
+        """
+        CHECK "finish" fails a row on its last attempt
+        """
+        row = NotificationQueue(1, 'BASH_SCRIPT', "title", "body")
+        row.attempts = notify_queue.MAX_ATTEMPTS - 1
+        notify_queue.finish([row], False, "timed out", True)
+
+        self.assertEqual(row.status, "failed")
+        self.assertEqual(row.attempts, notify_queue.MAX_ATTEMPTS)
+
+    def test_finish_no_retry(self):
+        """
+        CHECK "finish" fails a row straight away when trying again won't help
+        """
+        row = NotificationQueue(1, 'JSON_URL', "title", "body")
+        notify_queue.finish([row], False, "not a valid apprise url", False)
+
+        self.assertEqual(row.status, "failed")
+        self.assertEqual(row.attempts, 1)
+
+    """
+    ************************************************************
+    Test - deliver_due
+    test_deliver_due_pass - check for normal behaviour
+    test_deliver_due_digest - check a job's messages to a target go together
+    test_deliver_due_digest_retry - check retries wait for their delay in a digest
+    test_deliver_due_fail - check a failed delivery is tried again later
+    test_deliver_due_held - check rows that aren't due yet
+    test_deliver_due_stale - check claims of a worker that died
+    test_deliver_due_target_removed - check rows for a target that's gone
+    ************************************************************
+    """
+    def test_deliver_due_pass(self):
+        """
+        CHECK "deliver_due" sends each row on its own when there's no digest
+        """
+        self.queue((1, 'BASH_SCRIPT', "Ripping"), (1, 'BASH_SCRIPT', "Done"), (None, 'JSON_URL', "Started"))
+        with patch.object(notify_queue, "deliver", return_value=(True, None, False)) as deliver:
+            self.assertEqual(notify_queue.deliver_due(), 3)
+
+        self.assertEqual([call[0][2] for call in deliver.call_args_list], ["Ripping", "Done", "Started"])
+        self.assertEqual({row.status for row in NotificationQueue.query.all()}, {"sent"})
+
+    def test_deliver_due_digest(self):
+        """
+        CHECK "deliver_due" with NOTIFY_DIGEST sends a job's messages to a target as one once the first is due
+        data check:
+            digest 60, job 1 queued 60, 30 and 10 seconds ago: 1 message with all 3
+            job 2 queued 30 seconds ago: held, job 1 to the json url: 1 message
+        """
+        ripping, transcoding, done, other_job, json_url = self.queue(
+            (1, 'BASH_SCRIPT', "Ripping"), (1, 'BASH_SCRIPT', "Transcoding"), (1, 'BASH_SCRIPT', "Done"),
+            (2, 'BASH_SCRIPT', "Ripping"), (1, 'JSON_URL', "Done"))
+        # enqueue holds each message for the digest from when it was queued
+        for row, queued_ago in ((ripping, 60), (transcoding, 30), (done, 10), (other_job, 30), (json_url, 60)):
+            row.next_attempt = self.now + datetime.timedelta(seconds=60 - queued_ago)
+        db.session.commit()
+        with patch.dict(cfg.arm_config, {'NOTIFY_DIGEST': 60}), \
+                patch.object(notify_queue, "deliver", return_value=(True, None, False)) as deliver:
+            self.assertEqual(notify_queue.deliver_due(), 4)
+
+        self.assertEqual(deliver.call_count, 2)
+        target, address, title, body = deliver.call_args_list[0][0]
+        self.assertEqual((target, address, title), ('BASH_SCRIPT', TARGETS['BASH_SCRIPT'], "Done (3 updates)"))
+        self.assertEqual(body, "Ripping body\n\nTranscoding body\n\nDone body")
+        self.assertEqual(deliver.call_args_list[1][0][:3], ('JSON_URL', TARGETS['JSON_URL'], "Done"))
+        db.session.refresh(other_job)
+        self.assertEqual(other_job.status, "pending")
+
+    def test_deliver_due_digest_retry(self):
+        """
+        CHECK "deliver_due" leaves a job's retry that isn't due out of the digest of its new messages
+        """
+        retry, first, later = self.queue((1, 'BASH_SCRIPT', "Ripping"), (1, 'BASH_SCRIPT', "Transcoding"),
+                                         (1, 'BASH_SCRIPT', "Done"))
+        retry.attempts = 1
+        retry.next_attempt = self.now + datetime.timedelta(hours=1)
+        later.next_attempt = self.now + datetime.timedelta(seconds=30)
+        db.session.commit()
+        with patch.dict(cfg.arm_config, {'NOTIFY_DIGEST': 60}), \
+                patch.object(notify_queue, "deliver", return_value=(True, None, False)) as deliver:
+            self.assertEqual(notify_queue.deliver_due(), 2)
+
+        self.assertEqual(deliver.call_args_list[0][0][2], "Done (2 updates)")
+        db.session.refresh(retry)
+        self.assertEqual(retry.status, "pending")
+
+    def test_deliver_due_fail(self):
+        """
+        CHECK "deliver_due" leaves a failed row pending with its delay
+        """
+        row, = self.queue((1, 'BASH_SCRIPT', "Done"))
+        with patch.object(notify_queue, "deliver", return_value=(False, "exited with 1", True)):
+            self.assertEqual(notify_queue.deliver_due(), 0)
+
+        db.session.refresh(row)
+        self.assertEqual((row.status, row.attempts, row.last_error), ("pending", 1, "exited with 1"))
+        self.assertGreater(row.next_attempt, self.now)
+        self.assertIsNone(row.claimed)
+
+    def test_deliver_due_held(self):
+        """
+        CHECK "deliver_due" holds rows until they're due, everything only sends the untried ones
+        data check:
+            held for a digest: sent by everything, waiting to retry: not sent
+        """
+        held, retry = self.queue((1, 'BASH_SCRIPT', "Held"), (2, 'BASH_SCRIPT', "Retry"))
+        held.next_attempt = retry.next_attempt = self.now + datetime.timedelta(hours=1)
+        retry.attempts = 1
+        db.session.commit()
+        with patch.object(notify_queue, "deliver", return_value=(True, None, False)) as deliver:
+            self.assertEqual(notify_queue.deliver_due(), 0)
+            self.assertEqual(notify_queue.deliver_due(everything=True), 1)
+
+        self.assertEqual([call[0][2] for call in deliver.call_args_list], ["Held"])
+        db.session.refresh(retry)
+        self.assertEqual(retry.status, "pending")
+
+    def test_deliver_due_stale(self):
+        """
+        CHECK "deliver_due" sends rows claimed more than STALE_CLAIM ago, leaves recent claims
+        """
+        stale, claimed = self.queue((1, 'BASH_SCRIPT', "Stale"), (2, 'BASH_SCRIPT', "Claimed"))
+        stale.status = claimed.status = "sending"
+        stale.claimed = self.now - datetime.timedelta(seconds=notify_queue.STALE_CLAIM + 60)
+        claimed.claimed = self.now
+        db.session.commit()
+        with patch.object(notify_queue, "deliver", return_value=(True, None, False)):
+            self.assertEqual(notify_queue.deliver_due(), 1)
+
+        db.session.refresh(stale)
+        db.session.refresh(claimed)
+        self.assertEqual((stale.status, claimed.status), ("sent", "sending"))
+
+    def test_deliver_due_target_removed(self):
+        """
+        CHECK "deliver_due" fails rows for a target that isn't set up any more, without sending
+        """
+        row, = self.queue((1, 'PB_KEY', "Done"))
+        with patch.object(notify_queue, "deliver") as deliver:
+            self.assertEqual(notify_queue.deliver_due(), 0)
+
+        deliver.assert_not_called()
+        db.session.refresh(row)
+        self.assertEqual(row.status, "failed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+import datetime
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from flask import Flask
+
+sys.path.insert(0, '/opt/arm')
+import arm.config.config as cfg  # noqa E402
+from arm.models.config import Config  # noqa E402
+from arm.models.job import Job  # noqa E402
+from arm.models.job_stage import JobStage  # noqa E402
+from arm.models.track import Track  # noqa E402
+from arm.ui import db, eta  # noqa E402
+
+PRESET = "Fast 480p30"
+
+
+class TestEta(unittest.TestCase):
+
+    def setUp(self):
+        # An empty database in memory
+        test_app = Flask("arm_test")
+        test_app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite://"
+        db.init_app(test_app)
+        self.context = test_app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def job(self, lengths, stages=(), status="success", devpath="/dev/sr0", disctype="dvd", mainfeature=False):
+        """
+        A job with tracks of the given lengths and (stage, duration) rows, a duration of None is still running
+        """
+        with patch.object(Job, "parse_udev"), patch.object(Job, "get_pid"):
+            job = Job(devpath)
+        job.disctype = disctype
+        job.status = status
+        db.session.add(job)
+        db.session.commit()
+        db.session.add(Config({'MINLENGTH': "0", 'MAXLENGTH': "99999", 'MAINFEATURE': mainfeature,
+                               'SKIP_TRANSCODE': False, 'HB_PRESET_DVD': PRESET,
+                               'HB_PRESET_BD': "Fast 1080p30"}, job.job_id))
+        for number, length in enumerate(lengths):
+            db.session.add(Track(job.job_id, str(number), length, "16:9", 25, False, "MakeMKV", "", ""))
+        for name, duration in stages:
+            stage = JobStage(job.job_id, name)
+            if duration is None:
+                stage.start_time = datetime.datetime.now() - datetime.timedelta(seconds=600)
+            else:
+                stage.status = "success"
+                stage.duration = duration
+            db.session.add(stage)
+        db.session.commit()
+        return job
+
+    """
+    ************************************************************
+    Test - content_seconds
+    test_content_seconds_pass - check for normal behaviour
+    test_content_seconds_mainfeature - check only the longest track counts
+    test_content_seconds_music - check cd track lengths are in milliseconds
+    ************************************************************
+    """
+    def test_content_seconds_pass(self):
+        """
+        CHECK "content_seconds" adds up the tracks between MINLENGTH and MAXLENGTH, each title once
+        """
+        job = SimpleNamespace(disctype="dvd", job_id=1)
+        tracks = [SimpleNamespace(track_number="0", length=3000), SimpleNamespace(track_number="0", length=3000),
+                  SimpleNamespace(track_number="1", length=100), SimpleNamespace(track_number="2", length=None),
+                  SimpleNamespace(track_number="3", length=900)]
+        config = SimpleNamespace(MINLENGTH="600", MAXLENGTH="4000", MAINFEATURE=False)
+        self.assertEqual(eta.content_seconds(job, tracks, config), 3900.0)
+
+    def test_content_seconds_mainfeature(self):
+        """
+        CHECK "content_seconds" with MAINFEATURE only counts the longest track
+        """
+        job = SimpleNamespace(disctype="dvd", job_id=1)
+        tracks = [SimpleNamespace(track_number="0", length=3000), SimpleNamespace(track_number="1", length=900)]
+        config = SimpleNamespace(MINLENGTH="600", MAXLENGTH="4000", MAINFEATURE=True)
+        self.assertEqual(eta.content_seconds(job, tracks, config), 3000.0)
+
+    def test_content_seconds_music(self):
+        """
+        CHECK "content_seconds" of a cd converts the lengths from milliseconds
+        """
+        job = SimpleNamespace(disctype="music", job_id=1)
+        tracks = [SimpleNamespace(track_number="1", length=180000), SimpleNamespace(track_number="2", length=240000)]
+        self.assertEqual(eta.content_seconds(job, tracks, None), 420.0)
+
+    """
+    ************************************************************
+    Test - fit_rates
+    test_fit_rates_pass - check for normal behaviour
+    test_fit_rates_empty - check without history
+    ************************************************************
+    """
+    def test_fit_rates_pass(self):
+        """
+        CHECK "fit_rates" fits content seconds per wall second for each drive and preset
+        data check:
+            2 dvds of 3600 s ripped in 1800 s and 3600 s: 4/3, transcoded in 7200 s each: 0.5
+            a failed job and a job without stage timings are left out
+        """
+        self.job([3600], [("rip", 1800), ("transcode", 7200)])
+        self.job([3600], [("rip", 3600), ("transcode", 7200)])
+        self.job([3600], [("rip", 60), ("transcode", 60)], status="fail")
+        self.job([3600])
+        self.job([3600], [("rip", 1800)], devpath="/dev/sr1", disctype="bluray")
+        rates = eta.fit_rates()
+
+        self.assertAlmostEqual(rates['rip'][("/dev/sr0", "dvd")], 4 / 3)
+        self.assertAlmostEqual(rates['rip'][(None, "dvd")], 4 / 3)
+        self.assertAlmostEqual(rates['rip'][("/dev/sr1", "bluray")], 2.0)
+        self.assertEqual(rates['transcode'], {PRESET: 0.5})
+
+    def test_fit_rates_empty(self):
+        """
+        CHECK "fit_rates" without finished jobs has no rates
+        """
+        self.assertEqual(eta.fit_rates(), {'rip': {}, 'transcode': {}})
+
+    """
+    ************************************************************
+    Test - cached_rates
+    test_cached_rates - check the fit is reused for RATES_TTL seconds
+    ************************************************************
+    """
+    def test_cached_rates(self):
+        """
+        CHECK "cached_rates" only fits again after RATES_TTL seconds
+        """
+        clock = [1000.0]
+        with patch.object(eta, "_rates", {'value': None, 'fitted': 0}), \
+                patch.object(eta, "fit_rates", side_effect=lambda: {'fitted_at': clock[0]}) as fit, \
+                patch.object(eta.time, "monotonic", side_effect=lambda: clock[0]):
+            self.assertEqual(eta.cached_rates(), {'fitted_at': 1000.0})
+            clock[0] += eta.RATES_TTL - 1
+            self.assertEqual(eta.cached_rates(), {'fitted_at': 1000.0})
+            clock[0] += 2
+            self.assertEqual(eta.cached_rates(), {'fitted_at': clock[0]})
+
+        self.assertEqual(fit.call_count, 2)
+
+    """
+    ************************************************************
+    Test - predict_jobs
+    test_predict_jobs_pass - check for normal behaviour
+    test_predict_jobs_unknown - check a drive and preset without history
+    ************************************************************
+    """
+    def test_predict_jobs_pass(self):
+        """
+        CHECK "predict_jobs" takes the time spent so far off the fitted times
+        data check:
+            3600 s at 2x, ripping for 600 s: 1200 s left, transcode at 0.5x: 7200 s
+        """
+        job = self.job([3600], [("rip", None)], status="ripping")
+        rates = {'rip': {(None, "dvd"): 2.0}, 'transcode': {PRESET: 0.5}}
+        prediction = eta.predict_jobs([job], rates)[job.job_id]
+
+        self.assertAlmostEqual(prediction['rip'], 1200, delta=2)
+        self.assertEqual(prediction['transcode'], 7200)
+        self.assertIsNone(prediction['wait'])
+
+    def test_predict_jobs_unknown(self):
+        """
+        CHECK "predict_jobs" leaves the times it has no history for as None
+        """
+        job = self.job([3600], [("rip", None)], status="ripping", devpath="/dev/sr1", disctype="bluray")
+        prediction = eta.predict_jobs([job], {'rip': {(None, "dvd"): 2.0}, 'transcode': {}})[job.job_id]
+        self.assertEqual(prediction, {'rip': None, 'wait': None, 'transcode': None})
+
+    """
+    ************************************************************
+    Test - predict_queue
+    test_predict_queue_pass - check for normal behaviour
+    test_predict_queue_unlimited - check nothing waits without a limit
+    test_predict_queue_unknown - check jobs behind an unknown transcode
+    ************************************************************
+    """
+    def queue(self, *jobs):
+        """(status, transcode seconds) pairs as jobs and predictions, started in that order"""
+        started = datetime.datetime.now()
+        queued = [SimpleNamespace(job_id=number, status=status, start_time=started + datetime.timedelta(seconds=number))
+                  for number, (status, _) in enumerate(jobs)]
+        predictions = {number: {'rip': None, 'wait': None, 'transcode': transcode}
+                       for number, (_, transcode) in enumerate(jobs)}
+        return queued, predictions
+
+    def test_predict_queue_pass(self):
+        """
+        CHECK "predict_queue" waits for the slots to be freed in turn
+        data check:
+            1 slot, 100 s left on the running transcode, 2 waiting of 200 s: wait 100 s and 300 s
+        """
+        jobs, predictions = self.queue(("transcoding", 100), ("waiting_transcode", 200), ("waiting_transcode", 200))
+        with patch.dict(cfg.arm_config, {'MAX_CONCURRENT_TRANSCODES': 1}):
+            eta.predict_queue(jobs, predictions)
+
+        self.assertEqual([predictions[number]['wait'] for number in (1, 2)], [100, 300])
+
+    def test_predict_queue_unlimited(self):
+        """
+        CHECK "predict_queue" without MAX_CONCURRENT_TRANSCODES doesn't wait
+        """
+        jobs, predictions = self.queue(("transcoding", 100), ("waiting_transcode", 200))
+        with patch.dict(cfg.arm_config, {'MAX_CONCURRENT_TRANSCODES': 0}):
+            eta.predict_queue(jobs, predictions)
+
+        self.assertEqual(predictions[1]['wait'], 0.0)
+
+    def test_predict_queue_unknown(self):
+        """
+        CHECK "predict_queue" can't say how long jobs behind an unknown transcode wait
+        """
+        jobs, predictions = self.queue(("transcoding", None), ("waiting_transcode", 200))
+        with patch.dict(cfg.arm_config, {'MAX_CONCURRENT_TRANSCODES': 1}):
+            eta.predict_queue(jobs, predictions)
+
+        self.assertIsNone(predictions[1]['wait'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+sys.path.insert(0, '/opt/arm')
+from arm.ui import http_client  # noqa E402
+
+
+class TestHttpClient(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = [1000.0]
+        patcher = patch.object(http_client.time, "monotonic", side_effect=lambda: self.clock[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = http_client.CircuitBreaker("test", threshold=3, cooldown=60)
+
+    def open_breaker(self):
+        for _ in range(self.breaker.threshold):
+            self.breaker.failure()
+
+    """
+    ************************************************************
+    Test - CircuitBreaker
+    test_breaker_pass - check for normal behaviour
+    test_breaker_threshold - check it opens after threshold failures in a row
+    test_breaker_half_open - check one trial call after the cooldown
+    test_breaker_trial_fail - check a failed trial opens it again
+    test_breaker_release - check a trial that says nothing about the provider
+    ************************************************************
+    """
+    def test_breaker_pass(self):
+        """
+        CHECK "CircuitBreaker" lets calls through, a success resets the failures
+        """
+        self.breaker.failure()
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+        self.breaker.failure()
+
+        self.assertTrue(self.breaker.allow())
+        self.assertIsNone(self.breaker.opened_at)
+
+    def test_breaker_threshold(self):
+        """
+        CHECK "CircuitBreaker" fails fast once there have been threshold failures in a row
+        """
+        self.open_breaker()
+        self.assertFalse(self.breaker.allow())
+        self.clock[0] += 59
+        self.assertFalse(self.breaker.allow())
+
+    def test_breaker_half_open(self):
+        """
+        CHECK "CircuitBreaker" lets one trial through after the cooldown, its success closes it
+        """
+        self.open_breaker()
+        self.clock[0] += 60
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.success()
+
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+    def test_breaker_trial_fail(self):
+        """
+        CHECK "CircuitBreaker" opens again for a whole cooldown when the trial fails
+        """
+        self.open_breaker()
+        self.clock[0] += 60
+        self.assertTrue(self.breaker.allow())
+        self.breaker.failure()
+
+        self.assertFalse(self.breaker.allow())
+        self.clock[0] += 60
+        self.assertTrue(self.breaker.allow())
+
+    def test_breaker_release(self):
+        """
+        CHECK "CircuitBreaker" lets another trial through when one ends without an answer
+        """
+        self.open_breaker()
+        self.clock[0] += 60
+        self.assertTrue(self.breaker.allow())
+        self.breaker.release()
+
+        self.assertTrue(self.breaker.allow())
+        self.assertIsNotNone(self.breaker.opened_at)
+
+    """
+    ************************************************************
+    Test - request
+    test_request_pass - check for normal behaviour
+    test_request_open - check calls fail fast while the breaker is open
+    test_request_server_error - check 5xx counts against the provider, 4xx doesn't
+    ************************************************************
+    """
+    def response(self, status_code):
+        return MagicMock(status_code=status_code)
+
+    def test_request_pass(self):
+        """
+        CHECK "request" sends through the shared session with the default timeouts
+        """
+        with patch.object(http_client, "_breakers", {}), \
+                patch.object(http_client.session, "request", return_value=self.response(200)) as send:
+            self.assertEqual(http_client.get("test", "https://example.com").status_code, 200)
+
+        send.assert_called_once_with("GET", "https://example.com",
+                                     timeout=(http_client.CONNECT_TIMEOUT, http_client.READ_TIMEOUT))
+
+    def test_request_open(self):
+        """
+        CHECK "request" raises CircuitOpenError without sending once the provider keeps failing
+        """
+        error = requests.exceptions.ConnectTimeout("timed out")
+        with patch.object(http_client, "_breakers", {}), \
+                patch.object(http_client.session, "request", side_effect=error) as send:
+            for _ in range(http_client.BREAKER_THRESHOLD):
+                with self.assertRaises(requests.exceptions.ConnectTimeout):
+                    http_client.get("test", "https://example.com")
+            with self.assertRaises(http_client.CircuitOpenError):
+                http_client.get("test", "https://example.com")
+
+        self.assertEqual(send.call_count, http_client.BREAKER_THRESHOLD)
+
+    def test_request_server_error(self):
+        """
+        CHECK "request" raises ProviderError for 5xx and counts it, 4xx is returned as an answer
+        """
+        with patch.object(http_client, "_breakers", {}), \
+                patch.object(http_client.session, "request",
+                             side_effect=[self.response(503), self.response(404)]):
+            with self.assertRaises(http_client.ProviderError):
+                http_client.get("test", "https://example.com")
+            self.assertEqual(http_client.breaker_for("test").failures, 1)
+            self.assertEqual(http_client.get("test", "https://example.com").status_code, 404)
+            self.assertEqual(http_client.breaker_for("test").failures, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
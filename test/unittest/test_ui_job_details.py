@@ -0,0 +1,113 @@
+import datetime
+import sys
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+sys.path.insert(0, '/opt/arm')
+from arm.models.job import Job  # noqa E402
+from arm.models.job_metadata import JobMetadata  # noqa E402
+from arm.ui import db  # noqa E402
+from arm.ui import utils as ui_utils  # noqa E402
+
+
+class TestJobDetails(unittest.TestCase):
+
+    def setUp(self):
+        # An empty database in memory, the background fetch runs against it too
+        self.test_app = Flask("arm_test")
+        self.test_app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite://"
+        db.init_app(self.test_app)
+        self.context = self.test_app.app_context()
+        self.context.push()
+        db.create_all()
+        with patch.object(Job, "parse_udev"), patch.object(Job, "get_pid"):
+            self.job = Job("/dev/sr0")
+        self.job.title = "Serenity"
+        self.job.year = "2005"
+        db.session.add(self.job)
+        db.session.commit()
+        for patcher in (patch.object(ui_utils, "app", self.test_app),
+                        patch.object(ui_utils.threading, "Thread")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.thread = ui_utils.threading.Thread
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def fetch(self, **selector):
+        """Run the background fetch with metadata_selector patched"""
+        with patch.object(ui_utils, "metadata_selector", **selector):
+            ui_utils.fetch_job_details(self.job.job_id)
+        db.session.expire_all()
+        return self.job.details
+
+    """
+    ************************************************************
+    Test - fetch_job_details
+    test_fetch_job_details_pass - check for normal behaviour
+    test_fetch_job_details_failed - check a failed fetch for a new title
+    ************************************************************
+    """
+    def test_fetch_job_details_pass(self):
+        """
+        CHECK "fetch_job_details" saves the details under the job's key
+        """
+        details = self.fetch(return_value={'Plot': "Space western", 'Ratings': []})
+
+        self.assertEqual((details.status, details.plot), ("found", "Space western"))
+        self.assertEqual(details.lookup_key, ui_utils.job_details_key(self.job))
+
+    def test_fetch_job_details_failed(self):
+        """
+        CHECK "fetch_job_details" stores the new key as failed, dropping details of the old title
+        """
+        self.fetch(return_value={'Plot': "Space western", 'Ratings': []})
+        self.job.title = "Firefly"
+        db.session.commit()
+        details = self.fetch(side_effect=RuntimeError("TMDb is down"))
+
+        self.assertEqual((details.status, details.plot), ("failed", None))
+        self.assertEqual(details.lookup_key, ui_utils.job_details_key(self.job))
+
+    """
+    ************************************************************
+    Test - request_job_details
+    test_request_job_details_missing - check a fetch starts without details
+    test_request_job_details_failed - check a failed fetch waits DETAILS_RETRY
+    ************************************************************
+    """
+    def test_request_job_details_missing(self):
+        """
+        CHECK "request_job_details" starts a fetch when there are no details yet
+        """
+        self.assertIsNone(ui_utils.request_job_details(self.job))
+        self.thread.assert_called_once()
+        ui_utils._details_running.discard(self.job.job_id)
+
+    def test_request_job_details_failed(self):
+        """
+        CHECK "request_job_details" doesn't fetch again until DETAILS_RETRY after a failure
+        data check:
+            failed just now: not fetched, failed DETAILS_RETRY + 1 seconds ago: fetched
+        """
+        details = JobMetadata(self.job.job_id, ui_utils.job_details_key(self.job))
+        details.failed(ui_utils.job_details_key(self.job))
+        db.session.add(details)
+        db.session.commit()
+
+        self.assertIs(ui_utils.request_job_details(self.job), details)
+        self.thread.assert_not_called()
+
+        details.updated = datetime.datetime.now() - datetime.timedelta(seconds=ui_utils.DETAILS_RETRY + 1)
+        ui_utils.request_job_details(self.job)
+        self.thread.assert_called_once()
+        ui_utils._details_running.discard(self.job.job_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
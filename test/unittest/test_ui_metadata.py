@@ -0,0 +1,36 @@
+import sys
+import unittest
+
+sys.path.insert(0, '/opt/arm')
+from arm.ui import metadata  # noqa E402
+
+
+class TestMetadata(unittest.TestCase):
+
+    """
+    ************************************************************
+    Test - normalise_query
+    test_normalise_query_pass - check the same search gives the same key
+    test_normalise_query_long - check long queries don't share a key
+    ************************************************************
+    """
+    def test_normalise_query_pass(self):
+        """
+        CHECK "normalise_query" ignores the api key, case, spacing and parameter order
+        """
+        key = metadata.normalise_query("https://www.omdbapi.com/?s=Star%20Wars&r=json&apikey=one")
+        self.assertEqual(metadata.normalise_query("https://www.omdbapi.com/?r=json&s=star++WARS&apikey=two"), key)
+        self.assertNotEqual(metadata.normalise_query("https://www.omdbapi.com/?s=star+trek&r=json"), key)
+        self.assertEqual(len(key), 64)
+
+    def test_normalise_query_long(self):
+        """
+        CHECK "normalise_query" keeps queries apart that only differ after 512 characters
+        """
+        title = "a" * 600
+        self.assertNotEqual(metadata.normalise_query(f"https://api.themoviedb.org/3/search/movie?query={title}b"),
+                            metadata.normalise_query(f"https://api.themoviedb.org/3/search/movie?query={title}c"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import datetime
+import sys
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+sys.path.insert(0, '/opt/arm')
+import arm.config.config as cfg  # noqa E402
+from arm.models.notifications import Notifications  # noqa E402
+from arm.ui import db  # noqa E402
+from arm.ui.notifications import bulk, counter  # noqa E402
+
+
+class TestBulk(unittest.TestCase):
+
+    def setUp(self):
+        # An empty database in memory
+        test_app = Flask("arm_test")
+        test_app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite://"
+        db.init_app(test_app)
+        self.context = test_app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def notify(self, *ages):
+        """A notification triggered age days ago for each age, oldest first"""
+        for age in ages:
+            notification = Notifications(f"{age} days", "")
+            notification.trigger_time = datetime.datetime.now() - datetime.timedelta(days=age)
+            db.session.add(notification)
+        db.session.commit()
+
+    def titles(self):
+        db.session.expire_all()
+        return [notification.title for notification in Notifications.query.order_by(Notifications.id)]
+
+    """
+    ************************************************************
+    Test - delete_older_than
+    test_delete_older_than_pass - check for normal behaviour
+    test_delete_older_than_none - check nothing recent is deleted
+    ************************************************************
+    """
+    def test_delete_older_than_pass(self):
+        """
+        CHECK "delete_older_than" deletes the notifications past the age and says how many
+        """
+        self.notify(40, 31, 29, 1)
+        self.assertEqual(bulk.delete_older_than(30), 2)
+        self.assertEqual(self.titles(), ["29 days", "1 days"])
+
+    def test_delete_older_than_none(self):
+        """
+        CHECK "delete_older_than" leaves newer notifications alone
+        """
+        self.notify(5, 1)
+        self.assertEqual(bulk.delete_older_than(30), 0)
+        self.assertEqual(len(self.titles()), 2)
+
+    """
+    ************************************************************
+    Test - keep_newest
+    test_keep_newest_pass - check for normal behaviour
+    test_keep_newest_under - check nothing is deleted under the count
+    test_keep_newest_invalidate - check the cached count is thrown away
+    ************************************************************
+    """
+    def test_keep_newest_pass(self):
+        """
+        CHECK "keep_newest" deletes all but the newest count notifications
+        """
+        self.notify(5, 4, 3, 2, 1)
+        self.assertEqual(bulk.keep_newest(2), 3)
+        self.assertEqual(self.titles(), ["2 days", "1 days"])
+
+    def test_keep_newest_under(self):
+        """
+        CHECK "keep_newest" with fewer notifications than count deletes nothing
+        """
+        self.notify(2, 1)
+        self.assertEqual(bulk.keep_newest(2), 0)
+        self.assertEqual(bulk.keep_newest(5), 0)
+        self.assertEqual(len(self.titles()), 2)
+
+    def test_keep_newest_invalidate(self):
+        """
+        CHECK "keep_newest" makes the navbar count read the table again
+        """
+        self.notify(3, 2, 1)
+        with patch.object(counter, "_count", {'value': 3, 'read': 0}), \
+                patch.object(counter.time, "monotonic", return_value=1):
+            self.assertEqual(counter.uncleared_count(), 3)
+            bulk.keep_newest(1)
+            self.assertEqual(counter.uncleared_count(), 1)
+
+    """
+    ************************************************************
+    Test - apply_retention
+    test_apply_retention_pass - check for normal behaviour
+    test_apply_retention_off - check 0 turns each limit off
+    ************************************************************
+    """
+    def test_apply_retention_pass(self):
+        """
+        CHECK "apply_retention" deletes by age and then by count
+        """
+        self.notify(40, 4, 3, 2, 1)
+        with patch.dict(cfg.arm_config, {'NOTIFY_RETENTION_DAYS': 30, 'NOTIFY_MAX_COUNT': 3}):
+            self.assertEqual(bulk.apply_retention(), 2)
+        self.assertEqual(self.titles(), ["3 days", "2 days", "1 days"])
+
+    def test_apply_retention_off(self):
+        """
+        CHECK "apply_retention" with both limits 0 keeps everything
+        """
+        self.notify(400, 1)
+        with patch.dict(cfg.arm_config, {'NOTIFY_RETENTION_DAYS': 0, 'NOTIFY_MAX_COUNT': 0}):
+            self.assertEqual(bulk.apply_retention(), 0)
+        self.assertEqual(len(self.titles()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
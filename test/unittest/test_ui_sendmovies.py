@@ -0,0 +1,99 @@
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from flask import Flask
+
+sys.path.insert(0, '/opt/arm')
+from arm.models.job import Job  # noqa E402
+from arm.models.job_remote_sync import JobRemoteSync  # noqa E402
+from arm.ui import db  # noqa E402
+from arm.ui import utils as ui_utils  # noqa E402
+from arm.ui.sendmovies import sender  # noqa E402
+
+
+class TestSender(unittest.TestCase):
+
+    def setUp(self):
+        # An empty database in memory
+        test_app = Flask("arm_test")
+        test_app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite://"
+        db.init_app(test_app)
+        self.context = test_app.app_context()
+        self.context.push()
+        db.create_all()
+        self.jobs = []
+        for title in ("Alien", "Aliens", "Alien 3"):
+            with patch.object(Job, "parse_udev"), patch.object(Job, "get_pid"):
+                job = Job("/dev/sr0")
+            job.title = title
+            job.hasnicetitle = True
+            self.jobs.append(job)
+        db.session.add_all(self.jobs)
+        db.session.commit()
+        sender._progress = {'state': "running", 'total': 3, 'processed': 0, 'sent': 0, 'skipped': 0,
+                            'failed': 0, 'errors': []}
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def statuses(self):
+        db.session.expire_all()
+        return {sync.job_id: sync.status for sync in JobRemoteSync.query.all()}
+
+    """
+    ************************************************************
+    Test - send_page
+    test_send_page_pass - check for normal behaviour
+    test_send_page_skip - check jobs already sent unchanged aren't sent again
+    test_send_page_fail - check a page that can't be saved is rolled back
+    ************************************************************
+    """
+    def test_send_page_pass(self):
+        """
+        CHECK "send_page" records what the api accepted and what it didn't
+        """
+        replies = {"Alien": (True, None), "Aliens": (False, "Unexpected reply"), "Alien 3": (True, None)}
+        with patch.object(ui_utils, "remote_db_upload", side_effect=lambda params: replies[params['t']]):
+            sender.send_page(self.executor, self.jobs)
+
+        self.assertEqual(self.statuses(), {self.jobs[0].job_id: "success", self.jobs[1].job_id: "fail",
+                                           self.jobs[2].job_id: "success"})
+        progress = sender.get_progress()
+        self.assertEqual((progress['processed'], progress['sent'], progress['failed']), (3, 2, 1))
+        self.assertEqual(progress['errors'][0]['title'], "Aliens")
+
+    def test_send_page_skip(self):
+        """
+        CHECK "send_page" skips jobs the api accepted unless they've changed since
+        """
+        with patch.object(ui_utils, "remote_db_upload", return_value=(True, None)):
+            sender.send_page(self.executor, self.jobs)
+        self.jobs[0].year = "1979"
+        db.session.commit()
+        with patch.object(ui_utils, "remote_db_upload", return_value=(True, None)) as upload:
+            sender.send_page(self.executor, self.jobs)
+
+        self.assertEqual([call[0][0]['t'] for call in upload.call_args_list], ["Alien"])
+        self.assertEqual(sender.get_progress()['skipped'], 2)
+
+    def test_send_page_fail(self):
+        """
+        CHECK "send_page" rolls back the page and raises when the results can't be saved
+        """
+        with patch.object(ui_utils, "remote_db_upload", return_value=(True, None)), \
+                patch.object(db.session, "commit", side_effect=RuntimeError("database is locked")):
+            with self.assertRaises(RuntimeError):
+                sender.send_page(self.executor, self.jobs)
+
+        self.assertEqual(self.statuses(), {})
+        self.assertEqual(sender.get_progress()['processed'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()